@@ -1,65 +1,232 @@
 import os
-import random
+import sys
+import time
 import cv2
+import numpy as np
 from PIL import Image
-import matplotlib.pyplot as plt
+from concurrent.futures import ThreadPoolExecutor
+
+from tools.label_io import read_yolo_seg, write_yolo_seg
+from tools.seg_geometry import crop_labels
+
+"""
+训练图片批量预处理：居中裁剪为正方形后缩放到固定尺寸
+
+- 多线程并行（cv2 解码/缩放/编码时释放 GIL），WORKERS=0 使用全部 CPU 核心
+- JPEG 按目标尺寸使用降采样解码（cv2.IMREAD_REDUCED_COLOR_2/4/8，在 DCT 阶段直接缩小），
+  2000 万像素的手机照片缩到 416 时解码量减少到 1/16 ~ 1/64
+- 已经是目标尺寸的图片直接跳过（输入与输出为同一目录时可重复运行）；输出比输入新时也跳过
+- 无界面运行：不再弹出 matplotlib 窗口，需要预览时设置 PREVIEW_PATH 保存一张拼图
+- 写出时先写临时文件再替换，原地处理时中断也不会损坏原图
+- 设置 LABELS_DIR 后同时变换 YOLO-seg 标注（labels/<图片名>.txt）：多边形坐标按同一裁剪窗口重新归一化，
+  裁剪到窗口内，删除点数不足 3 或面积过小的多边形，因此已标注的数据集也可以先统一缩小再训练；
+  每个样本先把变换后的标注写到 `<标注>.txt.pending`，再写图片，最后把 pending 文件替换为标注（提交）；
+  中断在图片写出之后、提交之前时，下次运行发现图片已是目标尺寸且存在 pending 文件，会补上提交，
+  标注不会停留在未裁剪的状态；图片尚未写出时 pending 文件作废，样本整体重新处理。
+  图片输出到单独目录时标注也必须输出到单独目录（OUTPUT_LABELS_DIR），否则重复运行时无法判断原地改写的标注是否已经裁剪过
+"""
+INPUT_DIR = r"F:\zywXM\PyCharmPro\yolov8-seg\data\JPEGImages"    # 修改为原始数据集路径
+OUTPUT_DIR = r"F:\zywXM\PyCharmPro\yolov8-seg\data\JPEGImages"   # 修改为保存路径
+SIZE = (416, 416)    # 目标尺寸 (w, h)
+WORKERS = 0          # 并行线程数，0 使用全部 CPU 核心
+PREVIEW_PATH = None  # 例如 "resize_preview.jpg"，保存若干张结果的拼图；None 不保存
+LABELS_DIR = None         # 标注目录（YOLO-seg .txt），None 表示只处理图片
+OUTPUT_LABELS_DIR = None  # 变换后标注的保存目录，None 时与 LABELS_DIR 相同（原地改写，只允许在图片也原地处理时使用）
+
+IMG_EXTS = ('.jpg', '.png', '.jpeg')
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def probe_image(path):
+    """只读取文件头，返回 ((w, h), 格式)；失败返回 (None, None)"""
+    try:
+        with Image.open(path) as im:
+            return im.size, im.format
+    except Exception:
+        return None, None
+
+
+def decode_for_size(path, src_size, fmt, min_side_needed):
+    """解码图片；JPEG 在保证短边不小于 min_side_needed 的前提下使用最大的降采样倍数"""
+    flag = cv2.IMREAD_COLOR
+    if fmt == 'JPEG' and src_size:
+        short = min(src_size)
+        for factor, reduced in _REDUCED_FLAGS:
+            if short // factor >= min_side_needed:
+                flag = reduced
+                break
+    # np.fromfile + imdecode 兼容 Windows 中文路径
+    buf = np.fromfile(path, dtype=np.uint8)
+    return cv2.imdecode(buf, flag)
+
+
+def center_square(w, h):
+    """居中正方形裁剪窗口 (left, top, side, side)"""
+    min_side = min(h, w)
+    return (w - min_side) // 2, (h - min_side) // 2, min_side, min_side
+
+
+def center_crop_resize(img, size):
+    """居中裁剪为正方形并缩放到 size (w, h)"""
+    h, w = img.shape[:2]
+    left, top, min_side, _ = center_square(w, h)
+    crop_img = img[top: top + min_side, left: left + min_side]
+    return cv2.resize(crop_img, size, interpolation=cv2.INTER_AREA)
+
+
+def transform_label(label_src, image_wh):
+    """按与图片相同的居中裁剪变换标注（不写文件），返回 (变换后的标注, 多边形数, 删除数)；没有标注文件时返回 (None, 0, 0)"""
+    if not os.path.exists(label_src):
+        return None, 0, 0
+    labels = read_yolo_seg(label_src)
+    cropped, dropped = crop_labels(labels, image_wh, center_square(*image_wh))
+    return cropped, len(labels), dropped
+
+
+def write_image_atomic(path, img):
+    """编码后先写临时文件再替换（兼容中文路径，原地处理时中断不损坏原图）"""
+    ext = os.path.splitext(path)[1] or '.jpg'
+    ok, buf = cv2.imencode(ext, img)
+    if not ok:
+        raise OSError(f"编码失败: {path}")
+    tmp = f"{path}.tmp{os.getpid()}"
+    try:
+        buf.tofile(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def resize_one(src, dst, size, label_src=None, label_dst=None):
+    """处理单张图片（及其标注），返回 (状态, 多边形数, 删除的多边形数)，状态为 'done' / 'skip' / 'fail:<原因>'
+
+    已处理过的图片（原地处理时已是目标尺寸，或输出比输入新且标注已写到单独的输出目录）连同标注一起跳过，避免标注被重复裁剪。
+    标注按 pending 文件 -> 图片 -> 提交标注 的顺序写出：图片写出失败时标注保持原样；
+    图片已写出但标注未提交（中断）时，下次运行只补上提交。
+    """
+    pending = f"{label_dst}.pending" if label_dst else None
+    src_size, fmt = probe_image(src)
+    if src_size is None:
+        return "fail:读取失败", 0, 0
+    same_file = os.path.abspath(src) == os.path.abspath(dst)
+    if tuple(src_size) == tuple(size) and same_file:
+        if pending and os.path.exists(pending):
+            # 上次运行在写出图片之后、提交标注之前中断：pending 中就是按原图裁剪好的标注
+            os.replace(pending, label_dst)
+            return "done", 0, 0
+        return "skip", 0, 0
+    if not same_file and os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src):
+        dst_size, _ = probe_image(dst)
+        # 标注总是在图片之后写出：输出目录中存在标注即表示该样本已完整处理
+        label_done = label_src is None or not os.path.exists(label_src) or os.path.exists(label_dst)
+        if dst_size is not None and tuple(dst_size) == tuple(size) and label_done:
+            return "skip", 0, 0
+
+    img = decode_for_size(src, src_size, fmt, max(size))
+    if img is None:
+        return "fail:读取失败", 0, 0
+    cropped, polygons, dropped = None, 0, 0
+    if label_src is not None:
+        # 用解码后的尺寸计算裁剪窗口（与图片实际裁剪一致，降采样解码与 EXIF 旋转后也成立）
+        h, w = img.shape[:2]
+        cropped, polygons, dropped = transform_label(label_src, (w, h))
+    if cropped is not None:
+        write_yolo_seg(pending, cropped, atomic=True)
+    elif pending and os.path.exists(pending):
+        os.unlink(pending)
+    write_image_atomic(dst, center_crop_resize(img, size))
+    if cropped is not None:
+        os.replace(pending, label_dst)
+    return "done", polygons, dropped
+
+
+def save_preview(output_dir, names, preview_path, thumb=160):
+    """把若干张结果横向拼接保存为一张图片（代替 matplotlib 窗口）"""
+    tiles = []
+    for name in names:
+        img = cv2.imdecode(np.fromfile(os.path.join(output_dir, name), dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is not None:
+            tiles.append(cv2.resize(img, (thumb, thumb), interpolation=cv2.INTER_AREA))
+    if tiles:
+        write_image_atomic(preview_path, np.hstack(tiles))
+        print(f"🖼 预览已保存: {preview_path}")
+
 
 # 训练所需的图片尺寸要裁剪
-def resize_and_save(input_dir, output_dir, size=(416, 416), show_samples=5):
+def resize_and_save(input_dir, output_dir, size=(416, 416), workers=0, preview_path=None, show_samples=5,
+                    labels_dir=None, output_labels_dir=None):
     """
     将图像从中心裁剪/缩放到固定尺寸，并保存到新目录
     :param input_dir: 原始图片路径
-    :param output_dir: 保存路径
+    :param output_dir: 保存路径（可与 input_dir 相同，原地处理）
     :param size: 目标尺寸 (w, h)
-    :param show_samples: 随机显示的数量
+    :param workers: 并行线程数，0 使用全部 CPU 核心
+    :param preview_path: 预览拼图保存路径，None 不保存
+    :param show_samples: 预览拼图中的图片数量
+    :param labels_dir: YOLO-seg 标注目录，设置后标注随图片一起变换
+    :param output_labels_dir: 变换后标注的保存目录，None 时原地改写（要求 output_dir 与 input_dir 相同）
+    :return: 统计 dict：done / skip / fail / seconds / polygons / dropped
     """
+    if labels_dir:
+        output_labels_dir = output_labels_dir or labels_dir
+        if os.path.abspath(output_labels_dir) == os.path.abspath(labels_dir) and os.path.abspath(output_dir) != os.path.abspath(input_dir):
+            # 原图保留不变时无法从图片判断原地改写的标注是否已裁剪过，重复运行会把标注再裁剪一次
+            raise ValueError("图片输出到单独目录时，请同时设置 OUTPUT_LABELS_DIR（不能原地改写标注）")
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
+    if labels_dir:
+        os.makedirs(output_labels_dir, exist_ok=True)
 
-    images = [f for f in os.listdir(input_dir) if f.lower().endswith(('.jpg', '.png', '.jpeg'))]
-
-    for img_name in images:
-        img_path = os.path.join(input_dir, img_name)
-        img = cv2.imread(img_path)
-
-        if img is None:
-            print(f"⚠️ 读取失败: {img_name}")
-            continue
-
-        h, w = img.shape[:2]
-
-        # 居中裁剪为正方形
-        min_side = min(h, w)
-        top = (h - min_side) // 2
-        left = (w - min_side) // 2
-        crop_img = img[top: top + min_side, left: left + min_side]
+    images = sorted(f for f in os.listdir(input_dir) if f.lower().endswith(IMG_EXTS))
+    workers = workers if workers and workers > 0 else (os.cpu_count() or 1)
+    stats = {'done': 0, 'skip': 0, 'fail': 0, 'seconds': 0.0, 'polygons': 0, 'dropped': 0}
 
-        # 缩放到目标大小
-        resized = cv2.resize(crop_img, size, interpolation=cv2.INTER_AREA)
+    def _label_paths(name):
+        if not labels_dir:
+            return None, None
+        txt = os.path.splitext(name)[0] + '.txt'
+        return os.path.join(labels_dir, txt), os.path.join(output_labels_dir, txt)
 
-        save_path = os.path.join(output_dir, img_name)
-        cv2.imwrite(save_path, resized)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = [ex.submit(resize_one, os.path.join(input_dir, n), os.path.join(output_dir, n), tuple(size),
+                             *_label_paths(n))
+                   for n in images]
+        for i, (img_name, fut) in enumerate(zip(images, futures), 1):
+            try:
+                status, polygons, dropped = fut.result()
+            except Exception as e:
+                status, polygons, dropped = f"fail:{e}", 0, 0
+            stats['polygons'] += polygons
+            stats['dropped'] += dropped
+            if status.startswith("fail:"):
+                stats['fail'] += 1
+                print(f"⚠️ {status[5:]}: {img_name}")
+            else:
+                stats[status] += 1
+            if i % 200 == 0 or i == len(images):
+                print(f"\r  进度: {i}/{len(images)}", end='', flush=True)
+    stats['seconds'] = time.perf_counter() - start
+    if images:
+        print()
 
-    print(f"✅ 处理完成，共保存 {len(images)} 张到 {output_dir}")
+    print(f"✅ 处理完成，共 {len(images)} 张：缩放 {stats['done']}，跳过 {stats['skip']}，失败 {stats['fail']}，"
+          f"用时 {stats['seconds']:.2f}s（{stats['done'] / max(stats['seconds'], 1e-9):.1f} 张/秒，{workers} 线程）-> {output_dir}")
+    if labels_dir:
+        print(f"🏷 标注：变换 {stats['polygons']} 个多边形，删除裁剪后退化的 {stats['dropped']} 个 -> {output_labels_dir}")
 
-    # 随机显示部分结果
-    if len(images) > 0 and show_samples > 0:
-        sample_imgs = random.sample(images, min(show_samples, len(images)))
-        plt.figure(figsize=(12, 6))
-        for i, img_name in enumerate(sample_imgs):
-            img = Image.open(os.path.join(output_dir, img_name))
-            plt.subplot(1, len(sample_imgs), i+1)
-            plt.imshow(img)
-            plt.axis("off")
-            plt.title(img_name)
-        plt.show()
+    if preview_path and images and show_samples > 0:
+        save_preview(output_dir, images[:show_samples], preview_path)
+    return stats
 
 
 def main():
-    input_dir = "F:\zywXM\PyCharmPro\yolov8-seg\data\JPEGImages"   # 修改为原始数据集路径
-    output_dir = "F:\zywXM\PyCharmPro\yolov8-seg\data\JPEGImages"   # 修改为保存路径
+    input_dir = sys.argv[1] if len(sys.argv) > 1 else INPUT_DIR
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else OUTPUT_DIR
 
-    resize_and_save(input_dir, output_dir, size=(416, 416), show_samples=5)
+    resize_and_save(input_dir, output_dir, size=SIZE, workers=WORKERS, preview_path=PREVIEW_PATH,
+                    labels_dir=LABELS_DIR, output_labels_dir=OUTPUT_LABELS_DIR)
 
 
 if __name__ == "__main__":
@@ -1,8 +1,14 @@
 import os
+import sys
 import glob
 import shutil
 import datetime
 
+from concurrent.futures import ProcessPoolExecutor
+
+from tools.label_io import write_text, build_class_lut, remap_yolo_seg_text
+from tools.snapshot import SnapshotStore
+
 """
 使用ISAT标注时使用内部工具转化，打开转化后的text查看类别是否从0开始，若从1开始则需要执行该脚本
 如果没有使用ISAT则不需要执行该脚本
@@ -41,8 +47,19 @@ import datetime
 - 如果需要动态生成类别映射（例如：将所有用到的类别重新整理为0, 1, 2...），需要修改脚本逻辑。
 - 请确保在运行脚本前备份重要数据。
 
+备份方式（BACKUP_MODE）：
+- "snapshot": 只保存实际被改写的文件（按内容 sha1 去重的 blob + 每次运行一个清单），
+  保存在 labels_snapshots/ 中，可保留多次运行历史。恢复某次运行：
+      python 01_convert_class_ids.py --list-snapshots
+      python 01_convert_class_ids.py --restore <run_id>
+- "full": 每次运行前完整复制整个标签目录到 labels_backup/（旧方式）
+
 """
 DATASET_NAME = "tomato"  # 数据集名称
+# 并行进程数：1 为串行，0 使用全部 CPU 核心
+WORKERS = 0
+# 备份方式："snapshot"（只备份改动的文件，可恢复任意一次运行）或 "full"（完整复制标签目录）
+BACKUP_MODE = "snapshot"
 
 def main():
     """主函数"""
@@ -54,7 +71,15 @@ def main():
 
     # 配置路径
     labels_dir = rf"raw_data/{DATASET_NAME}/labels"
-    backup_dir = rf"raw_data/{DATASET_NAME}/labels_backup"
+    if BACKUP_MODE == "snapshot":
+        backup_dir = rf"raw_data/{DATASET_NAME}/labels_snapshots"
+    else:
+        backup_dir = rf"raw_data/{DATASET_NAME}/labels_backup"
+
+    # 快照管理命令：列出 / 恢复
+    if len(sys.argv) > 1 and sys.argv[1] in ("--list-snapshots", "--restore"):
+        manage_snapshots(rf"raw_data/{DATASET_NAME}/labels_snapshots", sys.argv[1:])
+        return
 
     print("分割标签类别ID转换脚本")
     print("=" * 80)
@@ -79,7 +104,9 @@ def main():
         converter = ClassIDConverter(
             labels_dir=labels_dir,
             backup_dir=backup_dir,
-            class_remapping=class_remapping
+            class_remapping=class_remapping,
+            workers=WORKERS,
+            backup_mode=BACKUP_MODE
         )
         proceed = converter.backup_and_filter_classification(classification_txt_path)
 
@@ -94,21 +121,104 @@ def main():
         print(f"运行失败: {e}")
         import traceback
         traceback.print_exc()
-        
-        
+
+
+def manage_snapshots(snapshot_dir, args):
+    """列出快照（--list-snapshots）或把某次运行改写过的文件恢复为原始内容（--restore <run_id>）"""
+    store = SnapshotStore(snapshot_dir)
+    if args[0] == "--list-snapshots":
+        runs = store.list_runs()
+        if not runs:
+            print(f"没有快照: {snapshot_dir}")
+        for run_id, created, n_files, note in runs:
+            print(f"  {run_id}  {created}  {n_files} 个文件  {note}")
+        return
+    if len(args) < 2:
+        print("用法: python 01_convert_class_ids.py --restore <run_id>")
+        return
+    try:
+        n = store.restore(args[1])
+        print(f"✓ 已从快照 {args[1]} 恢复 {n} 个文件")
+    except Exception as e:
+        print(f"✗ 恢复快照失败: {e}")
+
+
+def remap_label_file(task):
+    """
+    快速路径的单文件任务（模块级函数，便于进程池调用）
+
+    Args:
+        task: (file_path, lut, backup_dir, snapshot)
+            backup_dir 为 None 表示不做单文件复制备份；
+            snapshot 为 (SnapshotStore, run_id, labels_dir) 或 None，内容有变化的文件在改写前保存快照
+
+    Returns:
+        dict: ok / changed / annotations / converted / dropped / warnings
+    """
+    file_path, lut, backup_dir, snapshot = task
+    filename = os.path.basename(file_path)
+    result = {'ok': False, 'changed': False, 'annotations': 0, 'converted': 0, 'dropped': 0, 'warnings': []}
+    try:
+        if backup_dir:
+            try:
+                shutil.copy2(file_path, os.path.join(backup_dir, filename))
+            except Exception as e:
+                result['warnings'].append(f"备份文件 {filename} 失败: {e}")
+                return result
+
+        with open(file_path, 'rb') as f:
+            raw_bytes = f.read()
+        original = raw_bytes.decode('utf-8')
+        # 每行只替换类别字段；坐标无法解析的行原样保留坐标，类别无法解析的行删除并报告
+        text, annotations, converted, errors = remap_yolo_seg_text(original, lut)
+        for line_num, raw, e in errors:
+            result['warnings'].append(f"文件 {filename} 第{line_num}行: {raw} - {e}")
+
+        result['annotations'] = annotations
+        result['converted'] = converted
+        result['dropped'] = annotations - converted
+
+        # 内容没有变化的文件不改写，也不需要快照
+        if text != original.replace('\r\n', '\n'):
+            if snapshot is not None:
+                store, run_id, root = snapshot
+                try:
+                    store.save_bytes(run_id, os.path.relpath(file_path, root), raw_bytes)
+                except Exception as e:
+                    result['warnings'].append(f"快照文件 {filename} 失败: {e}")
+                    return result
+            # 先写临时文件再替换，中断时不会留下只写了一半的标注
+            write_text(file_path, text, atomic=True)
+            result['changed'] = True
+
+        result['ok'] = True
+    except Exception as e:
+        result['warnings'].append(f"转换文件 {filename} 失败: {e}")
+    return result
+
+
 class ClassIDConverter:
-    def __init__(self, labels_dir, backup_dir=None, class_remapping:dict=None):
+    def __init__(self, labels_dir, backup_dir=None, class_remapping:dict=None, workers=1, fast=True, backup_mode="full"):
         """
         初始化转换器
 
         Args:
             labels_dir: 分割标签文件夹路径
-            backup_dir: 备份文件夹路径（可选）
+            backup_dir: 备份文件夹路径（可选）；backup_mode="snapshot" 时为快照目录
+            workers: 快速路径的并行进程数（1 为串行，0/None 使用全部 CPU 核心）
+            fast: True 使用查找表 + 进程池 + 原子写入的快速路径，只输出汇总信息；
+                  False 使用逐文件处理并逐文件打印的旧路径
+            backup_mode: "full" 完整复制标签目录；"snapshot" 只保存被改写文件的原始内容（见 tools/snapshot.py）
         """
         self.labels_dir = labels_dir
         self.backup_dir = backup_dir
         self.class_remapping = class_remapping
         self.full_backup_done = False
+        self.workers = (os.cpu_count() or 1) if not workers or workers <= 0 else workers
+        self.fast = fast
+        self.backup_mode = backup_mode
+        self.snapshot = None
+        self.run_id = None
         
         # 转换统计
         self.stats = {
@@ -117,7 +227,8 @@ class ClassIDConverter:
             'skipped_files': 0,
             'total_annotations': 0,
             'converted_annotations': 0,
-            'dropped_annotations': 0
+            'dropped_annotations': 0,
+            'changed_files': 0
         }
         
     def backup_and_filter_classification(self, classification_txt_path):
@@ -197,7 +308,18 @@ class ClassIDConverter:
                 print(f"{red}类别名称修改未确认，程序结束。{reset}")
                 return False
 
-            if self.backup_dir:
+            if self.backup_dir and self.backup_mode == "snapshot":
+                try:
+                    self.snapshot = SnapshotStore(self.backup_dir)
+                    self.run_id = self.snapshot.begin(self.labels_dir, note=f"class_remapping={self.class_remapping}")
+                    # classification.txt 也会被改写，先保存快照
+                    self.snapshot.save_file(self.run_id, classification_txt_path, self.labels_dir)
+                    self.full_backup_done = True
+                    print(f"已创建快照 {self.run_id}（只保存被改写的文件）: {self.backup_dir}")
+                except Exception as e:
+                    print(f"创建快照失败: {e}")
+                    return False
+            elif self.backup_dir:
                 try:
                     if os.path.exists(self.backup_dir):
                         red = "\033[31m"
@@ -259,7 +381,7 @@ class ClassIDConverter:
 
     def create_backup(self):
         """创建备份文件夹"""
-        if not self.backup_dir:
+        if not self.backup_dir or self.snapshot is not None:
             return True
 
         try:
@@ -272,6 +394,14 @@ class ClassIDConverter:
 
     def backup_file(self, file_path):
         """备份单个文件"""
+        if self.snapshot is not None:
+            try:
+                self.snapshot.save_file(self.run_id, file_path, self.labels_dir)
+                return True
+            except Exception as e:
+                print(f"    警告: 快照文件 {os.path.basename(file_path)} 失败: {e}")
+                return False
+
         # 如果已经做过整个目录的备份（full_backup_done），则不要再往 backup_dir 写入文件，避免修改备份
         if self.backup_dir and self.full_backup_done:
             return True
@@ -306,49 +436,18 @@ class ClassIDConverter:
                 print(f"  ✗ 备份失败，跳过文件: {filename}")
                 return False
 
-            # 读取原文件内容
+            # 读取原文件内容（有问题的行给出警告）
             with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+                original = f.read()
 
             # 转换类别ID并同时删除不在映射表中的类别（合并过滤与转换）
-            converted_lines = []
-            file_annotations = 0
-            file_conversions = 0
-            file_drops = 0
-
-            for line_num, line in enumerate(lines, 1):
-                raw = line.rstrip('\n')
-                line = raw.strip()
-                if not line:
-                    # 保持空行
-                    continue
-
-                try:
-                    parts = line.split()
-                    if len(parts) >= 1:
-                        old_class_id = int(parts[0])
-                        file_annotations += 1
-
-                        if old_class_id in self.class_remapping:
-                            # 转换并保留
-                            new_class_id = self.class_remapping[old_class_id]
-                            parts[0] = str(new_class_id)
-                            new_line = ' '.join(parts) + '\n'
-                            converted_lines.append(new_line)
-                            file_conversions += 1
-                        else:
-                            # 不在映射中的类别 -> 删除（不写入）
-                            file_drops += 1
-                    else:
-                        # 格式错误，视为无效并跳过
-                        continue
-                except ValueError as e:
-                    print(f"    警告: 文件 {filename} 第{line_num}行解析失败: {raw} - {e}")
-                    continue
+            text, file_annotations, file_conversions, errors = remap_yolo_seg_text(original, build_class_lut(self.class_remapping))
+            for line_num, raw, e in errors:
+                print(f"    警告: 文件 {filename} 第{line_num}行: {raw} - {e}")
+            file_drops = file_annotations - file_conversions
 
-            # 写回文件（只写已转换且保留的标注）
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.writelines(converted_lines)
+            # 写回文件（只写已转换且保留的标注；先写临时文件再替换）
+            write_text(file_path, text, atomic=True)
 
             # 更新统计
             self.stats['total_annotations'] += file_annotations
@@ -404,6 +503,11 @@ class ClassIDConverter:
         print("开始转换...")
         print("-" * 60)
 
+        if self.fast:
+            self.run_fast_conversion(txt_files)
+            self.show_statistics()
+            return
+
         # 转换每个文件
         for i, txt_file in enumerate(txt_files, 1):
             print(f"[{i}/{self.stats['total_files']}] 处理: {os.path.basename(txt_file)}", end='')
@@ -415,6 +519,50 @@ class ClassIDConverter:
         # 显示统计结果
         self.show_statistics()
 
+    def run_fast_conversion(self, txt_files, max_warnings=20):
+        """
+        快速路径：查找表重映射 + 进程池 + 原子写入。
+
+        不再逐文件打印，只显示进度与汇总；解析/备份警告最多显示 `max_warnings` 条。
+        """
+        lut = build_class_lut(self.class_remapping)
+        backup_dir = self.backup_dir if (self.backup_dir and not self.full_backup_done) else None
+        snapshot = (self.snapshot, self.run_id, self.labels_dir) if self.snapshot is not None else None
+        tasks = [(p, lut, backup_dir, snapshot) for p in txt_files]
+        total = len(tasks)
+        step = max(1, total // 20)
+        warnings = []
+
+        if self.workers > 1 and total > 1:
+            executor = ProcessPoolExecutor(max_workers=self.workers)
+            results = executor.map(remap_label_file, tasks, chunksize=max(1, min(256, total // (self.workers * 4) or 1)))
+        else:
+            executor = None
+            results = map(remap_label_file, tasks)
+
+        try:
+            for i, res in enumerate(results, 1):
+                if res['ok']:
+                    self.stats['processed_files'] += 1
+                else:
+                    self.stats['skipped_files'] += 1
+                self.stats['total_annotations'] += res['annotations']
+                self.stats['converted_annotations'] += res['converted']
+                self.stats['dropped_annotations'] += res['dropped']
+                self.stats['changed_files'] += res['changed']
+                warnings.extend(res['warnings'])
+                if i % step == 0 or i == total:
+                    print(f"\r  进度: {i}/{total}", end='', flush=True)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        print()
+
+        if warnings:
+            print(f"警告 {len(warnings)} 条（最多显示 {max_warnings} 条）:")
+            for w in warnings[:max_warnings]:
+                print(f"    警告: {w}")
+
     def show_statistics(self):
         """显示转换统计结果"""
         print("=" * 80)
@@ -428,12 +576,17 @@ class ClassIDConverter:
         print(f"  总标注数: {self.stats['total_annotations']:,}")
         print(f"  转换标注: {self.stats['converted_annotations']:,}")
         print(f"  删除标注: {self.stats['dropped_annotations']:,}")
+        if self.fast:
+            print(f"  改写文件: {self.stats['changed_files']}")
 
         if self.stats['total_annotations'] > 0:
             conversion_rate = self.stats['converted_annotations'] / self.stats['total_annotations'] * 100
             print(f"  转换比例: {conversion_rate:.2f}%")
 
-        if self.backup_dir:
+        if self.snapshot is not None:
+            print(f"\n快照: {self.run_id}（{self.backup_dir}）")
+            print(f"如需恢复，请运行: python 01_convert_class_ids.py --restore {self.run_id}")
+        elif self.backup_dir:
             print(f"\n备份目录: {self.backup_dir}")
             print("如需恢复，请将备份文件复制回原目录")
 
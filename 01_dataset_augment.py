@@ -17,6 +17,14 @@ TOOLS = {
     - radius: 高斯模糊半径（数值，越大越模糊）
     - suffix: 输出文件名后缀（例如 '_blur'，会生成 IMG_0001_blur.jpg）
     - replace_imagedata: 如果原 JSON 中包含 `imageData`（base64），是否用增强后的图片的 base64 替换（True/False）
+    - imagedata_mode: imageData 的写出方式：'encode'（默认，再编码一次图片）、'reuse'（直接读取刚写出的图片文件，
+      内容相同、省去第二次编码）、'strip'（imageData 置为 null，JSON 紧凑写出，Labelme 按 imagePath 读取图片）；
+      各模式的耗时与 JSON 大小可运行 `python -m tools.dataset_augment` 查看
+    - workers: 并行进程数（1 为串行；0 或 None 使用全部 CPU 核心）。相同 sample_seed 下输出与串行完全一致
+    - backend: 模糊实现（见 tools/blur_kernel.py）：'pil'（默认，参考实现）、'opencv'（可分离高斯）、
+      'box3'（3 次盒式滤波，耗时与半径无关）、'downsample'（缩小→模糊→放大，适合大半径）、
+      'auto'（radius ≥ downsample_min_radius 时 downsample，否则 box3；不会选 opencv，它在大半径时比 PIL 还慢）；
+      实测的耗时与相对 PIL 的最大差（auto 在 radius ≤ 10 时 ≤ 4，radius = 20 时 ≤ 10）见 tools/blur_kernel.py 文件头
 - color_jitter:
     - enabled: 是否启用该增强工具（True/False）
     - variants: 一个变体列表，每个变体为字典，描述要生成的具体色彩变换；示例字段：
@@ -25,29 +33,79 @@ TOOLS = {
         - contrast: 对比度乘数（1.0 不变）
         - saturation: 饱和度乘数（1.0 不变）
         - hue: 色相偏移，单位为度，取值范围约为 -180..180（0 不变）
-    - replace_imagedata: 同上，是否替换 JSON 中的 imageData（True/False）
+    - replace_imagedata / imagedata_mode: 同上
+    - workers: 同上，并行进程数
+    - backend: 'pil'（逐个 ImageEnhance，默认）或 'fused'（tools/color_kernel.py：查找表 + 分块，一次完成四种调整，
+      4000x3000 图片实测峰值内存增量约 2 份 RGB 整图，'pil' 为 3.6~6.7 份）；两者输出逐像素相同，速度相当
+      （见 color_kernel 的实测表），fused 只省峰值内存
+- flip / rot90 / scale_crop / mosaic（几何增强，见 tools/geo_augment.py）：
+    - 图片与标注做同一个仿射变换：YOLO-seg `.txt` 多边形与 ISAT / Labelme JSON 形状一起变换并裁剪到图片范围内，
+      移出图片或裁剪后面积小于 min_area（归一化面积，默认 1e-6）的形状被删除
+    - 通用字段：enabled / suffix / sample_ratio / sample_count / sample_seed / replace_imagedata / imagedata_mode / workers / fill（填充灰度值）
+    - flip.modes: 'h'（水平）/ 'v'（垂直）/ 'hv' 的列表，每个样本随机取一种
+    - rot90.angles: 逆时针角度列表（90 / 180 / 270），每个样本随机取一个
+    - scale_crop.scale: [最小, 最大] 缩放倍数，缩放后随机平移裁剪回原尺寸
+    - mosaic.center: [最小, 最大] 拼接中心（相对宽高）；另外 3 张图在原始 labels 中随机抽取
+    - 输出文件名为 `<suffix 去掉下划线>_<参数>_<原文件名>`，例如 flip_h_IMG_0001.jpg
+
+
+COPY_MODE: 复制原始图片到新数据集时的方式（copy / hardlink / reflink / symlink）
+- 链接失败（例如跨文件系统）时自动回退为 copy；labels 始终复制，增强结果始终写成新文件
+COPY_WORKERS: 并发复制/链接线程数
+
+PIPELINE_MODE: 增强执行方式
+- 'fused'（默认）：融合流水线，每个被抽中的样本只读取一次 JSON、解码一次图片，再依次执行所有启用的工具；
+  各工具仍按自己的 sample_ratio/sample_count/sample_seed 在原始标注中独立抽样
+- 'sequential'：逐个工具各自完整遍历一次数据集（旧行为；后执行的工具会在前一个工具的输出中继续抽样）
+
+INCREMENTAL: 增量模式（需 PIPELINE_MODE='fused'）
+- True 时固定输出到 `<DATASET_NAME>_augment`（不再新建 _1/_2...），并在其中维护 `.augment_cache.jsonl` 缓存
+- 缓存键包含源图片哈希、标注哈希与工具参数（radius / variant / sample_seed 等），再次运行只处理新增或变化的样本，
+  不再被抽中/源文件已删除的旧增强结果会被清理；结束时打印 hits/misses
+- 增量模式下抽样与变体选择按 (sample_seed, 文件名) 哈希决定，新增图片不会改变已有图片的抽样结果
+
+OUTPUT_MODE: 增强结果的输出方式
+- 'files'（默认）：复制原始数据集并把每个增强结果写成新的图片 + JSON + TXT（见上）
+- 'virtual'：不写增强图片，只在 DATASET_ROOT 下生成 `<DATASET_NAME>.augment_manifest.json`（确定性的增强配方：
+  源文件名、工具、参数，抽样规则与 INCREMENTAL 相同）；训练端用 tools/virtual_augment.py 的
+  `VirtualAugmentDataset.load(路径)` 在读取时生成增强样本，需要落盘时再调用其 `export(...)`
 
 
 运行：编辑顶部配置后直接运行 `python3 数据集增强.py`（在 dataset 根目录）
 """
 import sys
-import shutil
 from pathlib import Path
 
-from tools.dataset_augment import BlurAugment, ColorJitterAugment
+from tools.dataset_augment import BlurAugment, ColorJitterAugment, FusedAugmentPipeline
+from tools.geo_augment import GEOMETRIC_TOOLS
+from tools.virtual_augment import build_manifest, save_manifest
+from tools.materialize import materialize_tree, merge_stats, print_summary
+from tools.aug_cache import AugmentCache
 
 # -------------------- 在这里编辑要使用的工具与参数 --------------------
 DATASET_ROOT = 'raw_datasets'
 DATASET_NAME = 'tomato'
+# 'fused' 或 'sequential'，见文件顶部说明
+PIPELINE_MODE = 'fused'
+# 'copy' / 'hardlink' / 'reflink' / 'symlink'，见文件顶部说明
+COPY_MODE = 'hardlink'
+COPY_WORKERS = 8
+# 增量模式，见文件顶部说明
+INCREMENTAL = False
+# 'files' 或 'virtual'，见文件顶部说明
+OUTPUT_MODE = 'files'
 
 
 TOOLS = {
     'blur': {
         'enabled': True,
         'radius': 10,
+        'backend': 'auto',
         # 按比例随机抽取要增强的样本（0.0-1.0），例如 0.2 表示抽取 20% 的图片
         'sample_ratio': 0.2,
         'replace_imagedata': True,
+        # 并行进程数：1 为串行，0 使用全部 CPU 核心
+        'workers': 0,
     },
     'color_jitter': {
         'enabled': True,
@@ -60,7 +118,34 @@ TOOLS = {
         # 每个工具单独随机抽样，保证不同工具使用不同随机子集
         'sample_ratio': 0.2,
         'replace_imagedata': True,
-    }
+        'workers': 0,
+        'backend': 'pil',
+    },
+    # 几何增强（默认关闭）：标注随图片一起变换
+    'flip': {
+        'enabled': False,
+        'modes': ['h'],
+        'sample_ratio': 0.2,
+        'workers': 0,
+    },
+    'rot90': {
+        'enabled': False,
+        'angles': [90, 180, 270],
+        'sample_ratio': 0.2,
+        'workers': 0,
+    },
+    'scale_crop': {
+        'enabled': False,
+        'scale': [0.75, 1.25],
+        'sample_ratio': 0.2,
+        'workers': 0,
+    },
+    'mosaic': {
+        'enabled': False,
+        'center': [0.3, 0.7],
+        'sample_ratio': 0.1,
+        'workers': 0,
+    },
 }
 # -------------------------------------------------------------------
 
@@ -91,6 +176,13 @@ def main():
     if not check_dataset(root, DATASET_NAME):
         sys.exit(1)
 
+    if OUTPUT_MODE == 'virtual':
+        manifest = build_manifest(DATASET_ROOT, DATASET_NAME, TOOLS)
+        manifest_path = root / f'{DATASET_NAME}.augment_manifest.json'
+        save_manifest(manifest, manifest_path)
+        print(f'Wrote augmentation manifest: {manifest_path} (recipes={len(manifest["recipes"])}, tools={list(manifest["tools"])})')
+        return
+
     # create augmented dataset folder (copy originals there)
     def make_unique_ds_name(base: Path, name: str) -> str:
         candidate = f"{name}_augment"
@@ -100,50 +192,73 @@ def main():
             i += 1
         return candidate
 
-    new_ds_name = make_unique_ds_name(root, DATASET_NAME)
+    incremental = INCREMENTAL and PIPELINE_MODE == 'fused'
+    if INCREMENTAL and not incremental:
+        error("INCREMENTAL requires PIPELINE_MODE = 'fused'; running a full augmentation instead")
+    new_ds_name = f'{DATASET_NAME}_augment' if incremental else make_unique_ds_name(root, DATASET_NAME)
     new_ds_path = root / new_ds_name
     # copy original dataset directories (`img` and `label`) into new dataset
     orig_ds = root / DATASET_NAME
     try:
-        new_ds_path.mkdir(parents=True, exist_ok=False)
+        new_ds_path.mkdir(parents=True, exist_ok=incremental)
     except FileExistsError:
         # unlikely due to make_unique_ds_name, but handle defensively
         pass
-    # copy img and label
+    # copy img and label (images may be linked, labels are always copied)
+    all_stats = []
     for sub in ('images', 'labels'):
         src = orig_ds / sub
         dst = new_ds_path / sub
         if src.exists():
-            try:
-                shutil.copytree(src, dst)
-            except FileExistsError:
-                # merge by copying files individually
-                for p in src.iterdir():
-                    if p.is_file():
-                        shutil.copy2(p, dst / p.name)
-            except Exception as e:
-                print(f'Failed to copy {src} -> {dst}: {e}', file=sys.stderr)
+            mode = COPY_MODE if sub == 'images' else 'copy'
+            stats = materialize_tree(src, dst, mode=mode, workers=COPY_WORKERS, verbose=False, skip_unchanged=incremental)
+            for err in stats['errors']:
+                print(f'Failed to copy {err}', file=sys.stderr)
+            all_stats.append(stats)
         else:
             # create empty dirs if missing
             dst.mkdir(parents=True, exist_ok=True)
+    print_summary(merge_stats(*all_stats), COPY_MODE, 'copy dataset')
 
     print(f'Created augmented dataset: {new_ds_path}')
 
     # run selected tools
-    if TOOLS.get('blur', {}).get('enabled'):
-        cfg = TOOLS['blur']
-        # pass the whole cfg so augmenter can pick needed keys
-        aug = BlurAugment(cfg)
-        # run on the copied dataset so originals are preserved; write into same dataset
-        print(f'Running blur on dataset {new_ds_name} -> radius={cfg.get("radius")}')
-        aug.run(dataset_root=DATASET_ROOT, dataset_name=new_ds_name, out_dir=new_ds_name)
-
-    if TOOLS.get('color_jitter', {}).get('enabled'):
-        cfg = TOOLS['color_jitter']
-        # pass the whole cfg so augmenter can pick needed keys
-        aug = ColorJitterAugment(cfg)
-        print(f'Running color_jitter on dataset {new_ds_name} -> variants={len(cfg.get("variants", []))}')
-        aug.run(dataset_root=DATASET_ROOT, dataset_name=new_ds_name, out_dir=new_ds_name)
+    if PIPELINE_MODE == 'fused':
+        augs = []
+        if TOOLS.get('blur', {}).get('enabled'):
+            augs.append(BlurAugment(TOOLS['blur']))
+        if TOOLS.get('color_jitter', {}).get('enabled'):
+            augs.append(ColorJitterAugment(TOOLS['color_jitter']))
+        for name, cls in GEOMETRIC_TOOLS.items():
+            if TOOLS.get(name, {}).get('enabled'):
+                augs.append(cls(TOOLS[name]))
+        if augs:
+            workers = max(aug.workers for aug in augs)
+            print(f'Running fused pipeline on dataset {new_ds_name} -> tools={[a.name for a in augs]} workers={workers}')
+            cache = AugmentCache(new_ds_path) if incremental else None
+            # read from the original dataset so outputs of earlier runs are never sampled again
+            FusedAugmentPipeline(augs, workers=workers, cache=cache).run(dataset_root=DATASET_ROOT, dataset_name=DATASET_NAME, out_dir=new_ds_name)
+    else:
+        if TOOLS.get('blur', {}).get('enabled'):
+            cfg = TOOLS['blur']
+            # pass the whole cfg so augmenter can pick needed keys
+            aug = BlurAugment(cfg)
+            # run on the copied dataset so originals are preserved; write into same dataset
+            print(f'Running blur on dataset {new_ds_name} -> radius={cfg.get("radius")}')
+            aug.run(dataset_root=DATASET_ROOT, dataset_name=new_ds_name, out_dir=new_ds_name)
+
+        if TOOLS.get('color_jitter', {}).get('enabled'):
+            cfg = TOOLS['color_jitter']
+            # pass the whole cfg so augmenter can pick needed keys
+            aug = ColorJitterAugment(cfg)
+            print(f'Running color_jitter on dataset {new_ds_name} -> variants={len(cfg.get("variants", []))}')
+            aug.run(dataset_root=DATASET_ROOT, dataset_name=new_ds_name, out_dir=new_ds_name)
+
+        for name, cls in GEOMETRIC_TOOLS.items():
+            if TOOLS.get(name, {}).get('enabled'):
+                aug = cls(TOOLS[name])
+                print(f'Running {name} on dataset {new_ds_name}')
+                aug.run(dataset_root=DATASET_ROOT, dataset_name=new_ds_name, out_dir=new_ds_name)
 
     print('All selected augmentations finished.')
 
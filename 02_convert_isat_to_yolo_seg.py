@@ -1,10 +1,19 @@
 import os
 import json
 import glob
-import shutil
 import random
 import os.path as osp
 
+import numpy as np
+
+from tools.image_index import find_image_file
+from tools.materialize import materialize_files, merge_stats, print_summary
+from tools.resize_cache import ResizeCache
+from tools.shards import write_shards, SHARD_SIZE_MB
+from tools.split_planner import (read_class_histograms, stratified_split, hash_split, sequential_split, group_histogram,
+                                 group_sizes, split_report, print_split_report)
+from tools.near_dup import NearDupIndex, cluster_summary
+
 """
 数据集划分与 YOLO 数据集描述文件生成脚本
 
@@ -13,7 +22,17 @@ import os.path as osp
 - 按图片列表随机划分数据集（支持两种模式）：
   - 2-way（train/val = 8:2），当用户输入 `n` 时启用；
   - 3-way（train/test/val = 7:2:1），当用户输入 `y` 或直接回车（默认）时启用；
+- 可选（`split_strategy = "stratified"`）：按类别与实例数分层划分，使稀有类别在各子集中都有样本，
+  并打印各子集相对全局分布的偏离（见 tools/split_planner.py）；
+- 可选（`split_strategy = "hash"`）：按文件名的加盐哈希分配子集，新增/删除图片不影响其余图片的归属；
+- 增量划分（`incremental_split`）：已存在且未变化的目标文件直接跳过，不再属于该子集的文件被删除，
+  数据集增长后重新划分的耗时只与变化量成正比；
+- 可选（`dedup_distance`）：计算感知哈希，把近重复图片（如相邻视频帧）聚成簇，同一簇总是分到同一子集，
+  避免 train/val 之间的数据泄漏（见 tools/near_dup.py）；
 - 将划分结果复制到 `dataset_output` 下的 `images/{train,val,test}` 和 `labels/{train,val,test}` 子目录；
+- 可选（`resize_imgsz`）：划分前把图片按训练尺寸预先缩放到 `dataset_output/images_<imgsz>/` 缓存中，划分结果从缓存物化；
+- 可选（`shard_export`）：把每个划分的图片与标注打包为少量 tar 分片并写出偏移索引（`dataset_output/shards/`），
+  供 NFS/对象存储等环境读取或解包到本地（见 tools/shards.py）；
 - 根据 `classification_txt_path` 中的类别顺序生成 `dataset.yaml`，包含 `path`、`train`、`val`、可选 `test`、`nc`、`names` 字段，供 YOLO 训练使用。
 
 主要配置（位于文件顶部，需根据项目调整）:
@@ -70,6 +89,36 @@ with open(classification_txt_path, 'r', encoding='utf-8') as f:
 images_dir = osp.join(raw_data, "images")
 # 标注文件夹（包含 .json/.txt，例如 'labels'）
 labels_dir = osp.join(raw_data, "labels")
+# 划分结果的落盘方式：copy / hardlink / reflink / symlink（链接失败时自动回退为 copy）
+# 仅作用于图片；标注 .txt 始终复制，避免之后原地修改标注时影响原始数据
+materialize_mode = "hardlink"
+# 并发复制/链接的线程数
+copy_workers = 8
+# 划分方式：
+# - "copy"：把图片/标注复制（或链接）到 datasets/<name>/images|labels/{train,val,test}
+# - "manifest"：只写出 datasets/<name>/{train,val,test}.txt 图片路径清单，YAML 指向清单，不复制任何文件；
+#   Ultralytics 会按 .../images/xxx.jpg -> .../labels/xxx.txt 的规则在原始数据集中找到标注
+split_mode = "copy"
+# 训练尺寸图片缓存（仅 copy 模式）：例如 416 时把图片长边预先缩放到 416，保存在 datasets/<name>/images_416/，
+# images/{train,val,test} 从缓存物化；与训练的 imgsz 保持一致，训练时不再解码、缩放原始分辨率的照片。
+# 缓存按图片内容哈希复用，源图片变化后自动重新生成；None 表示使用原图
+resize_imgsz = None
+# 分片导出：划分后把每个子集打包为约 shard_size_mb 大小的 tar 分片 + 偏移索引，写入 datasets/<name>/shards/
+shard_export = False
+shard_size_mb = SHARD_SIZE_MB
+# 划分策略：
+# - "random"：随机打乱后按图片数量切分
+# - "stratified"：读取全部标注，按类别与实例数迭代分层，各子集的类别分布尽量与全局一致
+# - "hash"：按 split_salt + 文件名（不含后缀）的哈希分桶，结果与图片顺序、随机种子和其他图片无关，
+#   新增图片不会打乱已有划分，不同版本数据集的 val 指标可以直接比较；更换 split_salt 得到另一组划分
+split_strategy = "random"
+split_salt = ""
+# 增量划分（仅 copy 模式）：目标文件已存在且未变化时跳过，删除子集目录中不再属于该子集的图片/标注
+incremental_split = True
+# 近重复分组：感知哈希（dhash / phash）汉明距离不超过 dedup_distance 的图片（及其传递闭包）分到同一子集；
+# None 表示不分组。哈希缓存在 datasets/<name>/.near_dup_<method>.json，未变化的图片不重复解码
+dedup_distance = None
+dedup_method = "dhash"
 
 random.seed(42)
 
@@ -77,7 +126,11 @@ random.seed(42)
 # 主流程
 # =====================
 def main():
-    yolo_seg_splitter = YoloDatasetSplitter(dataset_name, images_dir, labels_dir, dataset_output, class_list)
+    yolo_seg_splitter = YoloDatasetSplitter(dataset_name, images_dir, labels_dir, dataset_output, class_list,
+                                            materialize_mode=materialize_mode, copy_workers=copy_workers, split_mode=split_mode,
+                                            resize_imgsz=resize_imgsz, shard_export=shard_export, shard_size_mb=shard_size_mb,
+                                            split_strategy=split_strategy, split_salt=split_salt, incremental_split=incremental_split,
+                                            dedup_distance=dedup_distance, dedup_method=dedup_method)
     # -----------------------
     # 步骤 1：检查 TXT 是否完整
     # -----------------------
@@ -96,7 +149,9 @@ def main():
 
 
 class YoloDatasetSplitter:
-    def __init__(self, dataset_name, images_dir, labels_dir, dataset_output, class_list):
+    def __init__(self, dataset_name, images_dir, labels_dir, dataset_output, class_list, materialize_mode="copy", copy_workers=8, split_mode="copy",
+                 resize_imgsz=None, shard_export=False, shard_size_mb=SHARD_SIZE_MB, split_strategy="random",
+                 split_salt="", incremental_split=True, dedup_distance=None, dedup_method="dhash"):
         self.dataset_name = dataset_name
         self.images_dir = images_dir
         self.labels_dir = labels_dir
@@ -106,12 +161,31 @@ class YoloDatasetSplitter:
         self.image_files = []
         
         self.is_testDataset_required = False
-        
+        self.materialize_mode = materialize_mode
+        self.copy_workers = copy_workers
+        self.copy_stats = []
+        self.split_mode = split_mode
+        self.resize_imgsz = resize_imgsz
+        # 源图片绝对路径 -> 缩放缓存中的图片（未启用缓存时为空）
+        self.resized_images = {}
+        self.shard_export = shard_export
+        self.shard_size_mb = shard_size_mb
+        self.split_strategy = split_strategy
+        self.split_salt = split_salt
+        self.incremental_split = incremental_split
+        self.dedup_distance = dedup_distance
+        self.dedup_method = dedup_method
+
         for pic_format in self.pic_formats:
             self.image_files = self.image_files + glob.glob(osp.join(self.images_dir, f"*{pic_format}"))
 
     def make_yolo_dirs(self):
         """创建 YOLO 所需目录"""
+        if self.split_mode == "manifest":
+            # 清单模式只需要输出目录本身
+            os.makedirs(self.dataset_output, exist_ok=True)
+            print("✅ 目录检查完成")
+            return
         dirs = ["images/train", "images/val", "labels/train", "labels/val"]
         if self.is_testDataset_required:
             dirs.extend(["images/test", "labels/test"])
@@ -125,39 +199,148 @@ class YoloDatasetSplitter:
     def find_image(self, base):
         """在 `images_dir` 中查找图片，支持多种后缀（大小写不敏感）。
 
-        优先返回第一个匹配的常见图片文件。
+        优先返回第一个匹配的常见图片文件。使用按目录缓存的图片索引（一次扫描目录），目录变化后自动刷新。
         """
-        # 尝试精确后缀匹配（常见小写后缀）
-        for ext in self.pic_formats:
-            img = osp.join(self.images_dir, base + ext)
-            if osp.exists(img):
-                return img
-
-        # 如果没找到，用 glob 匹配任意扩展并检查扩展是否为图片格式（大小写兼容）
-        candidates = glob.glob(osp.join(self.images_dir, base + ".*"))
-        for c in candidates:
-            ext = osp.splitext(c)[1].lower()
-            if ext in self.pic_formats:
-                return c
-
-        return None
-    
+        img = find_image_file(self.images_dir, base, self.pic_formats)
+        return str(img) if img is not None else None
+
     def copy_split(self, basenames, subset_name):
+        img_pairs = []
+        txt_pairs = []
         for base in basenames:
             img_path = self.find_image(base)
             if img_path is None:
                 print(f"⚠ 找不到图片：{base}，已跳过")
                 continue
             dst_img = osp.join(self.dataset_output, "images", subset_name, osp.basename(img_path))
-            shutil.copy(img_path, dst_img)
+            img_pairs.append((self.resized_images.get(osp.abspath(img_path), img_path), dst_img))
 
             src_txt = osp.join(self.labels_dir, base + ".txt")
             dst_txt = osp.join(self.dataset_output, "labels", subset_name, base + ".txt")
             if osp.exists(src_txt):
-                shutil.copy(src_txt, dst_txt)
+                txt_pairs.append((src_txt, dst_txt))
             else:
                 print(f"⚠ 未找到标注 TXT：{base}.txt（在 labels_dir 中），已跳过）")
-    
+
+        if self.incremental_split:
+            self.prune_split(subset_name, img_pairs, txt_pairs)
+        # 图片按 materialize_mode 并发复制/链接，标注始终复制；增量模式下跳过未变化的目标文件
+        for pairs, mode in ((img_pairs, self.materialize_mode), (txt_pairs, "copy")):
+            stats = materialize_files(pairs, mode=mode, workers=self.copy_workers, verbose=False,
+                                      skip_unchanged=self.incremental_split)
+            for err in stats["errors"]:
+                print(f"⚠ 复制失败：{err}")
+            self.copy_stats.append(stats)
+
+    def prune_split(self, subset_name, img_pairs, txt_pairs):
+        """删除子集目录中不在本次划分结果里的文件（已删除的样本，或改变了划分的样本）"""
+        removed = 0
+        for kind, pairs in (("images", img_pairs), ("labels", txt_pairs)):
+            subset_dir = osp.join(self.dataset_output, kind, subset_name)
+            expected = {osp.basename(dst) for _, dst in pairs}
+            with os.scandir(subset_dir) as it:
+                for entry in it:
+                    if entry.name not in expected and not entry.is_dir(follow_symlinks=False):
+                        os.unlink(entry.path)
+                        removed += 1
+        if removed:
+            print(f"🧹 {subset_name}: 删除了 {removed} 个不再属于该子集的文件")
+
+    def write_manifest(self, basenames, subset_name):
+        """清单模式：把该子集的图片绝对路径写入 `dataset_output/{subset_name}.txt`，不复制文件。
+
+        使用绝对路径：Ultralytics 只对以 `./` 开头的行做相对路径解析，且会替换行内所有 `./`，
+        无法正确处理 `../` 形式的相对路径。
+        """
+        lines = []
+        for base in basenames:
+            img_path = self.find_image(base)
+            if img_path is None:
+                print(f"⚠ 找不到图片：{base}，已跳过")
+                continue
+            if not osp.exists(osp.join(self.labels_dir, base + ".txt")):
+                print(f"⚠ 未找到标注 TXT：{base}.txt（在 labels_dir 中），已跳过）")
+                continue
+            lines.append(osp.abspath(img_path))
+        manifest_path = osp.join(self.dataset_output, f"{subset_name}.txt")
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + ('\n' if lines else ''))
+        print(f"📝 已写出 {subset_name} 清单：{manifest_path}（{len(lines)} 张）")
+
+    def build_resize_cache(self):
+        """生成/复用训练尺寸图片缓存（datasets/<name>/images_<imgsz>/），返回 ResizeCache"""
+        cache = ResizeCache(osp.join(self.dataset_output, f"images_{self.resize_imgsz}"), self.resize_imgsz)
+        self.resized_images = cache.build(self.image_files, workers=self.copy_workers)
+        return cache
+
+    def export_shards(self, splits):
+        """把各子集的图片（启用缩放缓存时为缩放后的图片）与标注打包为分片，splits 为 {子集名: basenames}"""
+        shard_dir = osp.join(self.dataset_output, "shards")
+        for subset_name, basenames in splits.items():
+            samples = []
+            for base in basenames:
+                img_path = self.find_image(base)
+                if img_path is None:
+                    continue
+                src_txt = osp.join(self.labels_dir, base + ".txt")
+                samples.append((base, self.resized_images.get(osp.abspath(img_path), img_path),
+                                src_txt if osp.exists(src_txt) else None))
+            write_shards(samples, shard_dir, subset_name, shard_size_mb=self.shard_size_mb)
+
+    def near_duplicate_groups(self, bases):
+        """按感知哈希把近重复图片聚成簇，返回每个 basename 的簇编号（0..K-1）"""
+        paths = [self.find_image(b) or "" for b in bases]
+        cache_path = osp.join(self.dataset_output, f".near_dup_{self.dedup_method}.json")
+        index = NearDupIndex.build(paths, method=self.dedup_method, workers=self.copy_workers, cache_path=cache_path)
+        groups = index.clusters(self.dedup_distance)
+        info = cluster_summary(groups)
+        print(f"🧩 近重复簇（距离 ≤ {self.dedup_distance}）：{info['dup_clusters']} 个簇共 {info['dup_images']} 张图片，"
+              f"最大簇 {info['largest']} 张；同一簇的图片将分到同一子集")
+        return groups
+
+    def plan_split(self, bases):
+        """按 split_strategy 划分 basenames，返回 {子集名: basenames}；启用 dedup_distance 时按近重复簇整体划分"""
+        if self.is_testDataset_required:
+            names, ratios = ["train", "test", "val"], [0.7, 0.2, 0.1]
+        else:
+            names, ratios = ["train", "val"], [0.8, 0.2]
+        if self.split_strategy == "hash":
+            # 按文件名排序后分配，子集内顺序也与 glob 顺序无关
+            bases = sorted(bases)
+        groups = self.near_duplicate_groups(bases) if self.dedup_distance is not None else None
+        sizes = group_sizes(groups) if groups is not None else None
+
+        hist = None
+        if self.split_strategy == "stratified":
+            hist = read_class_histograms((osp.join(self.labels_dir, b + ".txt") for b in bases),
+                                         num_classes=len(self.class_list), workers=self.copy_workers)
+            unit_hist = group_histogram(hist, groups) if groups is not None else hist
+            unit_assign = stratified_split(unit_hist, ratios, seed=42, sizes=sizes)
+        elif self.split_strategy == "hash":
+            if groups is None:
+                keys = bases
+            else:
+                # 每个簇以其中最小的文件名参与哈希，簇内新增图片时不改变簇的归属
+                keys = [None] * len(sizes)
+                for b, g in zip(bases, groups.tolist()):
+                    if keys[g] is None or b < keys[g]:
+                        keys[g] = b
+            unit_assign = hash_split(keys, ratios, salt=self.split_salt)
+        elif groups is None:
+            random.shuffle(bases)
+            unit_assign = sequential_split(len(bases), ratios)
+        else:
+            order = list(range(len(sizes)))
+            random.shuffle(order)
+            unit_assign = np.empty(len(sizes), dtype=np.int64)
+            unit_assign[order] = sequential_split(len(order), ratios, sizes[order])
+        assign = unit_assign[groups] if groups is not None else unit_assign
+
+        if hist is not None:
+            print_split_report(split_report(hist, assign, names), self.class_list)
+        assign = assign.tolist()
+        return {name: [b for b, a in zip(bases, assign) if a == s] for s, name in enumerate(names)}
+
     def check_txt_files(self):
         """检查每张图片是否都有对应的 TXT 文件"""
         for img in self.image_files:
@@ -180,28 +363,38 @@ class YoloDatasetSplitter:
         self.is_testDataset_required = (opt_test != "n")
         self.make_yolo_dirs()
 
-        random.shuffle(bases)
-        if self.is_testDataset_required:  
-            n = len(bases)
-            n_train = int(n * 0.7)
-            n_test = int(n * 0.2)
-            train_bases = bases[:n_train]
-            test_bases = bases[n_train:n_train + n_test]
-            val_bases = bases[n_train + n_test:]
+        n = len(bases)
+        parts = self.plan_split(bases)
+        train_bases, val_bases, test_bases = parts["train"], parts["val"], parts.get("test", [])
+        if self.is_testDataset_required:
             print(f"➡ 样本总数: {n}，训练: {len(train_bases)}，测试: {len(test_bases)}，验证: {len(val_bases)}")
         else:
-            n = len(bases)
-            n_train = int(n * 0.8)
-            train_bases = bases[:n_train]
-            val_bases = bases[n_train:]
-            test_bases = []
             print(f"➡ 样本总数: {n}，训练: {len(train_bases)}，验证: {len(val_bases)} (无测试集)")
 
-        # 执行复制
-        self.copy_split(train_bases, "train")
-        if self.is_testDataset_required:
-            self.copy_split(test_bases, "test")
-        self.copy_split(val_bases, "val")
+        if self.split_mode == "manifest":
+            if self.resize_imgsz:
+                print("⚠ manifest 模式直接引用原始图片，resize_imgsz 不生效")
+            # 只写图片清单，不复制文件
+            self.write_manifest(train_bases, "train")
+            if self.is_testDataset_required:
+                self.write_manifest(test_bases, "test")
+            self.write_manifest(val_bases, "val")
+        else:
+            cache = self.build_resize_cache() if self.resize_imgsz else None
+            # 执行复制
+            self.copy_split(train_bases, "train")
+            if self.is_testDataset_required:
+                self.copy_split(test_bases, "test")
+            self.copy_split(val_bases, "val")
+            print_summary(merge_stats(*self.copy_stats), self.materialize_mode, "数据划分")
+            if cache is not None:
+                cache.save()
+
+        if self.shard_export:
+            splits = {"train": train_bases, "val": val_bases}
+            if self.is_testDataset_required:
+                splits["test"] = test_bases
+            self.export_shards(splits)
 
         print(f"🎉 数据划分完成！所有数据已存入 {self.dataset_output}/ 目录")
         
@@ -213,10 +406,17 @@ class YoloDatasetSplitter:
         lines.append(f'# YOLO 数据集描述文件，仅适配 Ultralytics')
         lines.append(f'path: "{dataset_path}"')
         lines.append("")
-        lines.append("train: images/train")
-        lines.append("val: images/val")
-        if self.is_testDataset_required:
-            lines.append("test: images/test")
+        if self.split_mode == "manifest":
+            # 清单模式：train/val/test 指向图片路径清单（相对 path）
+            lines.append("train: train.txt")
+            lines.append("val: val.txt")
+            if self.is_testDataset_required:
+                lines.append("test: test.txt")
+        else:
+            lines.append("train: images/train")
+            lines.append("val: images/val")
+            if self.is_testDataset_required:
+                lines.append("test: images/test")
         lines.append("")
         lines.append(f"nc: {len(self.class_list)}")
         lines.append("names:")
@@ -15,7 +15,7 @@ def main():
     project="runs/train",  # 保存训练结果的目录
     name="potato",  # 本次训练名称
     exist_ok=True,  # 如果目录已存在允许覆盖
-    cache=True,  # 缓存数据加快训练
+    cache=True,  # 缓存数据加快训练（划分时设置 resize_imgsz=416 后图片已是训练尺寸，缓存不再解码原图）
     save_period=1,  # 每轮保存权重
     box=10,  # 提高框回归权重
     mask_ratio=2,  # 提高mask精度
@@ -1,47 +1,200 @@
 import cv2
 import os
-from ultralytics import YOLO
+import sys
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+"""
+中心 ROI 批量推理（流水线）
+
+- 读取线程：预读取图片并裁剪中心 ROI，放入有界队列（QUEUE_SIZE 限制内存占用）
+- 主线程：按 BATCH_SIZE 组成批次调用一次 model.predict，避免逐张推理导致模型“吃不饱”
+- 写出线程池：results.plot() 绘制与 cv2.imwrite 编码写盘并行执行，不阻塞推理
+
+解码、推理、编码三个阶段同时进行；CPU 与 GPU 均可运行（DEVICE=None 时由 ultralytics 自动选择）。
+结束后打印吞吐量（张/秒）。
+
+推理后端（BACKEND）：
+- "pt":   ultralytics + PyTorch 加载 MODEL_PATH
+- "onnx": onnxruntime 加载 ONNX_PATH（05_Export_ONNX.py 导出），前后处理为纯 NumPy（tools/yolo_seg_onnx.py），
+          不导入 torch / ultralytics，适合只有 CPU 的设备；ONNX 输入尺寸固定，IMGSZ 需与导出时一致
+一致性检查：python 04_predict_roi.py --parity [图片数] 用 INPUT_FOLDER 中的图片对比 ONNX 与 .pt 的结果，
+          未满足 tools/yolo_seg_onnx.py 的 PARITY_CRITERIA（匹配率、最差框/掩码 IoU、最大分数差）时以状态码 1 退出
+
+推理方式（MODE）：
+- "roi":   裁剪中心 ROI_SCALE 区域后推理（原方式，ROI 之外的目标会丢失）
+- "tiled": 整图切成重叠的 IMGSZ × IMGSZ 小块分批推理，掩码映射回整图后用掩码 NMS 合并接缝处的重复目标
+           （tools/tiled_predict.py），适合高分辨率图片中的小目标；此时 BATCH_SIZE 为每次推理的小块数
+"""
+BACKEND = "pt"       # "pt" 或 "onnx"
+MODE = "roi"         # "roi" 或 "tiled"
+MODEL_PATH = "runs/train/potato/weights/best.pt"
+ONNX_PATH = "runs/train/potato/weights/best.onnx"
+INPUT_FOLDER = r"F:\Desktop\JPEGImages"
+IMG_EXTS = (".jpg", ".jpeg", ".png")  # 支持的图片格式
+ROI_SCALE = 0.6      # 中心 ROI 裁剪比例
+IMGSZ = 416
+CONF = 0.25
+BATCH_SIZE = 8       # 每次 model.predict 的图片数
+QUEUE_SIZE = 32      # 读取队列上限（预读取的图片数）
+WRITER_WORKERS = 4   # 绘制/写盘线程数
+DEVICE = None        # 例如 "cpu"、0；None 自动选择
+TILE_OVERLAP = 0.2   # tiled 模式相邻小块的重叠比例
+
+_DONE = object()
+
+
+def crop_center_roi(img, roi_scale=ROI_SCALE):
+    """裁剪图片中心区域，宽高各为原图的 roi_scale 倍"""
+    h, w = img.shape[:2]
+    roi_w = int(w * roi_scale)
+    roi_h = int(h * roi_scale)
+    x1 = (w - roi_w) // 2
+    y1 = (h - roi_h) // 2
+    return img[y1:y1 + roi_h, x1:x1 + roi_w]
+
+
+def _read_worker(paths, out_queue, roi_scale):
+    """读取线程：逐张读取并裁剪 ROI（roi_scale 为 None 时不裁剪），放入有界队列；读取失败的图片放入 (filename, None)"""
+    try:
+        for img_path in paths:
+            img = cv2.imread(img_path)
+            crop = crop_center_roi(img, roi_scale) if img is not None and roi_scale else img
+            out_queue.put((os.path.basename(img_path), crop))
+    finally:
+        out_queue.put(_DONE)
+
+
+def _iter_batches(in_queue, batch_size):
+    """从队列中取出 (filename, crop) 组成批次；加载失败的图片直接打印并跳过"""
+    batch = []
+    while True:
+        item = in_queue.get()
+        if item is _DONE:
+            break
+        filename, crop = item
+        if crop is None:
+            print(f"图片加载失败: {filename}")
+            continue
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_model(backend=BACKEND, model_path=MODEL_PATH, onnx_path=ONNX_PATH, imgsz=IMGSZ):
+    """按后端加载模型；两种模型都支持 model.predict(图片列表, imgsz=, conf=) 并返回带 plot() 的结果"""
+    if backend == "onnx":
+        from tools.yolo_seg_onnx import YoloSegOnnx
+        return YoloSegOnnx(onnx_path, imgsz=imgsz)
+    if backend == "pt":
+        from ultralytics import YOLO
+        return YOLO(model_path)
+    raise ValueError(f"未知的推理后端: {backend}（可选 'pt' / 'onnx'）")
+
+
+def _save_result(result, save_path):
+    annotated = result.plot()
+    if not cv2.imwrite(save_path, annotated):
+        raise OSError(f"写入失败: {save_path}")
+    return save_path
+
 
 # 使用推理阶段代码
-def predict_with_roi_folder():
+def predict_with_roi_folder(model_path=MODEL_PATH, input_folder=INPUT_FOLDER, output_folder=None,
+                            roi_scale=ROI_SCALE, imgsz=IMGSZ, conf=CONF, batch_size=BATCH_SIZE,
+                            queue_size=QUEUE_SIZE, writer_workers=WRITER_WORKERS, device=DEVICE,
+                            backend=BACKEND, onnx_path=ONNX_PATH, mode=MODE, tile_overlap=TILE_OVERLAP):
     # 加载模型
-    model = YOLO("runs/train/potato/weights/best.pt")
+    load_start = time.perf_counter()
+    model = load_model(backend, model_path, onnx_path, imgsz)
+    print(f"模型加载完成 [{backend}]，用时 {time.perf_counter() - load_start:.2f}s")
 
     # 图片输入路径和结果保存路径
-    input_folder = r"F:\Desktop\JPEGImages"
-    output_folder = os.path.join(input_folder, "reslut")
+    output_folder = output_folder or os.path.join(input_folder, "reslut")
     os.makedirs(output_folder, exist_ok=True)  # 创建结果文件夹（不存在则创建）
 
-    # 遍历文件夹中的图片
-    for filename in os.listdir(input_folder):
-        if filename.lower().endswith((".jpg", ".jpeg", ".png")):  # 支持的图片格式
-            img_path = os.path.join(input_folder, filename)
-            img = cv2.imread(img_path)
-            if img is None:
-                print(f"图片加载失败: {filename}")
-                continue
+    paths = sorted(e.path for e in os.scandir(input_folder)
+                   if e.is_file() and e.name.lower().endswith(IMG_EXTS))
+    if not paths:
+        print(f"未找到图片: {input_folder}")
+        return
+
+    read_queue = queue.Queue(maxsize=max(1, queue_size))
+    tiled = mode == "tiled"
+    if tiled:
+        from tools.tiled_predict import predict_tiled
+    elif mode != "roi":
+        raise ValueError(f"未知的推理方式: {mode}（可选 'roi' / 'tiled'）")
+    # tiled 模式推理整张图片，不裁剪 ROI；每张图片的小块组成批次，因此按单张图片取出
+    reader = threading.Thread(target=_read_worker, args=(paths, read_queue, None if tiled else roi_scale), daemon=True)
+
+    predict_kwargs = {'imgsz': imgsz, 'conf': conf, 'verbose': False}
+    if device is not None:
+        predict_kwargs['device'] = device
+
+    saved = failed = 0
+    # 限制等待写出的结果数量，避免推理快于写盘时结果在内存中堆积
+    max_pending = max(1, writer_workers) * max(1, batch_size) * 2
+    pending = set()
+
+    def _collect(done):
+        nonlocal saved, failed
+        for fut in done:
+            try:
+                fut.result()
+                saved += 1
+            except Exception as e:
+                failed += 1
+                print(f"保存失败: {e}")
+
+    start = time.perf_counter()
+    reader.start()
+    with ThreadPoolExecutor(max_workers=max(1, writer_workers)) as writers:
+        for batch in _iter_batches(read_queue, 1 if tiled else batch_size):
+            names = [name for name, _ in batch]
+            crops = [crop for _, crop in batch]
+
+            # 推理（一次处理整个批次）
+            if tiled:
+                results = [predict_tiled(model, crop, batch_size=batch_size, overlap=tile_overlap, **predict_kwargs)
+                           for crop in crops]
+            else:
+                results = model.predict(crops, **predict_kwargs)
+
+            # 保存结果（交给写出线程池）
+            for name, result in zip(names, results):
+                pending.add(writers.submit(_save_result, result, os.path.join(output_folder, f"res_{name}")))
+            if len(pending) > max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done)
+        done, pending = wait(pending)
+        _collect(done)
+    reader.join()
 
-            h, w = img.shape[:2]
+    elapsed = time.perf_counter() - start
+    print(f"已保存 {saved} 张结果到: {output_folder}（失败 {failed} 张）")
+    print(f"总用时 {elapsed:.2f}s，吞吐量 {saved / max(elapsed, 1e-9):.1f} 张/秒 "
+          f"(mode={mode}, batch={batch_size}, writers={writer_workers})")
 
-            # 中心 ROI 裁剪比例
-            roi_scale = 0.6
-            roi_w = int(w * roi_scale)
-            roi_h = int(h * roi_scale)
-            x1 = (w - roi_w) // 2
-            y1 = (h - roi_h) // 2
-            x2 = x1 + roi_w
-            y2 = y1 + roi_h
 
-            crop = img[y1:y2, x1:x2]
+def check_onnx_parity(num_images=20, input_folder=INPUT_FOLDER, roi_scale=ROI_SCALE, imgsz=IMGSZ, conf=CONF):
+    """用 INPUT_FOLDER 中前 num_images 张图片的 ROI 对比 ONNX 与 .pt 模型的结果"""
+    from tools.yolo_seg_onnx import compare_with_pt
 
-            # 推理
-            results = model.predict(crop, imgsz=416, conf=0.25)
+    paths = sorted(e.path for e in os.scandir(input_folder)
+                   if e.is_file() and e.name.lower().endswith(IMG_EXTS))[:num_images]
+    imgs = [crop_center_roi(img, roi_scale) for img in map(cv2.imread, paths) if img is not None]
+    return compare_with_pt(MODEL_PATH, ONNX_PATH, imgs, imgsz=imgsz, conf=conf)
 
-            # 保存结果
-            annotated = results[0].plot()
-            save_path = os.path.join(output_folder, f"res_{filename}")
-            cv2.imwrite(save_path, annotated)
-            print("已保存:", save_path)
 
 if __name__ == "__main__":
-    predict_with_roi_folder()
+    if len(sys.argv) > 1 and sys.argv[1] == "--parity":
+        report = check_onnx_parity(int(sys.argv[2]) if len(sys.argv) > 2 else 20)
+        sys.exit(0 if report['passed'] else 1)
+    else:
+        predict_with_roi_folder()
@@ -4,4 +4,5 @@ from ultralytics import YOLO
 model = YOLO(r"F:\zywXM\PyCharmPro\yolov8-seg\runs\train\potato\weights\best.pt")
 
 # 导出为 ONNX 生成在model同级目录
+# 导出的模型可在 04_predict_roi.py 中设置 BACKEND = "onnx" 使用（onnxruntime 推理，不依赖 torch）
 model.export(format="onnx")
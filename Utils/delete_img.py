@@ -1,9 +1,15 @@
 import os
+import sys
 import random
 import shutil
 
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools.near_dup import NearDupIndex, cluster_summary, DEFAULT_MAX_DISTANCE
+
 # 删除文件夹中的图片数量到 750并保留删除的图片
-def random_delete_to_750(folder_path):
+def random_delete_to_750(folder_path, target=750):
     # 读取所有图片
     imgs = [f for f in os.listdir(folder_path)
             if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))]
@@ -13,12 +19,12 @@ def random_delete_to_750(folder_path):
     total = len(imgs)
     print(f"当前图片数量: {total}")
 
-    if total <= 750:
+    if total <= target:
         print("图片数量不足或刚好，无需删除")
         return
 
     # 需要删除的数量
-    need_delete = total - 750
+    need_delete = total - target
     print(f"需要删除: {need_delete} 张")
 
     delete_count = 0
@@ -60,14 +66,58 @@ def random_delete_to_750(folder_path):
             dst = os.path.join(delete_folder, imgs[i])
             shutil.move(src, dst)
 
-    print(f"已成功删除 {delete_count} 张图片，剩余 750 张")
+    print(f"已成功删除 {delete_count} 张图片，剩余 {target} 张")
     print(f"被删除的图片已移动到: {delete_folder}")
 
 
 
+# 优先删除近重复图片：每个近重复簇（感知哈希距离 ≤ max_distance）保留一张，多余的图片作为删除候选，
+# 候选不足时再按原来的随机连续删除补足
+def dedup_delete_to(folder_path, target=750, max_distance=DEFAULT_MAX_DISTANCE, method="dhash", workers=8):
+    imgs = [f for f in os.listdir(folder_path)
+            if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))]
+    imgs.sort()
+
+    total = len(imgs)
+    print(f"当前图片数量: {total}")
+    if total <= target:
+        print("图片数量不足或刚好，无需删除")
+        return
+
+    need_delete = total - target
+    index = NearDupIndex.build([os.path.join(folder_path, f) for f in imgs], method=method, workers=workers)
+    groups = index.clusters(max_distance)
+    info = cluster_summary(groups)
+    print(f"近重复簇: {info['dup_clusters']} 个，共 {info['dup_images']} 张图片")
+
+    # 每个簇保留排序后的第一张，其余为候选；候选过多时随机挑选，优先删除大簇中的图片
+    first = np.zeros(len(imgs), dtype=bool)
+    first[np.unique(groups, return_index=True)[1]] = True
+    candidates = np.flatnonzero(~first)
+    sizes = np.bincount(groups)[groups[candidates]]
+    order = np.lexsort((np.random.permutation(len(candidates)), -sizes))
+    chosen = candidates[order[:need_delete]].tolist()
+
+    delete_folder = os.path.join(folder_path, "deleted_preview")
+    os.makedirs(delete_folder, exist_ok=True)
+    for i in chosen:
+        shutil.move(os.path.join(folder_path, imgs[i]), os.path.join(delete_folder, imgs[i]))
+    print(f"已删除 {len(chosen)} 张近重复图片")
+
+    if len(chosen) < need_delete:
+        print("近重复图片不足，剩余部分按随机连续删除")
+        random_delete_to_750(folder_path, target)
+    else:
+        print(f"剩余 {target} 张，被删除的图片已移动到: {delete_folder}")
+
+
 # ------------------------------
 # 程序入口
 # ------------------------------
 if __name__ == "__main__":
     folder = r"F:\Desktop\residue"     # 修改为你的图片路径
-    random_delete_to_750(folder)
+    use_near_dup = True                 # True：优先删除近重复图片；False：随机连续删除
+    if use_near_dup:
+        dedup_delete_to(folder, 750)
+    else:
+        random_delete_to_750(folder)
@@ -2,4 +2,21 @@
 
 __all__ = [
     'dataset_augment',
+    'image_index',
+    'materialize',
+    'aug_cache',
+    'label_io',
+    'snapshot',
+    'yolo_seg_onnx',
+    'seg_masks',
+    'tiled_predict',
+    'seg_geometry',
+    'resize_cache',
+    'shards',
+    'split_planner',
+    'near_dup',
+    'color_kernel',
+    'blur_kernel',
+    'geo_augment',
+    'virtual_augment',
 ]
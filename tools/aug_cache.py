@@ -0,0 +1,175 @@
+"""增量增强缓存
+
+在输出数据集目录中保存一个 JSON-lines 文件（默认 `.augment_cache.jsonl`），记录每个增强结果的
+缓存键与输出文件。缓存键由以下内容计算：源图片哈希、标注 JSON 哈希、TXT 哈希、增强器名称与参数
+（radius / variant / seed 等）。再次运行时键相同且输出文件仍存在的样本直接复用，只处理新增或变化的样本。
+
+文件中有两类记录（每行一个 JSON）：
+- {"type": "hash", "path": ..., "size": ..., "mtime_ns": ..., "sha1": ...}
+  文件内容哈希缓存：size 与 mtime 未变化时不重新读取文件计算哈希
+- {"type": "entry", "key": ..., "source": ..., "tool": ..., "outputs": [...]}
+  增强结果：outputs 为相对输出数据集根目录的路径
+"""
+import os
+import json
+import hashlib
+from pathlib import Path
+
+CACHE_FILENAME = '.augment_cache.jsonl'
+
+
+def stable_fraction(*parts) -> float:
+    """对若干字符串做 sha1，映射到 [0, 1) 的稳定小数（与运行次数、文件顺序无关）。"""
+    h = hashlib.sha1('\x1f'.join(str(p) for p in parts).encode('utf-8')).digest()
+    return int.from_bytes(h[:8], 'big') / float(1 << 64)
+
+
+class AugmentCache:
+    def __init__(self, out_base, filename: str = CACHE_FILENAME):
+        self.out_base = Path(out_base)
+        self.path = self.out_base / filename
+        self.hashes = {}
+        self.entries = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+        self.removed = 0
+        self._fh = None
+        self.load()
+
+    def load(self):
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # 中断时可能留下半行，忽略
+                    continue
+                if rec.get('type') == 'hash':
+                    self.hashes[rec['path']] = rec
+                elif rec.get('type') == 'entry':
+                    self.entries[rec['key']] = rec
+
+    def _append(self, rec: dict):
+        if self._fh is None:
+            self.out_base.mkdir(parents=True, exist_ok=True)
+            self._fh = open(self.path, 'a', encoding='utf-8')
+        self._fh.write(json.dumps(rec, ensure_ascii=False) + '\n')
+        self._fh.flush()
+
+    def file_hash(self, path) -> str:
+        """文件内容 sha1；size 与 mtime_ns 均未变化时复用缓存值。文件不存在返回空字符串。"""
+        if path is None:
+            return ''
+        p = os.path.abspath(path)
+        try:
+            st = os.stat(p)
+        except FileNotFoundError:
+            return ''
+        rec = self.hashes.get(p)
+        if rec and rec['size'] == st.st_size and rec['mtime_ns'] == st.st_mtime_ns:
+            return rec['sha1']
+        h = hashlib.sha1()
+        with open(p, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        rec = {'type': 'hash', 'path': p, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha1': h.hexdigest()}
+        self.hashes[p] = rec
+        self._append(rec)
+        return rec['sha1']
+
+    @staticmethod
+    def make_key(tool: str, params: dict, *hashes: str) -> str:
+        payload = json.dumps({'tool': tool, 'params': params, 'hashes': list(hashes)}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def lookup(self, key: str):
+        """命中（记录存在且所有输出文件仍存在）时返回输出列表并计为 hit，否则返回 None 并计为 miss。"""
+        rec = self.entries.get(key)
+        if rec and all((self.out_base / o).exists() for o in rec['outputs']):
+            self.used.add(key)
+            self.hits += 1
+            return rec['outputs']
+        self.misses += 1
+        return None
+
+    def record(self, key: str, source: str, tool: str, outputs: list):
+        rec = {'type': 'entry', 'key': key, 'source': source, 'tool': tool, 'outputs': list(outputs)}
+        self.entries[key] = rec
+        self.used.add(key)
+        self._append(rec)
+
+    def prune(self):
+        """删除本次运行未使用的旧条目及其输出文件（源样本已删除/已变化/不再被抽中），返回删除的文件数。"""
+        keep = set()
+        for key in self.used:
+            keep.update(self.entries[key]['outputs'])
+        for key in [k for k in self.entries if k not in self.used]:
+            for o in self.entries[key]['outputs']:
+                p = self.out_base / o
+                if o not in keep and p.exists():
+                    p.unlink()
+                    self.removed += 1
+            del self.entries[key]
+        return self.removed
+
+    def save(self):
+        """压缩重写缓存文件（只保留仍有效的哈希与条目），先写临时文件再原子替换。"""
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        self.out_base.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for rec in self.hashes.values():
+                if os.path.exists(rec['path']):
+                    f.write(json.dumps(rec, ensure_ascii=False) + '\n')
+            for rec in self.entries.values():
+                f.write(json.dumps(rec, ensure_ascii=False) + '\n')
+        os.replace(tmp, self.path)
+
+    def summary(self) -> str:
+        return f'Summary cache: hits={self.hits} misses={self.misses} removed={self.removed} cache={self.path}'
+
+
+def check_incremental(workers=2, n_images=6):
+    """在临时数据集上以 workers 个进程运行三次增量融合流水线：第一次全部写出，第二次全部命中缓存；
+    第 0 个样本的 JSON 的 imagePath 指向另一张图片（与 JSON 同名的图片也存在），修改这张实际使用的图片后，
+    第三次只有它未命中。不满足时抛出 AssertionError"""
+    import tempfile
+    from PIL import Image
+    from .dataset_augment import BlurAugment, FusedAugmentPipeline
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        (root / 'ds' / 'images').mkdir(parents=True)
+        (root / 'ds' / 'labels').mkdir(parents=True)
+        for i in range(n_images):
+            Image.effect_noise((64, 48), 32).convert('RGB').save(root / 'ds' / 'images' / f'img_{i}.jpg')
+            image_name = f'img_{i}.jpg'
+            if i == 0:
+                image_name = 'photo_0.png'
+                Image.effect_noise((64, 48), 32).convert('RGB').save(root / 'ds' / 'images' / image_name)
+            with open(root / 'ds' / 'labels' / f'img_{i}.json', 'w', encoding='utf-8') as f:
+                json.dump({'imagePath': image_name, 'shapes': []}, f)
+            (root / 'ds' / 'labels' / f'img_{i}.txt').write_text('0 0.1 0.1 0.5 0.1 0.5 0.5\n', encoding='utf-8')
+
+        for run in range(3):
+            if run == 2:
+                Image.effect_noise((64, 48), 64).convert('RGB').save(root / 'ds' / 'images' / 'photo_0.png')
+            cache = AugmentCache(root / 'out')
+            FusedAugmentPipeline([BlurAugment(radius=2, workers=workers)], workers=workers, cache=cache).run(dataset_root=root, dataset_name='ds', out_dir='out')
+            outputs = sorted(p.name for p in (root / 'out' / 'images').iterdir())
+            assert len(outputs) == n_images, f'run {run}: expected {n_images} output images, got {outputs}'
+            expected = [(0, n_images), (n_images, 0), (n_images - 1, 1)][run]
+            assert (cache.hits, cache.misses) == expected, f'run {run}: hits/misses={cache.hits}/{cache.misses}, expected {expected}'
+    print(f'incremental check passed (workers={workers}, images={n_images})')
+
+
+if __name__ == '__main__':
+    check_incremental()
@@ -0,0 +1,166 @@
+"""高斯模糊后端（BlurAugment 使用）
+
+PIL 的 `ImageFilter.GaussianBlur(radius)` 中 radius 是高斯的标准差 σ，内部用 3 次扩展盒式滤波近似；
+大半径、高分辨率时它是增强中最耗时的一步。这里提供几种可选后端（均使用边缘复制的边界，与 PIL 一致）：
+
+- 'pil'：       原实现，作为参考
+- 'opencv'：    cv2.GaussianBlur 可分离卷积（核宽约 ±3σ），精确高斯
+- 'box3'：      3 次 cv2.blur 盒式滤波，盒宽按 Kovesi "Fast Almost-Gaussian Filtering" 选取，
+                三次方差之和等于 σ²（与 PIL 的做法相同，但盒宽取整数）；每次耗时与 σ 无关，原地计算
+- 'downsample'：先按整数倍 f 用 INTER_AREA 缩小，在小图上做 σ' 的高斯，再用 INTER_LINEAR 放大回原尺寸；
+                缩小（宽 f 的盒式平均，方差 f²/12）与线性插值放大（方差约 f²/6）本身带来的模糊计入总方差：
+                σ'² = (σ² - f²/4) / f²。f 取 σ / DOWNSAMPLE_SIGMA，小图上的 σ' 不低于约 DOWNSAMPLE_SIGMA 像素
+- 'auto'：      σ ≥ downsample_min_radius 时用 'downsample'，否则用 'box3'；不会选 'opencv'：
+                它的耗时随 σ 线性增长，σ ≥ 8 时已不比 PIL 快，σ = 20 时慢 2~3 倍
+
+误差界：加速后端近似的都是同一 σ 的高斯，与 PIL 的差异来自 PIL 自身的盒式近似、核截断与取整，
+以及 downsample 模式对高频的额外衰减。`python -m tools.blur_kernel` 在平滑纹理 + 噪声的测试图上
+（640x480、1920x1080、4032x3024）实测，相对 PIL 的最大逐像素绝对差：
+
+    backend       σ ≤ 10    σ = 20
+    box3          2~3       2
+    opencv        3~5       9~16
+    downsample    3~4       9~10
+
+1920x1080 上的耗时（ms，单线程 PIL，OpenCV 默认线程数）：
+
+    σ         pil    opencv   box3   downsample
+    2          80      17      14       17
+    5          79      36      19       37
+    10         93      78      21       15
+    20         80     194      21       11
+
+'auto'（默认 downsample_min_radius = 8）在 σ < 8 时最大差 ≤ 3，σ ≤ 10 时 ≤ 4，σ = 20 时 ≤ 10；
+需要与 PIL 更接近时用 'box3'（各半径最大差 ≤ 3，耗时与 σ 无关）。
+
+用法：
+    blurred = blur_image(img, radius=10, backend='auto')   # PIL.Image -> PIL.Image
+"""
+import math
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageFilter
+
+BACKENDS = ('pil', 'opencv', 'box3', 'downsample', 'auto')
+DOWNSAMPLE_SIGMA = 3.0
+DOWNSAMPLE_MIN_RADIUS = 8.0
+
+
+def box_sizes(sigma, n=3) -> list:
+    """n 次盒式滤波近似标准差 sigma 的高斯所需的（奇数）盒宽（Kovesi, 2010）"""
+    w_ideal = math.sqrt(12.0 * sigma * sigma / n + 1)
+    wl = int(math.floor(w_ideal))
+    if wl % 2 == 0:
+        wl -= 1
+    wu = wl + 2
+    m_ideal = (12.0 * sigma * sigma - n * wl * wl - 4 * n * wl - 3 * n) / (-4.0 * wl - 4)
+    m = int(round(m_ideal))
+    return [wl if i < m else wu for i in range(n)]
+
+
+def gaussian_opencv(arr, sigma, out=None) -> np.ndarray:
+    return cv2.GaussianBlur(arr, (0, 0), sigmaX=sigma, sigmaY=sigma, dst=out, borderType=cv2.BORDER_REPLICATE)
+
+
+def gaussian_box3(arr, sigma, out=None) -> np.ndarray:
+    out = np.empty_like(arr) if out is None else out
+    src = arr
+    for w in box_sizes(sigma):
+        if w > 1:
+            cv2.blur(src, (w, w), dst=out, borderType=cv2.BORDER_REPLICATE)
+        elif src is not out:
+            np.copyto(out, src)
+        src = out
+    return out
+
+
+def gaussian_downsample(arr, sigma, out=None) -> np.ndarray:
+    h, w = arr.shape[:2]
+    f = int(sigma // DOWNSAMPLE_SIGMA)
+    # 小图至少保留 16 像素
+    f = max(1, min(f, min(h, w) // 16 or 1))
+    if f <= 1:
+        return gaussian_box3(arr, sigma, out)
+    small = cv2.resize(arr, (max(1, w // f), max(1, h // f)), interpolation=cv2.INTER_AREA)
+    s = math.sqrt(max(sigma * sigma - f * f / 4.0, 0.0)) / f
+    if s > 0:
+        gaussian_opencv(small, s, small)
+    return cv2.resize(small, (w, h), dst=out, interpolation=cv2.INTER_LINEAR)
+
+
+_KERNELS = {'opencv': gaussian_opencv, 'box3': gaussian_box3, 'downsample': gaussian_downsample}
+
+
+def resolve_backend(backend, radius, downsample_min_radius=DOWNSAMPLE_MIN_RADIUS) -> str:
+    if backend not in BACKENDS:
+        raise ValueError(f'unknown blur backend: {backend} (expected one of {BACKENDS})')
+    if backend == 'auto':
+        return 'downsample' if radius >= downsample_min_radius else 'box3'
+    return backend
+
+
+def blur_array(arr, radius, backend='opencv', out=None, downsample_min_radius=DOWNSAMPLE_MIN_RADIUS) -> np.ndarray:
+    """对 uint8 数组（H, W[, C]）做标准差为 radius 的高斯模糊；backend 不能为 'pil'"""
+    backend = resolve_backend(backend, radius, downsample_min_radius)
+    if backend == 'pil':
+        raise ValueError("blur_array does not support the 'pil' backend; use blur_image")
+    if radius <= 0:
+        if out is None:
+            return arr.copy()
+        np.copyto(out, arr)
+        return out
+    return _KERNELS[backend](np.ascontiguousarray(arr), float(radius), out)
+
+
+def blur_image(img: Image.Image, radius, backend='pil', downsample_min_radius=DOWNSAMPLE_MIN_RADIUS) -> Image.Image:
+    """PIL 图像的高斯模糊，结果与 `img.filter(ImageFilter.GaussianBlur(radius))` 对应"""
+    backend = resolve_backend(backend, radius, downsample_min_radius)
+    if backend == 'pil':
+        return img.filter(ImageFilter.GaussianBlur(radius=radius))
+    arr = np.asarray(img)
+    out = np.empty_like(arr)
+    return Image.fromarray(blur_array(arr, radius, backend, out))
+
+
+def _test_image(w, h, seed=0) -> Image.Image:
+    """平滑纹理 + 细节噪声的测试图，兼顾低频与高频内容"""
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (max(2, h // 32), max(2, w // 32), 3), dtype=np.uint8)
+    base = cv2.resize(coarse, (w, h), interpolation=cv2.INTER_CUBIC).astype(np.int16)
+    base += rng.integers(-24, 25, (h, w, 3), dtype=np.int16)
+    return Image.fromarray(np.clip(base, 0, 255).astype(np.uint8))
+
+
+def benchmark(radii=(2, 5, 10, 20), sizes=((640, 480), (1920, 1080), (4032, 3024)),
+              backends=('pil', 'opencv', 'box3', 'downsample'), repeat=3) -> list:
+    """测量每个后端在不同半径与分辨率下的吞吐及相对 PIL 的误差，打印表格并返回行列表"""
+    rows = []
+    print(f"{'size':>11} {'radius':>6} {'backend':>10} {'ms':>9} {'MP/s':>8} {'mean|d|':>8} {'max|d|':>7}")
+    for w, h in sizes:
+        img = _test_image(w, h)
+        mp = w * h / 1e6
+        for radius in radii:
+            ref = None
+            for backend in backends:
+                best = float('inf')
+                for _ in range(max(1, repeat)):
+                    start = time.perf_counter()
+                    res = blur_image(img, radius, backend)
+                    best = min(best, time.perf_counter() - start)
+                arr = np.asarray(res, dtype=np.int16)
+                if backend == 'pil':
+                    ref = arr
+                diff = np.abs(arr - ref) if ref is not None else None
+                row = {'size': f'{w}x{h}', 'radius': radius, 'backend': backend, 'ms': best * 1000, 'mp_s': mp / best,
+                       'mean_abs_diff': float(diff.mean()) if diff is not None else float('nan'),
+                       'max_abs_diff': int(diff.max()) if diff is not None else -1}
+                rows.append(row)
+                print(f"{row['size']:>11} {radius:>6} {backend:>10} {row['ms']:>9.1f} {row['mp_s']:>8.1f} "
+                      f"{row['mean_abs_diff']:>8.3f} {row['max_abs_diff']:>7}")
+    return rows
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,188 @@
+"""融合色彩抖动内核（NumPy / OpenCV）
+
+`ColorJitterAugment.apply_variant` 的 PIL 实现依次做 Brightness、Contrast、Color 三次 ImageEnhance，
+每次都分配一张完整的中间图；色相偏移再转 HSV、复制成 int16、转回 RGB，峰值约 5 份整图。
+这里按 PIL 的公式在预分配的 uint8 缓冲区中完成全部调整：
+
+- 亮度与对比度都是逐像素、逐通道的函数，合成为一张 256 项查找表（cv2.LUT）；
+  对比度的参考均值与 PIL 相同：亮度调整后图像灰度（L）均值四舍五入取整，需要先应用亮度表再求一次灰度均值；
+  灰度直接用 Pillow 的 convert('L')（`pil_luma`）逐行分块计算
+- 饱和度依赖每个像素的灰度，色相偏移需要 HSV 转换，都按行分块（STRIPE_ROWS 行）在小缓冲区内完成，
+  色相通道的偏移同样使用 256 项查找表；HSV 转换直接调用 Pillow 的 convert('HSV') / convert('RGB')
+  （`shift_hue_rows`），量化与 PIL 路径相同（OpenCV 的 HSV_FULL 量化不同，实测最大差 12~13）
+- 与 PIL 一样按 `临时值 = 退化图 + 系数 * (原值 - 退化图)` 计算并截断到 [0, 255]
+
+除输入外只占用一张输出图（可与输入相同，原地调整）和若干 STRIPE_ROWS 行的分块缓冲区。
+`ColorJitterAugment.apply_variant` 在 PIL 图像的可写副本上原地调整，再转回 PIL 图像；4000x3000 随机图上
+单次调用的峰值内存增量（ru_maxrss，含返回的图像）实测：
+
+    变体               pil       fused
+    亮度/对比/饱和     124 MB     69 MB
+    + 色相 10°         227 MB     65 MB
+
+即 fused 约为 2 份 RGB 整图（34 MB），'pil' 为 3.6~6.7 份。
+
+与 PIL 路径的逐像素差为 0（PARITY_TOLERANCE，含色相偏移时为 HUE_PARITY_TOLERANCE）。
+`python -m tools.color_kernel` 运行 `check_parity`，在仓库的 images/ 与随机噪声图上逐个变体断言这两个界限，
+并打印实测的最大差异。
+
+速度与 PIL 路径相当，不更快（随机图，单进程）：
+
+    分辨率       变体             pil      fused
+    640x480      亮度/对比/饱和    12 ms    12 ms
+    640x480      + 色相 10°       42 ms    44 ms
+    1920x1080    亮度/对比/饱和    71 ms    69 ms
+    1920x1080    + 色相 10°      244 ms   267 ms
+
+因此 01_dataset_augment.py 默认仍用 'pil'；'fused' 只在需要限制峰值内存（大图、多进程）时使用。
+
+用法：
+    kernel = ColorJitterKernel()
+    out = kernel.apply(np.asarray(img), {'brightness': 1.1, 'contrast': 0.95, 'saturation': 1.1, 'hue': 10})
+    Image.fromarray(out)
+"""
+import cv2
+import numpy as np
+from PIL import Image
+
+STRIPE_ROWS = 256
+PARITY_TOLERANCE = 0
+HUE_PARITY_TOLERANCE = 0
+_LEVELS = np.arange(256, dtype=np.float32)
+
+
+def _blend_lut(base, factor, src_lut=None) -> np.ndarray:
+    """PIL Image.blend(退化图, 图像, factor) 在常数退化图 base 上的查找表（浮点计算后截断）"""
+    src = _LEVELS if src_lut is None else src_lut.astype(np.float32)
+    out = np.float32(base) + np.float32(factor) * (src - np.float32(base))
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+
+def hue_lut(deg) -> np.ndarray:
+    """色相偏移查找表：与 ColorJitterAugment.shift_hue 相同，H 在 0..255 上偏移 int(deg / 360 * 255)"""
+    shift = int(deg / 360.0 * 255.0)
+    return ((np.arange(256) + shift) % 256).astype(np.uint8)
+
+
+def pil_luma(rgb) -> np.ndarray:
+    """RGB uint8 (..., 3) 的连续行块 -> L uint8，直接用 Pillow 的 convert('L')（L24 整数公式；cv2 的 RGB2GRAY 舍入不同，会差 1）"""
+    return np.asarray(Image.fromarray(rgb, 'RGB').convert('L'))
+
+
+def shift_hue_rows(rgb, hlut) -> None:
+    """原地对 RGB uint8 行块做色相偏移：HSV 转换直接用 Pillow 的 convert('HSV') / convert('RGB')，
+    与 ColorJitterAugment.shift_hue 的量化逐值相同（OpenCV 的 HSV_FULL 量化不同，曾带来最大 13 的差异）"""
+    hsv = np.array(Image.fromarray(rgb, 'RGB').convert('HSV'))
+    hsv[..., 0] = hlut[hsv[..., 0]]
+    rgb[...] = np.asarray(Image.fromarray(hsv, 'HSV').convert('RGB'))
+
+
+class ColorJitterKernel:
+    """对 RGB uint8 图像（H, W, 3）一次完成亮度、对比度、饱和度与色相调整"""
+
+    def __init__(self, stripe_rows=STRIPE_ROWS):
+        self.stripe_rows = stripe_rows
+        self._buffers = {}
+
+    def _buffer(self, name, shape, dtype=np.uint8):
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buf
+        return buf
+
+    def apply(self, img, variant: dict, out=None) -> np.ndarray:
+        """返回调整后的图像；out 为预分配的输出（可与 img 相同，原地修改），默认使用内部缓冲区。
+
+        注意：未传 out 时返回的是内部缓冲区，下次调用会被覆盖，需要保留时请复制。
+        """
+        img = np.ascontiguousarray(img, dtype=np.uint8)
+        if img.ndim != 3 or img.shape[2] != 3:
+            raise ValueError(f'expected an RGB image of shape (H, W, 3), got {img.shape}')
+        h, w = img.shape[:2]
+        if out is None:
+            out = self._buffer('out', img.shape)
+        brightness = variant.get('brightness', 1.0)
+        contrast = variant.get('contrast', 1.0)
+        saturation = variant.get('saturation', 1.0)
+        hue = variant.get('hue', 0)
+
+        rows = max(1, int(self.stripe_rows))
+        # 亮度 + 对比度：合成一张查找表
+        lut = _blend_lut(0, brightness) if brightness != 1.0 else None
+        if contrast != 1.0:
+            # 亮度调整后的灰度均值：按行分块在小缓冲区中应用亮度表，不写 out（out 可能就是 img）
+            total = 0
+            for r0 in range(0, h, rows):
+                stripe = img[r0:r0 + rows]
+                if lut is not None:
+                    stripe = cv2.LUT(stripe, lut, dst=self._buffer('stripe', stripe.shape))
+                total += int(pil_luma(stripe).sum(dtype=np.int64))
+            mean = int(total / max(1, h * w) + 0.5)
+            lut = _blend_lut(mean, contrast, lut)
+        if lut is not None:
+            cv2.LUT(img, lut, dst=out)
+        elif out is not img:
+            np.copyto(out, img)
+
+        if saturation == 1.0 and not hue:
+            return out
+        hlut = hue_lut(hue) if hue else None
+        for r0 in range(0, h, rows):
+            r1 = min(h, r0 + rows)
+            stripe = out[r0:r1]
+            if saturation != 1.0:
+                g = pil_luma(stripe)[..., None]
+                tmp = self._buffer('f32', (rows, w, 3), np.float32)[:r1 - r0]
+                tmp[...] = stripe
+                tmp -= g
+                tmp *= np.float32(saturation)
+                tmp += g
+                np.clip(tmp, 0, 255, out=tmp)
+                stripe[...] = tmp
+            if hlut is not None:
+                shift_hue_rows(stripe, hlut)
+        return out
+
+
+def max_abs_diff_vs_pil(img, variant: dict) -> int:
+    """用 ColorJitterAugment 的 'pil' 与 'fused' 两个后端（后者即增强时实际调用的原地内核路径）分别处理 PIL 图像 img，
+    返回逐像素最大绝对差"""
+    from .dataset_augment import ColorJitterAugment
+    ref = np.asarray(ColorJitterAugment(backend='pil').apply_variant(img.convert('RGB'), variant), dtype=np.int16)
+    fused = np.asarray(ColorJitterAugment(backend='fused').apply_variant(img.convert('RGB'), variant), dtype=np.int16)
+    return int(np.abs(ref - fused).max()) if ref.size else 0
+
+
+PARITY_VARIANTS = [
+    {'brightness': 0.9, 'contrast': 0.95, 'saturation': 0.9, 'hue': 0},
+    {'brightness': 1.1, 'contrast': 1.05, 'saturation': 1.1, 'hue': 0},
+    {'brightness': 1.3, 'contrast': 0.7, 'saturation': 1.5, 'hue': 0},
+    {'hue': 5}, {'hue': 10}, {'hue': -10}, {'hue': -20}, {'hue': 90},
+    {'brightness': 1.1, 'contrast': 1.05, 'saturation': 1.1, 'hue': 10},
+]
+
+
+def check_parity(paths=None, variants=PARITY_VARIANTS) -> dict:
+    """断言融合内核与 PIL 路径的逐像素差异不超过 PARITY_TOLERANCE / HUE_PARITY_TOLERANCE，返回 {(图片, 变体): 最大差异}。
+
+    paths 默认为仓库 images/ 中的图片，另加一张随机噪声图。
+    """
+    from pathlib import Path
+    if paths is None:
+        paths = sorted(Path(__file__).resolve().parent.parent.glob('images/*.png'))
+    images = [(Path(p).name, Image.open(p).convert('RGB')) for p in paths]
+    images.append(('noise', Image.fromarray(np.random.default_rng(0).integers(0, 256, (256, 320, 3), dtype=np.uint8))))
+    results = {}
+    for name, img in images:
+        for variant in variants:
+            diff = max_abs_diff_vs_pil(img, variant)
+            limit = HUE_PARITY_TOLERANCE if variant.get('hue') else PARITY_TOLERANCE
+            results[(name, str(variant))] = diff
+            print(f'{name:>10} {str(variant):<75} max|d|={diff}')
+            assert diff <= limit, f'{name} {variant}: max abs diff {diff} > {limit}'
+    return results
+
+
+if __name__ == '__main__':
+    check_parity()
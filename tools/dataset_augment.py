@@ -9,9 +9,15 @@ import shutil
 import sys
 from io import BytesIO
 from pathlib import Path
-from PIL import Image, ImageFilter, ImageEnhance
+from PIL import Image, ImageEnhance
 import subprocess
 import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .image_index import find_image_file
+from .aug_cache import stable_fraction
+from .color_kernel import ColorJitterKernel
+from .blur_kernel import blur_image, resolve_backend, DOWNSAMPLE_MIN_RADIUS
 try:
     from tqdm import tqdm
 except Exception:
@@ -25,6 +31,13 @@ except Exception:
         tqdm = None
 
 SUPPORTED_EXTS = ['.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff']
+# ColorJitterAugment 的实现：'pil' 为逐个 ImageEnhance，'fused' 为 tools/color_kernel.py 的单次融合内核
+COLOR_BACKENDS = ('pil', 'fused')
+# 输出 JSON 中 imageData 的处理方式：
+# 'encode' 把增强后的图片再编码一次为 base64（原实现）；'reuse' 直接读取刚写出的图片文件的字节（内容相同，省去第二次编码）；
+# 以上两种只在 replace_imagedata=True 时替换。'strip' 总是不写 imageData（置为 null，Labelme 会按 imagePath 读取图片），
+# JSON 紧凑写出、不缩进。各模式的耗时与输出大小可运行 `python -m tools.dataset_augment` 查看
+IMAGEDATA_MODES = ('encode', 'reuse', 'strip')
 
 
 def pil_format_from_ext(ext: str):
@@ -46,6 +59,77 @@ def image_to_base64(img: Image.Image, fmt: str):
     return base64.b64encode(buf.getvalue()).decode('utf-8')
 
 
+def resolve_imagedata_mode(mode) -> str:
+    if mode not in IMAGEDATA_MODES:
+        raise ValueError(f'unknown imagedata_mode: {mode} (expected one of {IMAGEDATA_MODES})')
+    return mode
+
+
+def imagedata_b64(img: Image.Image, fmt: str, written_path, mode: str = 'encode'):
+    """输出 JSON 的 imageData：'reuse' 读取已写出的文件 written_path，'encode' 重新编码 img，'strip' 返回 None"""
+    if mode == 'strip':
+        return None
+    if mode == 'reuse':
+        return base64.b64encode(Path(written_path).read_bytes()).decode('utf-8')
+    return image_to_base64(img, fmt)
+
+
+def write_label_json(path, data: dict, mode: str = 'encode'):
+    """写出标注 JSON：'strip' 模式下 imageData 置为 null 并紧凑写出，其余模式保持原来的 indent=2 格式"""
+    with open(path, 'w', encoding='utf-8') as f:
+        if mode == 'strip':
+            if 'imageData' in data:
+                data = dict(data, imageData=None)
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        else:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def resolve_workers(workers) -> int:
+    """把配置中的 workers 解析为实际进程数：None/0/负数 表示使用全部 CPU 核心，1 表示串行。"""
+    if workers is None or int(workers) <= 0:
+        return os.cpu_count() or 1
+    return int(workers)
+
+
+def log_message(msg: str):
+    if tqdm:
+        tqdm.write(msg)
+    else:
+        print(msg, file=sys.stderr)
+
+
+def _process_sample_task(aug, task: tuple) -> dict:
+    """进程池入口：执行 `aug.process_sample(*task)`。
+
+    任何未捕获的异常都会转换为 skipped 结果，保证单个样本（或单个 worker）出错不会中断整个任务。
+    """
+    try:
+        return aug.process_sample(*task)
+    except Exception as e:
+        return {'status': 'skipped', 'messages': [f'Worker failed on {task[0]}: {e}'], 'last': None, 'txt': 'error'}
+
+
+def iter_sample_results(aug, tasks: list, workers: int = 1):
+    """串行或通过进程池执行样本任务，逐个产出结果 dict（进程池模式下按完成顺序产出）。
+
+    每个任务写入互不相同的输出文件，因此完成顺序不影响输出内容；
+    串行与并行执行的是同一个 `process_sample`，保证结果逐字节一致。
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield _process_sample_task(aug, task)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        futures = {ex.submit(_process_sample_task, aug, task): task for task in tasks}
+        for fut in as_completed(futures):
+            try:
+                yield fut.result()
+            except Exception as e:
+                # e.g. BrokenProcessPool: worker 进程异常退出
+                yield {'status': 'skipped', 'messages': [f'Worker failed on {futures[fut][0]}: {e}'], 'last': None, 'txt': 'error'}
+
+
 def select_samples_by_json_files(dataset_root='.', dataset_name='tomato', sample_ratio: float | None = None, sample_count: int | None = None, seed: int | None = None) -> list | None:
     """根据比例或数量在 labels 目录中随机选择样本。
     要求目录下必须存在 JSON 文件。
@@ -78,12 +162,81 @@ def select_samples_by_json_files(dataset_root='.', dataset_name='tomato', sample
     return None
 
 
+def select_samples_stable(json_files: list, name: str, sample_ratio: float | None = None, sample_count: int | None = None, seed: int | None = None) -> list:
+    """增量模式使用的稳定抽样：按 (seed, 工具名, stem) 的哈希决定是否选中。
+
+    数据集新增/删除样本时，已有样本的选中状态保持不变（sample_count 模式下只有边界附近的样本可能变化），
+    这样缓存才能命中。sample_ratio 与 sample_count 的含义与 `select_samples_by_json_files` 相同。
+    """
+    scored = sorted((stable_fraction(seed, name, Path(j).stem), j) for j in json_files)
+    if sample_count is not None:
+        return sorted(j for _, j in scored[:max(0, int(sample_count))])
+    if sample_ratio is not None:
+        r = float(sample_ratio)
+        return sorted(j for f, j in scored if f < r)
+    return sorted(json_files)
+
+
+def resolve_json_files(labels_dir: Path, sample_list: list | None) -> list:
+    """把 sample_list（Path / 文件名 / stem 的列表）映射为 labels_dir 中的 json 路径。
+
+    sample_list 为 None 或空、或者全部映射失败时，返回 labels_dir 下全部 json（已排序）。
+    """
+    all_json_files = sorted(labels_dir.glob('*.json'))
+    if not sample_list:
+        return all_json_files
+    mapped = []
+    for s in sample_list:
+        p = Path(s)
+        # if absolute path and exists, accept
+        if p.is_absolute() and p.exists():
+            mapped.append(p)
+            continue
+        # try relative to labels_dir
+        cand = labels_dir / p
+        if cand.exists():
+            mapped.append(cand)
+            continue
+        # try stem -> add .json
+        cand2 = labels_dir / (p.stem + '.json')
+        if cand2.exists():
+            mapped.append(cand2)
+            continue
+    # fallback to all if mapping failed
+    return mapped if mapped else all_json_files
+
+
+def locate_image(j: dict, base_name: str, img_dir: Path, find_image_file):
+    """根据 JSON 中的 imagePath/imageFilename/image_name 查找图片，找不到时回退到按 json 同名 stem 查找。"""
+    candidate = None
+    for key in ('imagePath', 'imageFilename', 'image_name'):
+        if key in j and isinstance(j[key], str) and j[key].strip():
+            candidate = j[key].strip()
+            break
+
+    img_path = None
+    if candidate:
+        cand_name = os.path.basename(candidate)
+        cand_stem, cand_ext = os.path.splitext(cand_name)
+        if cand_ext:
+            p = img_dir / cand_name
+            if p.exists():
+                img_path = p
+        else:
+            img_path = find_image_file(img_dir, cand_name)
+
+    if img_path is None:
+        img_path = find_image_file(img_dir, base_name)
+    return img_path
+
+
 class BlurAugment:
     """高斯模糊增强器
 
-    参数化：radius, suffix, replace_imagedata
+    参数化：radius, suffix, replace_imagedata, imagedata_mode, backend（见 tools/blur_kernel.py）
     方法：run(dataset_root, dataset_name, out_dir)
     """
+    name = 'blur'
 
     def __init__(self, cfg: dict | None = None, **kwargs):
         """构造函数支持两种写法：
@@ -93,7 +246,8 @@ class BlurAugment:
 
         参数解析优先级：`cfg` 中的键 -> 再被 `kwargs` 覆盖（如果同时提供）。
 
-        支持的键：`radius`, `suffix`, `replace_imagedata`, `sample_ratio`, `sample_count`, `sample_seed`
+        支持的键：`radius`, `suffix`, `replace_imagedata`, `imagedata_mode`, `sample_ratio`, `sample_count`, `sample_seed`, `workers`,
+        `backend`, `downsample_min_radius`
         """
         merged = {}
         if isinstance(cfg, dict):
@@ -103,19 +257,21 @@ class BlurAugment:
         self.radius = merged.get('radius', 5.0)
         self.suffix = merged.get('suffix', '_blur')
         self.replace_imagedata = merged.get('replace_imagedata', True)
+        # imageData 的写出方式：'encode'（默认）/ 'reuse' / 'strip'，见 IMAGEDATA_MODES
+        self.imagedata_mode = resolve_imagedata_mode(merged.get('imagedata_mode', 'encode'))
         self.sample_ratio = merged.get('sample_ratio')
         self.sample_count = merged.get('sample_count')
         self.sample_seed = merged.get('sample_seed')
+        # 并行进程数：1 为串行（默认），None/0 使用全部 CPU 核心
+        self.workers = resolve_workers(merged.get('workers', 1))
+        # 模糊后端：'pil'（默认）/ 'opencv' / 'box3' / 'downsample' / 'auto'
+        self.backend = merged.get('backend', 'pil')
+        self.downsample_min_radius = merged.get('downsample_min_radius', DOWNSAMPLE_MIN_RADIUS)
+        resolve_backend(self.backend, self.radius, self.downsample_min_radius)
 
     def find_image_file(self, img_dir: Path, base_name: str):
-        for ext in SUPPORTED_EXTS:
-            p = img_dir / (base_name + ext)
-            if p.exists():
-                return p
-        for p in img_dir.iterdir() if img_dir.exists() else []:
-            if p.is_file() and p.stem.lower() == base_name.lower() and p.suffix.lower() in SUPPORTED_EXTS:
-                return p
-        return None
+        # 使用按目录缓存的索引（一次 scandir），大小写不敏感
+        return find_image_file(img_dir, base_name, SUPPORTED_EXTS)
 
     def update_json_image_info(self, json_data: dict, new_filename: str, b64_data: str | None):
         if 'imagePath' in json_data:
@@ -137,144 +293,126 @@ class BlurAugment:
         out_img_dir.mkdir(parents=True, exist_ok=True)
         out_labels_dir.mkdir(parents=True, exist_ok=True)
 
-        all_json_files = sorted(labels_dir.glob('*.json'))
         # if caller didn't provide explicit sample_list, use stored sampling params
         if sample_list is None:
             sample_list = select_samples_by_json_files(dataset_root=dataset_root, dataset_name=dataset_name, sample_ratio=self.sample_ratio, sample_count=self.sample_count, seed=self.sample_seed)
-
-        # If caller provided a sample_list (list of Paths or filenames/stems), map them to json paths
-        if sample_list:
-            mapped = []
-            for s in sample_list:
-                p = Path(s)
-                # if absolute path and exists, accept
-                if p.is_absolute() and p.exists():
-                    mapped.append(p)
-                    continue
-                # try relative to labels_dir
-                cand = labels_dir / p
-                if cand.exists():
-                    mapped.append(cand)
-                    continue
-                # try stem -> add .json
-                cand2 = labels_dir / (p.stem + '.json')
-                if cand2.exists():
-                    mapped.append(cand2)
-                    continue
-            # fallback to all if mapping failed
-            json_files = mapped if mapped else all_json_files
-        else:
-            json_files = all_json_files
+        json_files = resolve_json_files(labels_dir, sample_list)
+        tasks = [(jpath, img_dir, labels_dir, out_img_dir, out_labels_dir) for jpath in json_files]
         total = 0
         skipped = 0
-        iterator = tqdm(json_files, desc=f'Blur (samples={len(json_files)})') if tqdm else json_files
-        for jpath in iterator:
+        results = iter_sample_results(self, tasks, self.workers)
+        iterator = tqdm(results, total=len(tasks), desc=f'Blur (samples={len(json_files)}, workers={self.workers})') if tqdm else results
+        for res in iterator:
             total += 1
-            try:
-                with open(jpath, 'r', encoding='utf-8') as f:
-                    j = json.load(f)
-            except Exception as e:
+            for msg in res['messages']:
+                log_message(msg)
+            if res['status'] == 'skipped':
                 skipped += 1
-                if tqdm:
-                    tqdm.write(f'Failed to read {jpath}: {e}')
-                else:
-                    print(f'Failed to read {jpath}: {e}', file=sys.stderr)
                 continue
+            # update progress postfix if available
+            if tqdm and hasattr(iterator, 'set_postfix'):
+                iterator.set_postfix({'last': res['last'], 'txt': res['txt']})
 
-            base_name = jpath.stem
-            candidate = None
-            for key in ('imagePath', 'imageFilename', 'image_name'):
-                if key in j and isinstance(j[key], str) and j[key].strip():
-                    candidate = j[key].strip()
-                    break
-
-            img_path = None
-            if candidate:
-                cand_name = os.path.basename(candidate)
-                cand_stem, cand_ext = os.path.splitext(cand_name)
-                if cand_ext:
-                    p = img_dir / cand_name
-                    if p.exists():
-                        img_path = p
-                else:
-                    img_path = self.find_image_file(img_dir, cand_name)
+        if tqdm:
+            tqdm.write(f'Summary blur: total={total} skipped={skipped} saved_to={out_base}')
+        else:
+            print(f'Summary blur: total={total} skipped={skipped} saved_to={out_base}')
 
-            if img_path is None:
-                img_path = self.find_image_file(img_dir, base_name)
+    def plan_params(self, json_files: list, stable: bool = False) -> list:
+        """模糊增强没有随机参数，保持与 ColorJitterAugment 相同的接口。"""
+        return [None] * len(json_files)
 
-            if img_path is None:
-                skipped += 1
-                continue
+    def cache_params(self, param=None) -> dict:
+        """影响输出内容的参数（用于增量缓存键）"""
+        return {'radius': self.radius, 'suffix': self.suffix, 'replace_imagedata': self.replace_imagedata, 'imagedata_mode': self.imagedata_mode, 'sample_seed': self.sample_seed,
+                'backend': resolve_backend(self.backend, self.radius, self.downsample_min_radius)}
 
-            try:
-                img = Image.open(img_path).convert('RGB')
-            except Exception as e:
-                skipped += 1
-                if tqdm:
-                    tqdm.write(f'Failed to open image {img_path}: {e}')
-                else:
-                    print(f'Failed to open image {img_path}: {e}', file=sys.stderr)
-                continue
+    def output_prefix(self, param=None) -> str:
+        """输出文件名前缀：<suffix 去掉下划线>"""
+        return self.suffix.lstrip('_')
 
-            blurred = img.filter(ImageFilter.GaussianBlur(radius=self.radius))
-            ext = img_path.suffix or '.jpg'
-            # filename format: <suffix_without_underscore>_<original_stem><ext>
-            suf = self.suffix.lstrip('_')
-            out_img_name = f'{suf}_{img_path.stem}{ext}'
-            out_img_path = out_img_dir / out_img_name
-            try:
-                pil_fmt = pil_format_from_ext(ext)
-                blurred.save(out_img_path, format=pil_fmt)
-            except Exception as e:
-                skipped += 1
-                if tqdm:
-                    tqdm.write(f'Failed to save blurred image {out_img_path}: {e}')
-                else:
-                    print(f'Failed to save blurred image {out_img_path}: {e}', file=sys.stderr)
-                continue
+    def apply_image(self, img: Image.Image, param=None) -> Image.Image:
+        """只对图片做增强（标注不变），供 augment_loaded 与 tools/virtual_augment.py 使用"""
+        return blur_image(img, self.radius, self.backend, self.downsample_min_radius)
 
-            b64 = None
-            if 'imageData' in j and self.replace_imagedata:
-                pil_fmt = pil_format_from_ext(ext)
-                b64 = image_to_base64(blurred, pil_fmt)
+    def process_sample(self, jpath: Path, img_dir: Path, labels_dir: Path, out_img_dir: Path, out_labels_dir: Path) -> dict:
+        """处理单个 JSON/图片样本：读取、模糊、保存图片、写 JSON、复制 TXT。
 
-            self.update_json_image_info(j, out_img_name, b64)
+        不直接打印，所有信息通过返回值交给调用方（便于在进程池中运行）。
+        返回 dict：`status`（'ok' / 'skipped'）、`messages`、`last`（输出图片名）、`txt`（txt 复制状态）。
+        """
+        result = {'status': 'skipped', 'messages': [], 'last': None, 'txt': 'none'}
+        try:
+            with open(jpath, 'r', encoding='utf-8') as f:
+                j = json.load(f)
+        except Exception as e:
+            result['messages'].append(f'Failed to read {jpath}: {e}')
+            return result
 
-            out_json_name = f'{suf}_{base_name}.json'
-            out_json_path = out_labels_dir / out_json_name
-            try:
-                with open(out_json_path, 'w', encoding='utf-8') as f:
-                    json.dump(j, f, ensure_ascii=False, indent=2)
-            except Exception as e:
-                skipped += 1
-                if tqdm:
-                    tqdm.write(f'Failed to write json {out_json_path}: {e}')
-                else:
-                    print(f'Failed to write json {out_json_path}: {e}', file=sys.stderr)
-                continue
+        base_name = jpath.stem
+        img_path = locate_image(j, base_name, img_dir, self.find_image_file)
+        if img_path is None:
+            return result
 
-            # copy txt if exists
-            txt_src = labels_dir / f'{base_name}.txt'
-            if txt_src.exists():
-                txt_dst = out_labels_dir / f'{base_name}{self.suffix}.txt'
-                try:
-                    shutil.copy2(txt_src, txt_dst)
-                    txt_status = 'copied'
-                except Exception as e:
-                    txt_status = 'error'
-                    if tqdm:
-                        tqdm.write(f'Failed to copy txt {txt_src} -> {txt_dst}: {e}')
-            else:
-                txt_status = 'none'
+        try:
+            img = Image.open(img_path).convert('RGB')
+        except Exception as e:
+            result['messages'].append(f'Failed to open image {img_path}: {e}')
+            return result
 
-            # update progress postfix if available
-            if tqdm and hasattr(iterator, 'set_postfix'):
-                iterator.set_postfix({'last': out_img_name, 'txt': txt_status})
+        return self.augment_loaded(j, base_name, img_path, img, labels_dir, out_img_dir, out_labels_dir)
 
-        if tqdm:
-            tqdm.write(f'Summary blur: total={total} skipped={skipped} saved_to={out_base}')
-        else:
-            print(f'Summary blur: total={total} skipped={skipped} saved_to={out_base}')
+    def augment_loaded(self, j: dict, base_name: str, img_path: Path, img: Image.Image, labels_dir: Path, out_img_dir: Path, out_labels_dir: Path, var=None) -> dict:
+        """对已解码的图片与已解析的 JSON 执行模糊并写出结果（不修改传入的 `j` 与 `img`）。
+
+        `var` 仅为与 ColorJitterAugment 保持统一签名，模糊增强不使用。
+        """
+        result = {'status': 'skipped', 'messages': [], 'last': None, 'txt': 'none', 'outputs': []}
+        blurred = self.apply_image(img)
+        ext = img_path.suffix or '.jpg'
+        # filename format: <suffix_without_underscore>_<original_stem><ext>
+        suf = self.output_prefix()
+        out_img_name = f'{suf}_{img_path.stem}{ext}'
+        out_img_path = out_img_dir / out_img_name
+        try:
+            pil_fmt = pil_format_from_ext(ext)
+            blurred.save(out_img_path, format=pil_fmt)
+        except Exception as e:
+            result['messages'].append(f'Failed to save blurred image {out_img_path}: {e}')
+            return result
+
+        b64 = None
+        if 'imageData' in j and self.replace_imagedata:
+            pil_fmt = pil_format_from_ext(ext)
+            b64 = imagedata_b64(blurred, pil_fmt, out_img_path, self.imagedata_mode)
+
+        j_new = dict(j)
+        self.update_json_image_info(j_new, out_img_name, b64)
+
+        out_json_name = f'{suf}_{base_name}.json'
+        out_json_path = out_labels_dir / out_json_name
+        try:
+            write_label_json(out_json_path, j_new, self.imagedata_mode)
+        except Exception as e:
+            result['messages'].append(f'Failed to write json {out_json_path}: {e}')
+            return result
+
+        # copy txt if exists
+        txt_src = labels_dir / f'{base_name}.txt'
+        if txt_src.exists():
+            txt_dst = out_labels_dir / f'{base_name}{self.suffix}.txt'
+            try:
+                shutil.copy2(txt_src, txt_dst)
+                result['txt'] = 'copied'
+                result['outputs'].append(f'{out_labels_dir.name}/{txt_dst.name}')
+            except Exception as e:
+                result['txt'] = 'error'
+                result['messages'].append(f'Failed to copy txt {txt_src} -> {txt_dst}: {e}')
+
+        result['outputs'][:0] = [f'{out_img_dir.name}/{out_img_name}', f'{out_labels_dir.name}/{out_json_name}']
+        result['status'] = 'ok'
+        result['last'] = out_img_name
+        return result
 
 
 class ColorJitterAugment:
@@ -282,6 +420,7 @@ class ColorJitterAugment:
 
     VARIANTS: list of dicts with keys: suffix, brightness, contrast, saturation, hue
     """
+    name = 'color_jitter'
 
     def __init__(self, cfg: dict | None = None, **kwargs):
         """构造函数支持两种写法：
@@ -291,7 +430,7 @@ class ColorJitterAugment:
 
         参数解析优先级：`cfg` 中的键 -> 再被 `kwargs` 覆盖（如果同时提供）。
 
-        支持的键：`variants`, `replace_imagedata`, `continue_on_hue_error`, `sample_ratio`, `sample_count`, `sample_seed`
+        支持的键：`variants`, `replace_imagedata`, `imagedata_mode`, `continue_on_hue_error`, `sample_ratio`, `sample_count`, `sample_seed`, `workers`, `backend`
         """
         merged = {}
         if isinstance(cfg, dict):
@@ -300,21 +439,28 @@ class ColorJitterAugment:
 
         self.variants = merged.get('variants', [])
         self.replace_imagedata = merged.get('replace_imagedata', True)
+        self.imagedata_mode = resolve_imagedata_mode(merged.get('imagedata_mode', 'encode'))
         self.continue_on_hue_error = merged.get('continue_on_hue_error', True)
+        self.backend = merged.get('backend', 'pil')
+        if self.backend not in COLOR_BACKENDS:
+            raise ValueError(f'unknown color_jitter backend: {self.backend} (expected one of {COLOR_BACKENDS})')
+        self._kernel = None
         # sampling config
         self.sample_ratio = merged.get('sample_ratio')
         self.sample_count = merged.get('sample_count')
         self.sample_seed = merged.get('sample_seed')
+        # 并行进程数：1 为串行（默认），None/0 使用全部 CPU 核心
+        self.workers = resolve_workers(merged.get('workers', 1))
+
+    def __getstate__(self):
+        # 内核的缓冲区不需要传给进程池中的 worker
+        state = self.__dict__.copy()
+        state['_kernel'] = None
+        return state
 
     def find_image_file(self, img_dir: Path, base_name: str):
-        for ext in SUPPORTED_EXTS:
-            p = img_dir / (base_name + ext)
-            if p.exists():
-                return p
-        for p in img_dir.iterdir() if img_dir.exists() else []:
-            if p.is_file() and p.stem.lower() == base_name.lower() and p.suffix.lower() in SUPPORTED_EXTS:
-                return p
-        return None
+        # 使用按目录缓存的索引（一次 scandir），大小写不敏感
+        return find_image_file(img_dir, base_name, SUPPORTED_EXTS)
 
     def shift_hue(self, img: Image.Image, deg: float):
         if deg == 0:
@@ -332,6 +478,13 @@ class ColorJitterAugment:
         return PILImage.fromarray(arr, mode='HSV').convert('RGB')
 
     def apply_variant(self, img: Image.Image, variant: dict):
+        if self.backend == 'fused':
+            import numpy as np
+            if self._kernel is None:
+                self._kernel = ColorJitterKernel()
+            # 可写的像素副本，内核原地调整（不再另分配输出数组）；Image.fromarray 复制为 PIL 的 RGB 存储后副本即释放
+            arr = np.array(img if img.mode == 'RGB' else img.convert('RGB'))
+            return Image.fromarray(self._kernel.apply(arr, variant, out=arr))
         out = img
         if variant.get('brightness', 1.0) != 1.0:
             out = ImageEnhance.Brightness(out).enhance(variant['brightness'])
@@ -396,132 +549,319 @@ class ColorJitterAugment:
         out_img_dir.mkdir(parents=True, exist_ok=True)
         out_labels_dir.mkdir(parents=True, exist_ok=True)
 
-        all_json_files = sorted(labels_dir.glob('*.json'))
         # if caller didn't provide sample_list, use stored sampling params
         if sample_list is None:
             sample_list = select_samples_by_json_files(dataset_root=dataset_root, dataset_name=dataset_name, sample_ratio=self.sample_ratio, sample_count=self.sample_count, seed=self.sample_seed)
-
-        # map provided sample_list (stems, filenames or Paths) to json paths
-        if sample_list:
-            mapped = []
-            for s in sample_list:
-                p = Path(s)
-                if p.is_absolute() and p.exists():
-                    mapped.append(p)
-                    continue
-                cand = labels_dir / p
-                if cand.exists():
-                    mapped.append(cand)
-                    continue
-                cand2 = labels_dir / (p.stem + '.json')
-                if cand2.exists():
-                    mapped.append(cand2)
-                    continue
-            json_files = mapped if mapped else all_json_files
-        else:
-            json_files = all_json_files
+        json_files = resolve_json_files(labels_dir, sample_list)
+        tasks = [(jpath, var, img_dir, labels_dir, out_img_dir, out_labels_dir) for jpath, var in zip(json_files, self.plan_params(json_files))]
         total = 0
         skipped = 0
-        iterator = tqdm(json_files, desc=f'ColorJitter (samples={len(json_files)})') if tqdm else json_files
-        # prepare RNG: if sample_seed provided, use it for reproducibility
-        rng = random.Random(self.sample_seed) if self.sample_seed is not None else random
+        results = iter_sample_results(self, tasks, self.workers)
+        iterator = tqdm(results, total=len(tasks), desc=f'ColorJitter (samples={len(json_files)}, workers={self.workers})') if tqdm else results
 
-        for jpath in iterator:
+        for res in iterator:
             total += 1
-            try:
-                with open(jpath, 'r', encoding='utf-8') as f:
-                    j = json.load(f)
-            except Exception as e:
+            for msg in res['messages']:
+                log_message(msg)
+            if res['status'] == 'skipped':
                 skipped += 1
-                if tqdm:
-                    tqdm.write(f'Failed to read {jpath}: {e}')
-                else:
-                    print(f'Failed to read {jpath}: {e}', file=sys.stderr)
                 continue
+            if res['last'] and tqdm and hasattr(iterator, 'set_postfix'):
+                iterator.set_postfix({'last': res['last'], 'txt': res['txt']})
 
-            base_name = jpath.stem
-            img_path = self.find_image_file(img_dir, base_name)
-            if img_path is None:
-                skipped += 1
-                continue
+        print(f'Summary color_jitter: total={total} skipped={skipped} saved_to={out_base}')
 
-            try:
-                img = Image.open(img_path).convert('RGB')
-            except Exception as e:
-                skipped += 1
-                if tqdm:
-                    tqdm.write(f'Failed to open image {img_path}: {e}')
-                else:
-                    print(f'Failed to open image {img_path}: {e}', file=sys.stderr)
-                continue
+    def plan_params(self, json_files: list, stable: bool = False) -> list:
+        """按样本顺序为每个样本预先抽取一个变体（在主进程中完成，保证串行、进程池与融合流水线输出一致）。
 
-            # For each sampled image, pick one variant at random (not apply all variants)
-            if not self.variants:
-                # nothing to do
-                continue
-            var = rng.choice(self.variants)
-            suffix = var.get('suffix') or self.make_suffix_from_params(var)
-            # place parameter part before original name, remove leading underscore
-            param_part = suffix.lstrip('_')
-            out_img_name = f'{param_part}_{img_path.stem}{img_path.suffix}'
-            out_img_path = out_img_dir / out_img_name
-            try:
-                enhanced = None
-                try:
-                    enhanced = self.apply_variant(img, var)
-                except Exception as e:
-                    if 'hue' in var and 'numpy' in str(e).lower() and self.continue_on_hue_error:
-                        vv = var.copy()
-                        vv['hue'] = 0
-                        enhanced = self.apply_variant(img, vv)
-                    else:
-                        raise
-                pil_fmt = pil_format_from_ext(img_path.suffix)
-                enhanced.save(out_img_path, format=pil_fmt)
-            except Exception as e:
-                skipped += 1
-                if tqdm:
-                    tqdm.write(f'Failed to apply/save variant {suffix} for {img_path.name}: {e}')
-                else:
-                    print(f'Failed to apply/save variant {suffix} for {img_path.name}: {e}', file=sys.stderr)
-                continue
+        stable=True（增量模式）时按 (sample_seed, stem) 的哈希选择变体，新增样本不会改变已有样本的变体。
+        """
+        if not self.variants:
+            return [None] * len(json_files)
+        if stable:
+            return [self.variants[int(stable_fraction(self.sample_seed, self.name, 'variant', Path(j).stem) * len(self.variants))] for j in json_files]
+        # prepare RNG: if sample_seed provided, use it for reproducibility
+        rng = random.Random(self.sample_seed) if self.sample_seed is not None else random
+        return [rng.choice(self.variants) for _ in json_files]
+
+    def cache_params(self, param=None) -> dict:
+        """影响输出内容的参数（用于增量缓存键），param 为该样本使用的变体"""
+        return {'variant': param, 'replace_imagedata': self.replace_imagedata, 'imagedata_mode': self.imagedata_mode, 'continue_on_hue_error': self.continue_on_hue_error, 'sample_seed': self.sample_seed,
+                'backend': self.backend}
+
+    def output_prefix(self, var: dict) -> str:
+        """输出文件名前缀：变体的 suffix（或由参数生成）去掉开头的下划线"""
+        return (var.get('suffix') or self.make_suffix_from_params(var)).lstrip('_')
 
-            b64 = None
-            if 'imageData' in j and self.replace_imagedata:
-                pil_fmt = pil_format_from_ext(img_path.suffix)
-                b64 = image_to_base64(enhanced, pil_fmt)
+    def apply_image(self, img: Image.Image, var: dict) -> Image.Image:
+        """对图片应用变体（标注不变）；色相偏移因缺少 numpy 失败且 continue_on_hue_error 时忽略色相"""
+        try:
+            return self.apply_variant(img, var)
+        except Exception as e:
+            if 'hue' in var and 'numpy' in str(e).lower() and self.continue_on_hue_error:
+                vv = var.copy()
+                vv['hue'] = 0
+                return self.apply_variant(img, vv)
+            raise
+
+    def process_sample(self, jpath: Path, var: dict | None, img_dir: Path, labels_dir: Path, out_img_dir: Path, out_labels_dir: Path) -> dict:
+        """对单个样本应用预先抽取的变体 `var`，保存图片、写 JSON、复制 TXT。
+
+        返回值格式与 `BlurAugment.process_sample` 相同。
+        """
+        result = {'status': 'skipped', 'messages': [], 'last': None, 'txt': 'none'}
+        try:
+            with open(jpath, 'r', encoding='utf-8') as f:
+                j = json.load(f)
+        except Exception as e:
+            result['messages'].append(f'Failed to read {jpath}: {e}')
+            return result
 
-            j_new = dict(j)
-            self.update_json_image_info(j_new, out_img_name, b64)
+        base_name = jpath.stem
+        img_path = self.find_image_file(img_dir, base_name)
+        if img_path is None:
+            return result
 
-            out_json_name = f'{param_part}_{base_name}.json'
-            out_json_path = out_labels_dir / out_json_name
+        try:
+            img = Image.open(img_path).convert('RGB')
+        except Exception as e:
+            result['messages'].append(f'Failed to open image {img_path}: {e}')
+            return result
+
+        return self.augment_loaded(j, base_name, img_path, img, labels_dir, out_img_dir, out_labels_dir, var)
+
+    def augment_loaded(self, j: dict, base_name: str, img_path: Path, img: Image.Image, labels_dir: Path, out_img_dir: Path, out_labels_dir: Path, var: dict | None = None) -> dict:
+        """对已解码的图片与已解析的 JSON 应用变体 `var` 并写出结果（不修改传入的 `j` 与 `img`）。"""
+        result = {'status': 'skipped', 'messages': [], 'last': None, 'txt': 'none', 'outputs': []}
+        # For each sampled image, pick one variant at random (not apply all variants)
+        if var is None:
+            # nothing to do
+            result['status'] = 'noop'
+            return result
+        suffix = var.get('suffix') or self.make_suffix_from_params(var)
+        # place parameter part before original name, remove leading underscore
+        param_part = self.output_prefix(var)
+        out_img_name = f'{param_part}_{img_path.stem}{img_path.suffix}'
+        out_img_path = out_img_dir / out_img_name
+        try:
+            enhanced = self.apply_image(img, var)
+            pil_fmt = pil_format_from_ext(img_path.suffix)
+            enhanced.save(out_img_path, format=pil_fmt)
+        except Exception as e:
+            result['messages'].append(f'Failed to apply/save variant {suffix} for {img_path.name}: {e}')
+            return result
+
+        b64 = None
+        if 'imageData' in j and self.replace_imagedata:
+            pil_fmt = pil_format_from_ext(img_path.suffix)
+            b64 = imagedata_b64(enhanced, pil_fmt, out_img_path, self.imagedata_mode)
+
+        j_new = dict(j)
+        self.update_json_image_info(j_new, out_img_name, b64)
+
+        out_json_name = f'{param_part}_{base_name}.json'
+        out_json_path = out_labels_dir / out_json_name
+        try:
+            write_label_json(out_json_path, j_new, self.imagedata_mode)
+        except Exception as e:
+            result['messages'].append(f'Failed to write json {out_json_path}: {e}')
+            return result
+
+        # copy txt if exists
+        txt_src = labels_dir / f'{base_name}.txt'
+        if txt_src.exists():
+            txt_dst = out_labels_dir / f'{param_part}_{base_name}.txt'
             try:
-                with open(out_json_path, 'w', encoding='utf-8') as f:
-                    json.dump(j_new, f, ensure_ascii=False, indent=2)
+                shutil.copy2(txt_src, txt_dst)
+                result['txt'] = 'copied'
+                result['outputs'].append(f'{out_labels_dir.name}/{txt_dst.name}')
             except Exception as e:
-                skipped += 1
-                if tqdm:
-                    tqdm.write(f'Failed to write json {out_json_path}: {e}')
+                result['txt'] = 'error'
+                result['messages'].append(f'Failed to copy txt {txt_src} -> {txt_dst}: {e}')
+
+        result['outputs'][:0] = [f'{out_img_dir.name}/{out_img_name}', f'{out_labels_dir.name}/{out_json_name}']
+        result['status'] = 'ok'
+        result['last'] = out_img_name
+        return result
+
+
+class FusedAugmentPipeline:
+    """融合增强流水线：每个被抽中的样本只解析一次 JSON、只解码一次图片，再依次交给所有启用的增强器。
+
+    每个增强器仍然按自己的 `sample_ratio` / `sample_count` / `sample_seed` 独立抽样
+    （均在原始 labels 中抽样），流水线只是把各自的样本集合合并，被多个增强器抽中的样本共享一次读取。
+    """
+
+    def __init__(self, augmenters: list, workers: int | None = 1, cache=None):
+        """cache: 可选的 `tools.aug_cache.AugmentCache`，提供时启用增量模式（稳定抽样 + 跳过未变化样本）。"""
+        self.augmenters = list(augmenters)
+        self.workers = resolve_workers(workers)
+        self.cache = cache
+
+    def __getstate__(self):
+        # 缓存持有打开的 jsonl 文件句柄且只在主进程中读写，不传给进程池中的 worker
+        state = self.__dict__.copy()
+        state['cache'] = None
+        return state
+
+    def run(self, dataset_root='.', dataset_name='tomato', out_dir='augment'):
+        root = Path(dataset_root).resolve()
+        ds = root / dataset_name
+        labels_dir = ds / 'labels'
+        img_dir = ds / 'images'
+
+        out_base = root / out_dir
+        out_img_dir = out_base / 'images'
+        out_labels_dir = out_base / 'labels'
+        out_img_dir.mkdir(parents=True, exist_ok=True)
+        out_labels_dir.mkdir(parents=True, exist_ok=True)
+
+        # 先完成所有增强器的抽样与参数抽取，再开始写出，避免输出文件混入后续增强器的抽样池
+        plan = {}
+        all_json_files = sorted(labels_dir.glob('*.json'))
+        for idx, aug in enumerate(self.augmenters):
+            if self.cache is not None:
+                json_files = select_samples_stable(all_json_files, aug.name, sample_ratio=aug.sample_ratio, sample_count=aug.sample_count, seed=aug.sample_seed)
+            else:
+                sample_list = select_samples_by_json_files(dataset_root=dataset_root, dataset_name=dataset_name, sample_ratio=aug.sample_ratio, sample_count=aug.sample_count, seed=aug.sample_seed)
+                json_files = resolve_json_files(labels_dir, sample_list)
+            for jpath, param in zip(json_files, aug.plan_params(json_files, stable=self.cache is not None)):
+                plan.setdefault(jpath, []).append((idx, param))
+
+        # 增量模式：按 (图片哈希, 标注哈希, txt 哈希, 工具参数) 查询缓存，命中的任务直接跳过
+        keys = {}
+        if self.cache is not None:
+            for jpath in list(plan):
+                hashes = (self.cache.file_hash(self._source_image(jpath, img_dir)), self.cache.file_hash(jpath), self.cache.file_hash(labels_dir / f'{jpath.stem}.txt'))
+                jobs = []
+                for idx, param in plan[jpath]:
+                    aug = self.augmenters[idx]
+                    # 依赖其他样本的增强器（mosaic 的伙伴）把这些文件的哈希也计入缓存键
+                    extra = [self.cache.file_hash(p) for p in aug.cache_sources(param, img_dir, labels_dir)] if hasattr(aug, 'cache_sources') else []
+                    key = self.cache.make_key(aug.name, aug.cache_params(param), *hashes, *extra)
+                    if self.cache.lookup(key) is None:
+                        jobs.append((idx, param))
+                        keys.setdefault(str(jpath), []).append(key)
+                if jobs:
+                    plan[jpath] = jobs
                 else:
-                    print(f'Failed to write json {out_json_path}: {e}', file=sys.stderr)
+                    del plan[jpath]
+
+        tasks = [(jpath, plan[jpath], img_dir, labels_dir, out_img_dir, out_labels_dir) for jpath in sorted(plan)]
+        names = [aug.name for aug in self.augmenters]
+        counts = {name: {'total': 0, 'skipped': 0} for name in names}
+        total = 0
+        skipped = 0
+        results = iter_sample_results(self, tasks, self.workers)
+        iterator = tqdm(results, total=len(tasks), desc=f'Fused (samples={len(tasks)}, workers={self.workers})') if tqdm else results
+        for res in iterator:
+            total += 1
+            for msg in res['messages']:
+                log_message(msg)
+            for i, (name, status, outputs) in enumerate(res.get('per_tool', [])):
+                counts[name]['total'] += 1
+                if status == 'skipped':
+                    counts[name]['skipped'] += 1
+                elif self.cache is not None and outputs:
+                    self.cache.record(keys[res['source']][i], res['source'], name, outputs)
+            if res['status'] == 'skipped':
+                skipped += 1
                 continue
+            if res['last'] and tqdm and hasattr(iterator, 'set_postfix'):
+                iterator.set_postfix({'last': res['last'], 'txt': res['txt']})
+
+        for name in names:
+            log_message(f'Summary {name}: total={counts[name]["total"]} skipped={counts[name]["skipped"]}')
+        log_message(f'Summary fused: decoded={total} skipped={skipped} saved_to={out_base}')
+        if self.cache is not None:
+            self.cache.prune()
+            self.cache.save()
+            log_message(self.cache.summary())
+
+    def _source_image(self, jpath: Path, img_dir: Path):
+        """与 process_sample 相同的规则（locate_image，JSON 的 imagePath 优先）确定样本实际使用的图片；JSON 无法读取时返回 None"""
+        try:
+            with open(jpath, 'r', encoding='utf-8') as f:
+                j = json.load(f)
+        except Exception:
+            return None
+        return locate_image(j, jpath.stem, img_dir, self.augmenters[0].find_image_file)
 
-            # copy txt if exists
-            txt_src = labels_dir / f'{base_name}.txt'
-            if txt_src.exists():
-                txt_dst = out_labels_dir / f'{param_part}_{base_name}.txt'
-                try:
-                    shutil.copy2(txt_src, txt_dst)
-                    txt_status = 'copied'
-                except Exception as e:
-                    txt_status = 'error'
-                    if tqdm:
-                        tqdm.write(f'Failed to copy txt {txt_src} -> {txt_dst}: {e}')
-            else:
-                txt_status = 'none'
+    def process_sample(self, jpath: Path, jobs: list, img_dir: Path, labels_dir: Path, out_img_dir: Path, out_labels_dir: Path) -> dict:
+        """读取一次样本，然后对 `jobs` 中的每个 (增强器下标, 参数) 调用对应增强器的 `augment_loaded`。
 
-            if tqdm and hasattr(iterator, 'set_postfix'):
-                iterator.set_postfix({'last': out_img_name, 'txt': txt_status})
+        只要有一个增强器成功即视为 ok；`per_tool` 记录每个增强器的结果状态。
+        """
+        result = {'status': 'skipped', 'messages': [], 'last': None, 'txt': 'none', 'per_tool': [], 'source': str(jpath)}
+        names = [self.augmenters[idx].name for idx, _ in jobs]
+        try:
+            with open(jpath, 'r', encoding='utf-8') as f:
+                j = json.load(f)
+        except Exception as e:
+            result['messages'].append(f'Failed to read {jpath}: {e}')
+            result['per_tool'] = [(name, 'skipped', []) for name in names]
+            return result
+
+        base_name = jpath.stem
+        img_path = locate_image(j, base_name, img_dir, self.augmenters[jobs[0][0]].find_image_file)
+        if img_path is None:
+            result['per_tool'] = [(name, 'skipped', []) for name in names]
+            return result
 
-        print(f'Summary color_jitter: total={total} skipped={skipped} saved_to={out_base}')
+        try:
+            img = Image.open(img_path).convert('RGB')
+        except Exception as e:
+            result['messages'].append(f'Failed to open image {img_path}: {e}')
+            result['per_tool'] = [(name, 'skipped', []) for name in names]
+            return result
+
+        for name, (idx, param) in zip(names, jobs):
+            try:
+                res = self.augmenters[idx].augment_loaded(j, base_name, img_path, img, labels_dir, out_img_dir, out_labels_dir, param)
+            except Exception as e:
+                res = {'status': 'skipped', 'messages': [f'{name} failed on {jpath}: {e}'], 'last': None, 'txt': 'error'}
+            result['messages'].extend(res['messages'])
+            result['per_tool'].append((name, res['status'], res.get('outputs', [])))
+            if res['status'] != 'skipped':
+                result['status'] = 'ok'
+                if res['last']:
+                    result['last'] = res['last']
+                    result['txt'] = res['txt']
+        return result
+
+
+def benchmark_imagedata(sizes=((640, 480), (1920, 1080), (4032, 3024)), n_shapes=20, repeat=3) -> list:
+    """对比三种 imageData 模式写出一个增强样本（图片 + JSON）的耗时与输出大小，打印表格并返回行列表"""
+    import tempfile
+    import time
+    rows = []
+    print(f"{'size':>11} {'mode':>7} {'ms':>9} {'json KB':>9} {'image KB':>9}")
+    for w, h in sizes:
+        # 平滑噪声图：JPEG 大小接近真实照片
+        img = Image.effect_noise((w // 8, h // 8), 64).resize((w, h), Image.Resampling.BICUBIC).convert('RGB')
+        shapes = [{'label': 'leaf', 'shape_type': 'polygon', 'points': [[float((i * 37 + k * 11) % w), float((i * 53 + k * 7) % h)] for k in range(40)]}
+                  for i in range(n_shapes)]
+        j = {'version': '5.0.1', 'shapes': shapes, 'imagePath': 'src.jpg', 'imageData': image_to_base64(img, 'JPEG'), 'imageHeight': h, 'imageWidth': w}
+        with tempfile.TemporaryDirectory() as tmp:
+            img_path = Path(tmp) / 'out.jpg'
+            json_path = Path(tmp) / 'out.json'
+            for mode in IMAGEDATA_MODES:
+                best = float('inf')
+                for _ in range(max(1, repeat)):
+                    start = time.perf_counter()
+                    img.save(img_path, format='JPEG')
+                    j_new = dict(j, imagePath=img_path.name)
+                    b64 = imagedata_b64(img, 'JPEG', img_path, mode)
+                    if b64 is not None:
+                        j_new['imageData'] = b64
+                    write_label_json(json_path, j_new, mode)
+                    best = min(best, time.perf_counter() - start)
+                row = {'size': f'{w}x{h}', 'mode': mode, 'ms': best * 1000,
+                       'json_bytes': json_path.stat().st_size, 'image_bytes': img_path.stat().st_size}
+                rows.append(row)
+                print(f"{row['size']:>11} {mode:>7} {row['ms']:>9.1f} {row['json_bytes'] / 1024:>9.1f} {row['image_bytes'] / 1024:>9.1f}")
+    return rows
+
+
+if __name__ == '__main__':
+    benchmark_imagedata()
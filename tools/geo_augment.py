@@ -0,0 +1,503 @@
+"""几何增强器：翻转、90° 旋转、随机缩放裁剪、mosaic 拼接
+
+与 BlurAugment / ColorJitterAugment 的接口一致（`TOOLS` 字典配置、`run(dataset_root, dataset_name, out_dir, sample_list)`、
+融合流水线使用的 `plan_params` / `augment_loaded` / `cache_params`），区别是图片的几何变化必须同步到标注：
+
+- 每种变换写成归一化坐标上的仿射变换 p' = M p + t（输出图片的归一化坐标），
+  同一个变换作用于图片、YOLO-seg `.txt` 中的全部多边形，以及 ISAT（objects/segmentation）/
+  Labelme（shapes/points）JSON 中的全部形状
+- 多边形一次性组成 CSR 数组做矩阵乘法，并用 tools/seg_geometry.py 的向量化 Sutherland–Hodgman 裁剪到图片范围内，
+  完全移出图片或裁剪后面积过小（min_area，归一化面积）的多边形被删除；
+  ISAT 的 bbox / area 与 Labelme 的 imageWidth / imageHeight 随之更新，Labelme 矩形保持为两点矩形
+- 随机参数按 (sample_seed, 工具名, 文件名) 派生，串行、进程池、融合流水线与增量模式的结果一致
+
+工具（名称 -> 类）：
+- 'flip'：      FlipAugment，modes 中随机取一种：'h' 水平、'v' 垂直、'hv' 两者
+- 'rot90'：     Rotate90Augment，angles 中随机取一个逆时针角度（90 / 180 / 270），宽高随之交换
+- 'scale_crop'：ScaleCropAugment，缩放倍数在 scale 范围内随机，再随机平移裁剪回原尺寸；超出原图的部分用 fill 填充
+- 'mosaic'：    MosaicAugment，与另外 3 个随机样本按随机中心拼成 2x2（各图先缩放到当前样本的尺寸），输出尺寸不变
+"""
+import bisect
+import json
+import random
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from .dataset_augment import (SUPPORTED_EXTS, tqdm, resolve_workers, log_message, iter_sample_results, select_samples_by_json_files,
+                              resolve_json_files, locate_image, pil_format_from_ext, resolve_imagedata_mode, imagedata_b64, write_label_json)
+from .aug_cache import stable_fraction
+from .image_index import find_image_file
+from .label_io import SegLabels, read_yolo_seg, write_yolo_seg
+from .seg_geometry import transform_normalized, clip_to_rect, concat_labels, polygon_areas
+
+IDENTITY = ((1.0, 0.0), (0.0, 1.0))
+UNIT_RECT = (0.0, 0.0, 1.0, 1.0)
+
+# 归一化坐标下的变换与对应的 PIL 转置
+_FLIPS = {
+    'h': (((-1.0, 0.0), (0.0, 1.0)), (1.0, 0.0), Image.Transpose.FLIP_LEFT_RIGHT),
+    'v': (((1.0, 0.0), (0.0, -1.0)), (0.0, 1.0), Image.Transpose.FLIP_TOP_BOTTOM),
+    'hv': (((-1.0, 0.0), (0.0, -1.0)), (1.0, 1.0), Image.Transpose.ROTATE_180),
+}
+# 逆时针旋转：90° 时 (x, y) -> (y, 1 - x)
+_ROTATIONS = {
+    90: (((0.0, 1.0), (-1.0, 0.0)), (0.0, 1.0), Image.Transpose.ROTATE_90),
+    180: (((-1.0, 0.0), (0.0, -1.0)), (1.0, 1.0), Image.Transpose.ROTATE_180),
+    270: (((0.0, -1.0), (1.0, 0.0)), (1.0, 0.0), Image.Transpose.ROTATE_270),
+}
+
+
+def json_shapes(j: dict):
+    """返回 (形状列表, 点坐标的键名)：ISAT 为 objects/segmentation，Labelme 为 shapes/points；都不是时返回 ([], None)"""
+    if isinstance(j.get('objects'), list):
+        return j['objects'], 'segmentation'
+    if isinstance(j.get('shapes'), list):
+        return j['shapes'], 'points'
+    return [], None
+
+
+def set_json_size(j: dict, size):
+    """更新 JSON 中记录的图片尺寸（Labelme 的 imageWidth/imageHeight，ISAT 的 info.width/height）"""
+    w, h = size
+    if 'imageWidth' in j:
+        j['imageWidth'] = w
+    if 'imageHeight' in j:
+        j['imageHeight'] = h
+    if isinstance(j.get('info'), dict):
+        info = dict(j['info'])
+        if 'width' in info:
+            info['width'] = w
+        if 'height' in info:
+            info['height'] = h
+        j['info'] = info
+
+
+def _points(arr):
+    return [[round(float(x), 3), round(float(y), 3)] for x, y in arr]
+
+
+def transform_json_shapes(j: dict, matrix, offset, src_size, dst_size, rect=UNIT_RECT, min_area=1e-6):
+    """把 JSON 中的全部形状按归一化仿射变换映射到输出图片，并裁剪到 rect（输出的归一化坐标）。
+
+    返回 (新的形状列表, 删除的形状数)；不是 ISAT / Labelme 格式时返回 (None, 0)。不修改 `j`。
+    """
+    shapes, key = json_shapes(j)
+    if key is None:
+        return None, 0
+    src = np.asarray(src_size, dtype=np.float64)
+    dst = np.asarray(dst_size, dtype=np.float64)
+    m = np.asarray(matrix, dtype=np.float64)
+    t = np.asarray(offset, dtype=np.float64)
+    lo, hi = np.asarray(rect[:2], dtype=np.float64), np.asarray(rect[2:], dtype=np.float64)
+    out = [None] * len(shapes)
+    polys, idx = [], []
+    for i, s in enumerate(shapes):
+        try:
+            arr = np.asarray(s.get(key), dtype=np.float64).reshape(-1, 2)
+        except (TypeError, ValueError):
+            continue
+        if len(arr) == 0:
+            continue
+        shape_type = s.get('shape_type', 'polygon')
+        if shape_type == 'rectangle' and len(arr) == 2:
+            (x0, y0), (x1, y1) = arr
+            arr = np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+        if key == 'segmentation' or shape_type in ('polygon', 'rectangle'):
+            polys.append(arr / src)
+            idx.append(i)
+            continue
+        # 点、线、圆等：只变换坐标并夹到 rect 内，全部点都在 rect 外时删除
+        p = (arr / src) @ m.T + t
+        if not ((p >= lo) & (p <= hi)).all(axis=1).any():
+            continue
+        out[i] = dict(s, **{key: _points(np.clip(p, lo, hi) * dst)})
+
+    if polys:
+        labels = transform_normalized(SegLabels.from_polygons(idx, polys, dtype=np.float64), m, t)
+        labels, _ = clip_to_rect(labels, rect, min_area)
+        for k, i in enumerate(labels.class_ids.tolist()):
+            pts = labels.polygon(k) * dst
+            s = dict(shapes[i])
+            if s.get('shape_type') == 'rectangle':
+                pts = np.stack([pts.min(axis=0), pts.max(axis=0)])
+            s[key] = _points(pts)
+            if key == 'segmentation':
+                if 'bbox' in s:
+                    s['bbox'] = [round(float(v), 3) for v in (*pts.min(axis=0), *pts.max(axis=0))]
+                if 'area' in s:
+                    s['area'] = round(float(polygon_areas(pts, np.array([0, len(pts)]))[0]), 3)
+            out[i] = s
+    result = [s for s in out if s is not None]
+    return result, len(shapes) - len(result)
+
+
+def with_shapes(j: dict, shapes, size) -> dict:
+    """返回替换了形状列表与图片尺寸的 JSON 副本（shapes 为 None 时只更新尺寸）"""
+    j_new = dict(j)
+    _, key = json_shapes(j)
+    if shapes is not None:
+        j_new['objects' if key == 'segmentation' else 'shapes'] = shapes
+    set_json_size(j_new, size)
+    return j_new
+
+
+def transform_txt(txt_path, matrix, offset, rect=UNIT_RECT, min_area=1e-6):
+    """读取 YOLO-seg 标注并做同样的变换与裁剪，返回 (SegLabels, 删除数量)；文件不存在时返回 (None, 0)"""
+    if not Path(txt_path).exists():
+        return None, 0
+    labels = read_yolo_seg(txt_path, on_error='skip')
+    return clip_to_rect(transform_normalized(labels, matrix, offset), rect, min_area)
+
+
+class GeometricAugment:
+    """几何增强器基类：子类实现 `sample_param`（抽取随机参数）与 `geometry`（变换图片并给出归一化仿射变换）"""
+    name = 'geometric'
+    default_suffix = '_geo'
+
+    def __init__(self, cfg: dict | None = None, **kwargs):
+        """与 BlurAugment 相同，支持 `Cls(cfg)` 或 `Cls(**cfg)`，kwargs 覆盖 cfg。
+
+        通用键：`suffix`, `replace_imagedata`, `imagedata_mode`, `sample_ratio`, `sample_count`, `sample_seed`, `workers`,
+        `min_area`（裁剪后小于该归一化面积的多边形被删除）, `fill`（填充灰度值）；其余键见各子类
+        """
+        merged = {}
+        if isinstance(cfg, dict):
+            merged.update(cfg)
+        merged.update(kwargs)
+
+        self.suffix = merged.get('suffix', self.default_suffix)
+        self.replace_imagedata = merged.get('replace_imagedata', True)
+        self.imagedata_mode = resolve_imagedata_mode(merged.get('imagedata_mode', 'encode'))
+        self.sample_ratio = merged.get('sample_ratio')
+        self.sample_count = merged.get('sample_count')
+        self.sample_seed = merged.get('sample_seed')
+        self.workers = resolve_workers(merged.get('workers', 1))
+        self.min_area = merged.get('min_area', 1e-6)
+        self.fill = int(merged.get('fill', 114))
+        self.configure(merged)
+
+    def configure(self, cfg: dict):
+        """读取子类特有的配置"""
+
+    def find_image_file(self, img_dir: Path, base_name: str):
+        return find_image_file(img_dir, base_name, SUPPORTED_EXTS)
+
+    def update_json_image_info(self, json_data: dict, new_filename: str, b64_data: str | None):
+        if 'imagePath' in json_data:
+            json_data['imagePath'] = new_filename
+        if 'imageFilename' in json_data:
+            json_data['imageFilename'] = new_filename
+        if 'imageData' in json_data and b64_data is not None and self.replace_imagedata:
+            json_data['imageData'] = b64_data
+
+    def plan_params(self, json_files: list, stable: bool = False) -> list:
+        """每个样本的随机参数只由 (sample_seed, 工具名, 文件名) 决定，stable 参数仅为保持接口一致"""
+        return [self.sample_param(random.Random(f'{self.sample_seed}|{self.name}|{Path(j).stem}'), Path(j)) for j in json_files]
+
+    def sample_param(self, rng: random.Random, jpath: Path) -> dict:
+        raise NotImplementedError
+
+    def cache_params(self, param=None) -> dict:
+        return {'param': param, 'suffix': self.suffix, 'replace_imagedata': self.replace_imagedata, 'imagedata_mode': self.imagedata_mode, 'min_area': self.min_area,
+                'fill': self.fill, 'sample_seed': self.sample_seed}
+
+    def tag(self, param: dict) -> str:
+        """输出文件名中区分参数的部分"""
+        return ''
+
+    def geometry(self, img: Image.Image, param: dict):
+        """返回 (输出图片, M, t)：输入的归一化坐标 p 映射为输出的 M p + t"""
+        raise NotImplementedError
+
+    def output_prefix(self, param: dict) -> str:
+        """输出文件名前缀：<suffix 去掉下划线>_<参数>"""
+        tag = self.tag(param)
+        return self.suffix.lstrip('_') + (f'_{tag}' if tag else '')
+
+    def run(self, dataset_root='.', dataset_name='tomato', out_dir='geometric', sample_list: list | None = None):
+        root = Path(dataset_root).resolve()
+        ds = root / dataset_name
+        labels_dir = ds / 'labels'
+        img_dir = ds / 'images'
+
+        out_base = root / out_dir
+        out_img_dir = out_base / 'images'
+        out_labels_dir = out_base / 'labels'
+        out_img_dir.mkdir(parents=True, exist_ok=True)
+        out_labels_dir.mkdir(parents=True, exist_ok=True)
+
+        if sample_list is None:
+            sample_list = select_samples_by_json_files(dataset_root=dataset_root, dataset_name=dataset_name, sample_ratio=self.sample_ratio, sample_count=self.sample_count, seed=self.sample_seed)
+        json_files = resolve_json_files(labels_dir, sample_list)
+        tasks = [(jpath, param, img_dir, labels_dir, out_img_dir, out_labels_dir) for jpath, param in zip(json_files, self.plan_params(json_files))]
+        total = 0
+        skipped = 0
+        results = iter_sample_results(self, tasks, self.workers)
+        iterator = tqdm(results, total=len(tasks), desc=f'{self.name} (samples={len(json_files)}, workers={self.workers})') if tqdm else results
+        for res in iterator:
+            total += 1
+            for msg in res['messages']:
+                log_message(msg)
+            if res['status'] == 'skipped':
+                skipped += 1
+                continue
+            if res['last'] and tqdm and hasattr(iterator, 'set_postfix'):
+                iterator.set_postfix({'last': res['last'], 'txt': res['txt']})
+
+        log_message(f'Summary {self.name}: total={total} skipped={skipped} saved_to={out_base}')
+
+    def process_sample(self, jpath: Path, param: dict, img_dir: Path, labels_dir: Path, out_img_dir: Path, out_labels_dir: Path) -> dict:
+        """读取单个样本后调用 `augment_loaded`，返回值格式与 `BlurAugment.process_sample` 相同"""
+        result = {'status': 'skipped', 'messages': [], 'last': None, 'txt': 'none'}
+        try:
+            with open(jpath, 'r', encoding='utf-8') as f:
+                j = json.load(f)
+        except Exception as e:
+            result['messages'].append(f'Failed to read {jpath}: {e}')
+            return result
+
+        base_name = jpath.stem
+        img_path = locate_image(j, base_name, img_dir, self.find_image_file)
+        if img_path is None:
+            return result
+        try:
+            img = Image.open(img_path).convert('RGB')
+        except Exception as e:
+            result['messages'].append(f'Failed to open image {img_path}: {e}')
+            return result
+        return self.augment_loaded(j, base_name, img_path, img, labels_dir, out_img_dir, out_labels_dir, param)
+
+    def render(self, j: dict, base_name: str, img: Image.Image, labels_dir: Path, param: dict, messages: list | None = None):
+        """在内存中变换图片、JSON 形状与 TXT 多边形，返回 (图片, 形状列表或 None, SegLabels 或 None)；不写文件"""
+        out_img, m, t = self.geometry(img, param)
+        shapes, _ = transform_json_shapes(j, m, t, img.size, out_img.size, min_area=self.min_area)
+        txt, _ = transform_txt(labels_dir / f'{base_name}.txt', m, t, min_area=self.min_area)
+        return out_img, shapes, txt
+
+    def augment_loaded(self, j: dict, base_name: str, img_path: Path, img: Image.Image, labels_dir: Path, out_img_dir: Path, out_labels_dir: Path, param: dict | None = None) -> dict:
+        """变换图片、JSON 形状与 TXT 多边形并写出（不修改传入的 `j` 与 `img`）"""
+        messages = []
+        out_img, shapes, txt = self.render(j, base_name, img, labels_dir, param, messages)
+        res = self.write_outputs(j, base_name, img_path, out_img, shapes, txt, out_img_dir, out_labels_dir, param)
+        res['messages'][:0] = messages
+        return res
+
+    def write_outputs(self, j: dict, base_name: str, img_path: Path, out_img: Image.Image, shapes, txt, out_img_dir: Path, out_labels_dir: Path, param) -> dict:
+        """写出增强后的图片、JSON（替换形状与尺寸）与 TXT，文件名为 `<前缀>_<原文件名>`"""
+        result = {'status': 'skipped', 'messages': [], 'last': None, 'txt': 'none', 'outputs': []}
+        prefix = self.output_prefix(param)
+        ext = img_path.suffix or '.jpg'
+        out_img_name = f'{prefix}_{img_path.stem}{ext}'
+        pil_fmt = pil_format_from_ext(ext)
+        try:
+            out_img.save(out_img_dir / out_img_name, format=pil_fmt)
+        except Exception as e:
+            result['messages'].append(f'Failed to save {self.name} image {out_img_name}: {e}')
+            return result
+
+        j_new = with_shapes(j, shapes, out_img.size)
+        b64 = imagedata_b64(out_img, pil_fmt, out_img_dir / out_img_name, self.imagedata_mode) if 'imageData' in j and self.replace_imagedata else None
+        self.update_json_image_info(j_new, out_img_name, b64)
+        out_json_name = f'{prefix}_{base_name}.json'
+        try:
+            write_label_json(out_labels_dir / out_json_name, j_new, self.imagedata_mode)
+        except Exception as e:
+            result['messages'].append(f'Failed to write json {out_json_name}: {e}')
+            return result
+
+        if txt is not None:
+            txt_name = f'{prefix}_{base_name}.txt'
+            try:
+                write_yolo_seg(out_labels_dir / txt_name, txt)
+                result['txt'] = 'transformed'
+                result['outputs'].append(f'{out_labels_dir.name}/{txt_name}')
+            except Exception as e:
+                result['txt'] = 'error'
+                result['messages'].append(f'Failed to write txt {txt_name}: {e}')
+
+        result['outputs'][:0] = [f'{out_img_dir.name}/{out_img_name}', f'{out_labels_dir.name}/{out_json_name}']
+        result['status'] = 'ok'
+        result['last'] = out_img_name
+        return result
+
+
+class FlipAugment(GeometricAugment):
+    """翻转：`modes` 为 'h' / 'v' / 'hv' 的列表，每个样本随机取一种"""
+    name = 'flip'
+    default_suffix = '_flip'
+
+    def configure(self, cfg: dict):
+        self.modes = list(cfg.get('modes', ['h']))
+        for mode in self.modes:
+            if mode not in _FLIPS:
+                raise ValueError(f'unknown flip mode: {mode} (expected one of {tuple(_FLIPS)})')
+
+    def sample_param(self, rng, jpath):
+        return {'mode': rng.choice(self.modes)}
+
+    def tag(self, param):
+        return param['mode']
+
+    def geometry(self, img, param):
+        m, t, op = _FLIPS[param['mode']]
+        return img.transpose(op), m, t
+
+
+class Rotate90Augment(GeometricAugment):
+    """90° 整数倍旋转（逆时针）：`angles` 为 90 / 180 / 270 的列表，每个样本随机取一个"""
+    name = 'rot90'
+    default_suffix = '_rot'
+
+    def configure(self, cfg: dict):
+        self.angles = [int(a) % 360 for a in cfg.get('angles', [90, 180, 270])]
+        for angle in self.angles:
+            if angle not in _ROTATIONS:
+                raise ValueError(f'unsupported rotation angle: {angle} (expected one of {tuple(_ROTATIONS)})')
+
+    def sample_param(self, rng, jpath):
+        return {'angle': rng.choice(self.angles)}
+
+    def tag(self, param):
+        return str(param['angle'])
+
+    def geometry(self, img, param):
+        m, t, op = _ROTATIONS[param['angle']]
+        return img.transpose(op), m, t
+
+
+class ScaleCropAugment(GeometricAugment):
+    """随机缩放 + 裁剪：缩放倍数 s 在 `scale`=[最小, 最大] 内均匀抽取，裁剪窗口在可移动范围内均匀抽取，输出尺寸不变。
+
+    s > 1 为放大后裁剪（部分目标被裁掉），s < 1 为缩小后四周用 fill 填充。
+    """
+    name = 'scale_crop'
+    default_suffix = '_sc'
+
+    def configure(self, cfg: dict):
+        lo, hi = cfg.get('scale', [0.75, 1.25])
+        self.scale = [float(lo), float(hi)]
+
+    def sample_param(self, rng, jpath):
+        # 窗口左上角在可移动范围中的相对位置（0..1），与图片尺寸无关
+        return {'scale': round(rng.uniform(*self.scale), 4), 'fx': round(rng.random(), 4), 'fy': round(rng.random(), 4)}
+
+    def tag(self, param):
+        return f"{param['scale']:g}"
+
+    def geometry(self, img, param):
+        w, h = img.size
+        s = param['scale']
+        cw, ch = w / s, h / s
+        left = (w - cw) * param['fx']
+        top = (h - ch) * param['fy']
+        out = img.transform((w, h), Image.Transform.EXTENT, (left, top, left + cw, top + ch),
+                            resample=Image.Resampling.BILINEAR, fillcolor=(self.fill,) * 3)
+        # 与 seg_geometry.crop_labels 相同：按窗口重新归一化
+        return out, ((w / cw, 0.0), (0.0, h / ch)), (-left / cw, -top / ch)
+
+
+class MosaicAugment(GeometricAugment):
+    """2x2 mosaic：当前样本与另外 3 个样本（从同一 labels 目录的全部 JSON 中抽取）拼接。
+
+    拼接中心在 `center`=[最小, 最大]（相对宽高）内随机；4 张图片先缩放到当前样本的尺寸，
+    分别取靠近中心的一角放入左上、右上、左下、右下象限，标注裁剪到各自象限。
+
+    伙伴用一致性哈希抽取：每个 JSON 按 (sample_seed, 工具名, 文件名) 的哈希排在一个环上，第 k 个伙伴取
+    (sample_seed, 工具名, 样本名, k) 的哈希在环上的下一个（跳过样本自身）；新增图片只会改变恰好落在
+    对应区间内的少数伙伴（约 1/N），已有 mosaic 的伙伴基本不变。增量模式下伙伴的 JSON、图片与 TXT
+    也计入缓存键（`cache_sources`），伙伴变化后 mosaic 会重新生成。
+    """
+    name = 'mosaic'
+    default_suffix = '_mosaic'
+
+    def configure(self, cfg: dict):
+        lo, hi = cfg.get('center', [0.3, 0.7])
+        self.center = [float(lo), float(hi)]
+
+    def plan_params(self, json_files: list, stable: bool = False) -> list:
+        """伙伴与拼接中心只由 (sample_seed, 工具名, 文件名) 与目录中的 JSON 集合决定，stable 参数仅为保持接口一致"""
+        rings = {}
+        params = []
+        for j in json_files:
+            j = Path(j)
+            ring = rings.get(j.parent)
+            if ring is None:
+                ring = rings[j.parent] = sorted((stable_fraction(self.sample_seed, self.name, 'pool', p.stem), p.stem) for p in j.parent.glob('*.json'))
+            rng = random.Random(f'{self.sample_seed}|{self.name}|{j.stem}')
+            params.append({'partners': [self._ring_partner(ring, j.stem, k) for k in range(3)],
+                           'cx': round(rng.uniform(*self.center), 4), 'cy': round(rng.uniform(*self.center), 4)})
+        return params
+
+    def _ring_partner(self, ring: list, stem: str, k: int) -> str:
+        """环上位于 (样本, k) 哈希之后的第一个其他样本；只有样本自身时返回自身"""
+        i = bisect.bisect_left(ring, (stable_fraction(self.sample_seed, self.name, stem, k), ''))
+        for step in range(len(ring)):
+            other = ring[(i + step) % len(ring)][1]
+            if other != stem:
+                return other
+        return stem
+
+    def cache_sources(self, param: dict, img_dir: Path, labels_dir: Path) -> list:
+        """增量模式下除样本自身外还要计入缓存键的文件：各伙伴的 JSON、实际使用的图片与 TXT"""
+        paths = []
+        for stem in param['partners']:
+            jpath = labels_dir / f'{stem}.json'
+            try:
+                with open(jpath, 'r', encoding='utf-8') as f:
+                    tpath = locate_image(json.load(f), stem, img_dir, self.find_image_file)
+            except Exception:
+                tpath = None
+            paths.extend([jpath, tpath, labels_dir / f'{stem}.txt'])
+        return paths
+
+    def render(self, j: dict, base_name: str, img: Image.Image, labels_dir: Path, param: dict, messages: list | None = None):
+        w, h = img.size
+        cx, cy = int(round(param['cx'] * w)), int(round(param['cy'] * h))
+        a, b = cx / w, cy / h
+        img_dir = labels_dir.parent / 'images'
+        canvas = Image.new('RGB', (w, h), (self.fill,) * 3)
+
+        # 象限：(画布上的像素区域, 源图（缩放到 w x h 后）的像素区域, 归一化平移, 归一化裁剪窗口)
+        quads = [
+            ((0, 0), (w - cx, h - cy, w, h), (a - 1, b - 1), (0.0, 0.0, a, b)),
+            ((cx, 0), (0, h - cy, w - cx, h), (a, b - 1), (a, 0.0, 1.0, b)),
+            ((0, cy), (w - cx, 0, w, h - cy), (a - 1, b), (0.0, b, a, 1.0)),
+            ((cx, cy), (0, 0, w - cx, h - cy), (a, b), (a, b, 1.0, 1.0)),
+        ]
+        tiles = [(j, base_name, img)]
+        messages = [] if messages is None else messages
+        for stem in param['partners']:
+            tile = self._load_tile(stem, labels_dir, img_dir, messages)
+            tiles.append(tile if tile is not None else (j, base_name, img))
+
+        shapes_all, txt_all, any_shapes = [], [], False
+        for (tj, tstem, timg), (dst_xy, src_box, t, rect) in zip(tiles, quads):
+            resized = timg if timg.size == (w, h) else timg.resize((w, h), Image.Resampling.BILINEAR)
+            if src_box[2] > src_box[0] and src_box[3] > src_box[1]:
+                canvas.paste(resized.crop(src_box), dst_xy)
+            shapes, _ = transform_json_shapes(tj, IDENTITY, t, timg.size, (w, h), rect, self.min_area)
+            if shapes is not None:
+                any_shapes = True
+                shapes_all.extend(shapes)
+            txt, _ = transform_txt(labels_dir / f'{tstem}.txt', IDENTITY, t, rect, self.min_area)
+            if txt is not None:
+                txt_all.append(txt)
+
+        return canvas, (shapes_all if any_shapes else None), (concat_labels(txt_all) if txt_all else None)
+
+    def _load_tile(self, stem, labels_dir, img_dir, messages):
+        try:
+            with open(labels_dir / f'{stem}.json', 'r', encoding='utf-8') as f:
+                tj = json.load(f)
+            tpath = locate_image(tj, stem, img_dir, self.find_image_file)
+            if tpath is None:
+                raise FileNotFoundError(f'image for {stem} not found')
+            return tj, stem, Image.open(tpath).convert('RGB')
+        except Exception as e:
+            messages.append(f'mosaic: failed to load partner {stem}, using the sample itself: {e}')
+            return None
+
+
+GEOMETRIC_TOOLS = {cls.name: cls for cls in (FlipAugment, Rotate90Augment, ScaleCropAugment, MosaicAugment)}
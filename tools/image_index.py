@@ -0,0 +1,114 @@
+"""图片索引：按目录缓存 stem -> 图片路径 的映射
+
+一次 `os.scandir` 建立索引，之后每次查找都是字典访问，替代逐个后缀 `exists()` 探测和
+`iterdir()` / `glob` 回退扫描。stem 与后缀匹配均不区分大小写。
+
+目录的 mtime 变化后索引被标记为过期：过期状态下命中的路径会先确认仍然存在，
+未命中（或命中的文件已被删除）时才重新扫描目录。这样在向同一目录写入增强结果时
+不会每次查找都重建索引。
+
+用法：
+    from tools.image_index import find_image_file
+    p = find_image_file(img_dir, 'IMG_0001')  # -> Path | None
+"""
+import os
+from pathlib import Path
+
+IMAGE_EXTS = ['.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp']
+
+
+class ImageIndex:
+    """单个目录的图片索引（不递归子目录）"""
+
+    def __init__(self, img_dir):
+        self.img_dir = Path(img_dir)
+        self.mtime_ns = None
+        self.entries = {}
+        self.stale = True
+
+    def refresh(self):
+        """扫描目录并重建索引：lower(stem) -> [(文件名, lower(后缀)), ...]"""
+        entries = {}
+        try:
+            self.mtime_ns = os.stat(self.img_dir).st_mtime_ns
+            with os.scandir(self.img_dir) as it:
+                for entry in it:
+                    stem, ext = os.path.splitext(entry.name)
+                    ext = ext.lower()
+                    if ext not in IMAGE_EXTS:
+                        continue
+                    try:
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    entries.setdefault(stem.lower(), []).append((entry.name, ext))
+        except FileNotFoundError:
+            self.mtime_ns = None
+        self.entries = entries
+        self.stale = False
+
+    def check_mtime(self):
+        try:
+            mtime_ns = os.stat(self.img_dir).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        if mtime_ns != self.mtime_ns:
+            self.stale = True
+
+    def _pick(self, base_name: str, exts: list):
+        """按 `exts` 的顺序选择最优候选；同一后缀下 stem 大小写完全一致者优先。"""
+        candidates = self.entries.get(base_name.lower())
+        if not candidates:
+            return None
+        rank = {e.lower(): i for i, e in enumerate(exts)}
+        best = None
+        best_key = None
+        for name, ext in candidates:
+            if ext not in rank:
+                continue
+            key = (os.path.splitext(name)[0] != base_name, rank[ext])
+            if best_key is None or key < best_key:
+                best, best_key = name, key
+        return self.img_dir / best if best is not None else None
+
+    def find(self, base_name: str, exts: list | None = None):
+        """查找 stem 为 `base_name` 的图片，返回 Path 或 None。"""
+        exts = exts or IMAGE_EXTS
+        if self.mtime_ns is None and not self.entries:
+            self.refresh()
+        else:
+            self.check_mtime()
+        p = self._pick(base_name, exts)
+        if not self.stale:
+            return p
+        if p is not None and p.exists():
+            return p
+        self.refresh()
+        return self._pick(base_name, exts)
+
+    def paths(self, exts: list | None = None) -> list:
+        """返回目录下所有图片路径（按文件名排序）。"""
+        exts = [e.lower() for e in (exts or IMAGE_EXTS)]
+        self.check_mtime()
+        if self.stale:
+            self.refresh()
+        return sorted(self.img_dir / name for cands in self.entries.values() for name, ext in cands if ext in exts)
+
+
+# 进程内共享的索引缓存：resolved dir -> ImageIndex（进程池中每个 worker 各自建立一次）
+_INDEXES = {}
+
+
+def get_image_index(img_dir) -> ImageIndex:
+    key = os.path.abspath(img_dir)
+    idx = _INDEXES.get(key)
+    if idx is None:
+        idx = ImageIndex(key)
+        _INDEXES[key] = idx
+    return idx
+
+
+def find_image_file(img_dir, base_name: str, exts: list | None = None):
+    """在 `img_dir` 中查找 stem 为 `base_name` 的图片（大小写不敏感），返回 Path 或 None。"""
+    return get_image_index(img_dir).find(base_name, exts)
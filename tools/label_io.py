@@ -0,0 +1,372 @@
+"""YOLO-seg 标注读写（紧凑 NumPy 表示）
+
+YOLO-seg `.txt` 每行为 `class_id x1 y1 x2 y2 ...`（归一化坐标）。这里把一个文件解析为 CSR 结构：
+
+- class_ids: int32 数组，形状 (N,)，每个多边形一个类别
+- coords:    float32 数组，形状 (P, 2)，所有多边形的点依次拼接
+- offsets:   int64 数组，形状 (N + 1,)，第 i 个多边形的点为 coords[offsets[i]:offsets[i + 1]]
+
+相比 “每行 split 成字符串列表”，内存只占其很小一部分，也便于类别重映射、几何变换等批量处理。
+
+写出时按解析时逐行记录的小数位数格式化，保证往返一致（数值完全相同）：
+- 坐标小数位不超过 6 位且绝对值都小于 1 时使用 float32（float32 足以精确还原 [0, 1) 内的 6 位小数），
+  否则使用 float64（例如像素坐标 `123.456789`）；
+- 一行内每个坐标小数位数相同（如 `%.6f` 导出）时按固定位数写出，否则去掉末尾多余的 0；
+- 含科学计数法（`1e-3`）或超过 15 位小数的行按最短 repr 写出（decimals 为 SHORTEST），float64 可精确还原；
+- 空行会被丢弃，行内多余空白会被规范为单个空格。
+
+用法：
+    from tools.label_io import read_yolo_seg, write_yolo_seg
+    labels = read_yolo_seg('labels/IMG_0001.txt')
+    labels = labels.select(labels.class_ids != 3)
+    write_yolo_seg('labels/IMG_0001.txt', labels)
+"""
+import os
+import re
+import warnings
+import numpy as np
+
+_TRAILING_ZEROS_RE = re.compile(r'(\.\d*?)0+(?=\s|$)', re.M)
+_TRAILING_DOT_RE = re.compile(r'\.(?=\s|$)', re.M)
+# decimals 取该值的多边形按 repr（最短往返表示）写出
+SHORTEST = -1
+
+
+class SegLabels:
+    """单个 YOLO-seg 标注文件的 CSR 表示（见模块说明）"""
+
+    def __init__(self, class_ids, coords, offsets, decimals=6, fixed=True, errors: list | None = None):
+        self.class_ids = np.asarray(class_ids, dtype=np.int32)
+        self.coords = np.asarray(coords).reshape(-1, 2)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        n = len(self.class_ids)
+        # 每个多边形的写出格式：小数位数、是否固定位数（否则去掉末尾 0）；可传标量
+        self.decimals = np.broadcast_to(np.asarray(decimals, dtype=np.int16), (n,)).copy()
+        self.fixed = np.broadcast_to(np.asarray(fixed, dtype=bool), (n,)).copy()
+        # 解析失败的行：[(行号, 原始内容, 错误信息), ...]（仅 on_error='skip' 时可能非空）
+        self.errors = errors or []
+
+    def __len__(self):
+        return len(self.class_ids)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """每个多边形的点数"""
+        return np.diff(self.offsets)
+
+    def polygon(self, i: int) -> np.ndarray:
+        return self.coords[self.offsets[i]:self.offsets[i + 1]]
+
+    def polygons(self) -> list:
+        return [self.polygon(i) for i in range(len(self))]
+
+    def replace(self, class_ids=None, coords=None) -> 'SegLabels':
+        """返回替换了类别或坐标（多边形数量与点数不变）的新对象，保留写出格式"""
+        return SegLabels(self.class_ids if class_ids is None else class_ids,
+                         self.coords if coords is None else coords,
+                         self.offsets, self.decimals, self.fixed, list(self.errors))
+
+    def select(self, mask) -> 'SegLabels':
+        """按布尔掩码（或下标数组）保留部分多边形，向量化重建 CSR"""
+        mask = np.asarray(mask)
+        if mask.dtype != bool:
+            keep = np.zeros(len(self), dtype=bool)
+            keep[mask] = True
+            mask = keep
+        lengths = self.lengths
+        point_mask = np.repeat(mask, lengths)
+        offsets = np.zeros(int(mask.sum()) + 1, dtype=np.int64)
+        np.cumsum(lengths[mask], out=offsets[1:])
+        return SegLabels(self.class_ids[mask], self.coords[point_mask], offsets,
+                         self.decimals[mask], self.fixed[mask], list(self.errors))
+
+    @classmethod
+    def empty(cls, dtype=np.float32) -> 'SegLabels':
+        return cls(np.zeros(0, np.int32), np.zeros((0, 2), dtype), np.zeros(1, np.int64))
+
+    @classmethod
+    def from_polygons(cls, class_ids, polygons, dtype=np.float32, decimals=6, fixed=True) -> 'SegLabels':
+        """由类别列表与多边形列表（每个为 (K, 2) 数组）构建"""
+        lengths = np.array([len(p) for p in polygons], dtype=np.int64)
+        offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        coords = np.concatenate([np.asarray(p, dtype=dtype).reshape(-1, 2) for p in polygons]) if polygons else np.zeros((0, 2), dtype)
+        return cls(class_ids, coords, offsets, decimals, fixed)
+
+
+def _parse_fast(text: str) -> SegLabels:
+    """向量化解析：`np.fromstring` 一次解析所有数字，按字节数组统计每行 token 数与小数位数。
+
+    任意一行不合法时抛出 ValueError，由调用方回退到逐行解析。
+    """
+    b = np.frombuffer(text.encode('utf-8'), dtype=np.uint8)
+    if b.size == 0:
+        return SegLabels.empty()
+    is_ws = b <= 32
+    token_starts = np.flatnonzero(~is_ws & np.concatenate(([True], is_ws[:-1])))
+    token_ends = np.flatnonzero(~is_ws & np.concatenate((is_ws[1:], [True]))) + 1
+    n_tokens = len(token_starts)
+    if n_tokens == 0:
+        return SegLabels.empty()
+    with warnings.catch_warnings():
+        # 遇到无法解析的内容时 numpy 只发出 DeprecationWarning 并截断，这里转为异常
+        warnings.simplefilter('error')
+        try:
+            values = np.fromstring(text, dtype=np.float64, sep=' ')
+        except (DeprecationWarning, ValueError) as e:
+            raise ValueError(str(e))
+    if len(values) != n_tokens:
+        raise ValueError('unparsable token')
+
+    # 每个 token 所在的行号（0-based），以及每行第一个 token（类别）
+    newlines = np.flatnonzero(b == 10)
+    token_line = np.searchsorted(newlines, token_starts)
+    first = np.flatnonzero(np.diff(token_line, prepend=-1))
+    counts = np.diff(np.append(first, n_tokens)) - 1
+    if np.any(counts % 2):
+        raise ValueError('odd number of coordinates')
+    class_vals = values[first]
+    class_ids = class_vals.astype(np.int64)
+    if np.any(class_ids != class_vals):
+        raise ValueError('class id is not an integer')
+
+    is_coord = np.ones(n_tokens, dtype=bool)
+    is_coord[first] = False
+
+    # 小数位数：每个 '.' 到所在 token 末尾的距离，按多边形（行）汇总
+    n_poly = len(first)
+    dots = np.flatnonzero(b == 46)
+    dot_token = np.searchsorted(token_starts, dots, side='right') - 1
+    if np.any(~is_coord[dot_token]):
+        raise ValueError('class id is not an integer')
+    decimals = np.zeros(n_poly, dtype=np.int16)
+    fixed = counts == 0
+    if np.any((b == 101) | (b == 69)):
+        # 科学计数法：无法按固定小数位还原，使用 float64 + 最短 repr
+        decimals[:] = SHORTEST
+        fixed[:] = False
+        dtype = np.float64
+    elif len(dots):
+        dec = token_ends[dot_token] - dots - 1
+        dot_poly = np.searchsorted(first, dot_token, side='right') - 1
+        starts = np.flatnonzero(np.diff(dot_poly, prepend=-1))
+        polys = dot_poly[starts]
+        decimals[polys] = np.maximum.reduceat(dec, starts)
+        dmin = np.zeros(n_poly, dtype=np.int64)
+        dmin[polys] = np.minimum.reduceat(dec, starts)
+        n_dots = np.bincount(dot_poly, minlength=n_poly)
+        fixed |= (n_dots == counts) & (dmin == decimals)
+        # 超过 15 位小数时 %f 无法还原 float64 的值
+        long = decimals > 15
+        decimals[long] = SHORTEST
+        fixed[long] = False
+        dtype = np.float32 if decimals.max() <= 6 and not long.any() else np.float64
+    else:
+        dtype = np.float32
+    if dtype == np.float32 and np.any(np.abs(values[is_coord]) >= 1):
+        # 绝对值 ≥ 1（如像素坐标）时 float32 的有效位数不足以还原 6 位小数
+        dtype = np.float64
+
+    offsets = np.zeros(n_poly + 1, dtype=np.int64)
+    np.cumsum(counts // 2, out=offsets[1:])
+    return SegLabels(class_ids, values[is_coord].astype(dtype).reshape(-1, 2), offsets, decimals, fixed)
+
+
+def _parse_lines(text: str, on_error: str) -> SegLabels:
+    """逐行解析（慢速路径）：定位并记录/抛出无法解析的行"""
+    class_ids, coord_lines, counts, errors = [], [], [], []
+    for line_num, raw in enumerate(text.splitlines(), 1):
+        parts = raw.split()
+        if not parts:
+            continue
+        try:
+            cid = int(parts[0])
+            vals = [float(v) for v in parts[1:]]
+            if len(vals) % 2:
+                raise ValueError('odd number of coordinates')
+        except ValueError as e:
+            if on_error != 'skip':
+                raise ValueError(f'line {line_num}: {raw!r}: {e}')
+            errors.append((line_num, raw, str(e)))
+            continue
+        class_ids.append(cid)
+        coord_lines.append(' '.join(parts[1:]))
+        counts.append(len(vals))
+    # 剔除坏行后按快速路径解析剩余内容，得到一致的格式检测结果
+    text_ok = '\n'.join(f'{c} {t}' if t else str(c) for c, t in zip(class_ids, coord_lines))
+    labels = _parse_fast(text_ok)
+    labels.errors = errors
+    return labels
+
+
+def parse_yolo_seg(text: str, on_error: str = 'raise') -> SegLabels:
+    """解析 YOLO-seg 文本。
+
+    on_error:
+    - 'raise'：遇到无法解析的行（类别不是整数、坐标不是数字、坐标个数为奇数）抛出 ValueError
+    - 'skip' ：跳过这些行，并记录在返回值的 `errors` 中
+    """
+    try:
+        return _parse_fast(text)
+    except ValueError:
+        return _parse_lines(text, on_error)
+
+
+def build_class_lut(class_remapping: dict) -> np.ndarray:
+    """把 {旧类别: 新类别} 映射转换为查找表：lut[旧类别] = 新类别，不在映射中的为 -1"""
+    if not class_remapping:
+        return np.full(0, -1, dtype=np.int32)
+    lut = np.full(max(class_remapping) + 1, -1, dtype=np.int32)
+    lut[list(class_remapping.keys())] = list(class_remapping.values())
+    return lut
+
+
+def remap_class_ids(labels: SegLabels, lut: np.ndarray) -> SegLabels:
+    """通过查找表一次性重映射所有类别，并删除映射为 -1（不在映射中）的多边形"""
+    ids = labels.class_ids
+    valid = (ids >= 0) & (ids < len(lut))
+    new_ids = np.full(len(ids), -1, dtype=np.int32)
+    new_ids[valid] = lut[ids[valid]]
+    keep = new_ids >= 0
+    return labels.select(keep).replace(class_ids=new_ids[keep])
+
+
+def _class_id(token: str) -> int:
+    """类别字段 -> int；'1.0' 这类整数值的浮点写法按整数处理（Ultralytics 也把它读作类别 1）"""
+    try:
+        return int(token)
+    except ValueError:
+        value = float(token)
+        if not value.is_integer():
+            raise ValueError(f'class id is not an integer: {token!r}')
+        return int(value)
+
+
+def _coords_error(rest: str):
+    """坐标部分的问题（不是数字、个数为奇数），没有问题时返回 None"""
+    try:
+        n = len([float(v) for v in rest.split()])
+    except ValueError as e:
+        return str(e)
+    return 'odd number of coordinates' if n % 2 else None
+
+
+def remap_yolo_seg_text(text: str, lut: np.ndarray):
+    """重映射一个 YOLO-seg 文件的文本，返回 (新文本, 标注数, 保留数, 有问题的行)。
+
+    每行只替换类别字段，坐标部分逐字保留（不重新格式化）；类别不在映射中的行删除，行的先后顺序不变。
+    有问题的行以 (行号, 原文, 说明) 返回：
+    - 类别写成 '1.0' 这类整数值的浮点数：按整数重映射
+    - 坐标无法解析（不是数字、个数为奇数）：仍按类别重映射，坐标原样保留
+    - 类别无法解析：删除该行（保留会在重映射后留下错误的旧类别）
+    """
+    line_nums, raws, rests, ids, errors = [], [], [], [], []
+    for line_num, raw in enumerate(text.splitlines(), 1):
+        line = raw.strip()
+        if not line:
+            continue
+        token = line.split(None, 1)[0]
+        try:
+            cid = _class_id(token)
+        except ValueError as e:
+            errors.append((line_num, raw, f'{e}; line dropped'))
+            continue
+        if token != str(cid):
+            errors.append((line_num, raw, f'class id {token!r} read as {cid}'))
+        line_nums.append(line_num)
+        raws.append(raw)
+        rests.append(line[len(token):])
+        ids.append(cid)
+    try:
+        # 快速路径校验坐标；失败时逐行定位
+        _parse_fast(text)
+    except ValueError:
+        for line_num, raw, rest in zip(line_nums, raws, rests):
+            e = _coords_error(rest)
+            if e is not None:
+                errors.append((line_num, raw, f'{e}; coordinates kept as-is'))
+        errors.sort(key=lambda err: err[0])
+
+    ids = np.asarray(ids, dtype=np.int64)
+    valid = (ids >= 0) & (ids < len(lut))
+    new_ids = np.full(len(ids), -1, dtype=np.int64)
+    new_ids[valid] = lut[ids[valid]]
+    out = ''.join(f'{cid}{rest}\n' for cid, rest in zip(new_ids.tolist(), rests) if cid >= 0)
+    return out, len(ids), int((new_ids >= 0).sum()), errors
+
+
+def read_yolo_seg(path, on_error: str = 'raise') -> SegLabels:
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_yolo_seg(f.read(), on_error=on_error)
+
+
+def format_yolo_seg(labels: SegLabels) -> str:
+    """把 SegLabels 格式化为 YOLO-seg 文本（每行以换行结尾）。
+
+    整个文件只做一次 `%` 格式化，避免逐个数字调用 Python 格式化函数；
+    只有非固定小数位的行才做去除末尾 0 的处理（SHORTEST 行的 repr 本身没有多余的 0）。
+    """
+    n = len(labels)
+    if n == 0:
+        return ''
+    values_per_line = (labels.lengths * 2).tolist()
+    templates = ['%d' + (' %r' if d == SHORTEST else f' %.{d}f') * k for d, k in zip(labels.decimals.tolist(), values_per_line)]
+    flat = labels.coords.reshape(-1).tolist()
+    args = []
+    starts = (labels.offsets[:-1] * 2).tolist()
+    for cid, start, k in zip(labels.class_ids.tolist(), starts, values_per_line):
+        args.append(cid)
+        args.extend(flat[start:start + k])
+    text = '\n'.join(templates) % tuple(args)
+    if not labels.fixed.all():
+        lines = text.split('\n')
+        for i in np.flatnonzero(~labels.fixed).tolist():
+            lines[i] = _TRAILING_DOT_RE.sub('', _TRAILING_ZEROS_RE.sub(r'\1', lines[i]))
+        text = '\n'.join(lines)
+    return text + '\n'
+
+
+def write_text(path, text: str, atomic: bool = False):
+    """写出文本文件；atomic=True 时先写临时文件再 `os.replace`，中断不会留下半个文件。"""
+    if not atomic:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return
+    tmp = f'{path}.tmp{os.getpid()}'
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def write_yolo_seg(path, labels: SegLabels, atomic: bool = False):
+    """写出 YOLO-seg 文件（见 `write_text`）"""
+    write_text(path, format_yolo_seg(labels), atomic=atomic)
+
+
+def check_round_trip():
+    """解析后写出的文本与原文相同：固定小数位的输入逐字相同，其余（像素坐标、科学计数法、混合小数位）数值相同；
+    remap 只替换类别字段。不满足时抛出 AssertionError"""
+    fixed_cases = ['2 0.300000 0.200000 0.100000 0.400000\n', '0 0.10 0.20 0.30 0.40\n', '0 0.123456 0.999999\n0 1920.5 1080.25\n',
+                   '1 123.456789 45.500000 0.100000 0.200000\n']
+    for text in fixed_cases:
+        out = format_yolo_seg(parse_yolo_seg(text))
+        assert out == text, f'{text!r} -> {out!r}'
+    cases = ['1 123.456789 45.5 0.1 0.2\n', '0 1e-3 0.3 0.2 0.25\n', '0 0.5 0.25 0.125 1.0\n', '3 0.12345678901234567 0.5\n']
+    for text in cases:
+        out = format_yolo_seg(parse_yolo_seg(text))
+        assert [float(v) for v in out.split()] == [float(v) for v in text.split()], f'{text!r} -> {out!r}'
+    text = ('1 0.1 0.2 0.3\nabc 0.1 0.2\n2 0.100000 0.200000 0.300000 0.400000\n5 0.1 0.1 0.2 0.2\n'
+            '1.0 0.10 .5 0.3 0.4\n2.5 0.1 0.2\n1  0.10  .5\n')
+    out, annotations, converted, errors = remap_yolo_seg_text(text, build_class_lut({1: 0, 2: 1}))
+    assert out == '0 0.1 0.2 0.3\n1 0.100000 0.200000 0.300000 0.400000\n0 0.10 .5 0.3 0.4\n0  0.10  .5\n', repr(out)
+    assert (annotations, converted) == (5, 4), (annotations, converted)
+    assert [e[0] for e in errors] == [1, 2, 5, 6], errors
+    print('label_io round-trip check passed')
+
+
+if __name__ == '__main__':
+    check_round_trip()
@@ -0,0 +1,153 @@
+"""文件物化（复制/链接）工具
+
+为数据集划分与数据集增强提供统一的文件落盘方式，替代串行的 `shutil.copy` / `shutil.copytree`：
+
+- copy:     普通复制（`shutil.copy2`，保留时间戳）
+- hardlink: 硬链接，不占用额外磁盘空间；跨文件系统或不支持时自动回退为 copy
+- reflink:  写时复制克隆（Linux 上的 Btrfs/XFS 等，通过 FICLONE ioctl）；不支持时自动回退为 copy
+- symlink:  符号链接（指向源文件绝对路径）；无权限（如 Windows 未开启开发者模式）时自动回退为 copy
+
+所有文件通过线程池并发处理（I/O 密集，线程即可），结束后打印吞吐统计。
+
+注意：hardlink 与源文件共享同一份数据，之后若有脚本“原地”改写目标文件，源文件也会被修改。
+因此推荐只对图片使用链接模式，标签等会被编辑的小文件仍使用 copy。
+"""
+import os
+import sys
+import time
+import shutil
+import errno
+from concurrent.futures import ThreadPoolExecutor
+
+MODES = ('copy', 'hardlink', 'reflink', 'symlink')
+
+# linux/fs.h: #define FICLONE _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError(errno.EOPNOTSUPP, 'reflink is not supported on this platform')
+    with open(src, 'rb') as fs, open(dst, 'wb') as fd:
+        try:
+            fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+        except OSError:
+            fd.close()
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def is_unchanged(src, dst) -> bool:
+    """`dst` 已是 `src` 的链接，或大小与修改时间都相同（copy2 会保留修改时间）"""
+    try:
+        if os.path.samefile(src, dst):
+            return True
+        s, d = os.stat(src), os.stat(dst)
+    except OSError:
+        return False
+    return s.st_size == d.st_size and s.st_mtime_ns == d.st_mtime_ns
+
+
+def materialize_file(src, dst, mode='copy', skip_unchanged=False) -> str:
+    """把 `src` 物化到 `dst`，返回实际使用的方式（链接失败回退时为 'copy'，跳过时为 'skip'）。
+
+    `dst` 若已存在会先删除再创建，避免向指向源文件的硬链接/符号链接中写入而破坏源文件。
+    skip_unchanged=True 时，未变化的已有目标文件直接跳过（用于增量运行）。
+    """
+    if mode not in MODES:
+        raise ValueError(f'unknown materialize mode: {mode} (expected one of {MODES})')
+    if skip_unchanged and os.path.lexists(dst) and is_unchanged(src, dst):
+        return 'skip'
+    if os.path.lexists(dst):
+        os.unlink(dst)
+    if mode != 'copy':
+        try:
+            if mode == 'hardlink':
+                os.link(src, dst)
+            elif mode == 'symlink':
+                os.symlink(os.path.abspath(src), dst)
+            else:
+                _reflink(src, dst)
+            return mode
+        except (OSError, NotImplementedError):
+            # EXDEV（跨文件系统）、EPERM、EOPNOTSUPP 等：回退为普通复制
+            if os.path.lexists(dst):
+                os.unlink(dst)
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def materialize_files(pairs, mode='copy', workers=8, desc='materialize', verbose=True, skip_unchanged=False) -> dict:
+    """并发物化 `(src, dst)` 列表，目标目录需已存在或会被自动创建。
+
+    返回统计 dict：files, bytes, seconds, modes（实际方式计数）, fallback, failed, errors。
+    单个文件失败不会中断整体，错误信息收集在 `errors` 中。
+    """
+    pairs = list(pairs)
+    stats = {'files': 0, 'bytes': 0, 'seconds': 0.0, 'modes': {}, 'fallback': 0, 'failed': 0, 'errors': []}
+    for d in {os.path.dirname(os.fspath(dst)) for _, dst in pairs}:
+        if d:
+            os.makedirs(d, exist_ok=True)
+
+    def _one(pair):
+        src, dst = pair
+        used = materialize_file(src, dst, mode, skip_unchanged)
+        return used, os.path.getsize(src)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, int(workers or 1))) as ex:
+        futures = [(pair, ex.submit(_one, pair)) for pair in pairs]
+        for (src, dst), fut in futures:
+            try:
+                used, size = fut.result()
+            except Exception as e:
+                stats['failed'] += 1
+                stats['errors'].append(f'{src} -> {dst}: {e}')
+                continue
+            stats['files'] += 1
+            stats['bytes'] += size
+            stats['modes'][used] = stats['modes'].get(used, 0) + 1
+            if used not in (mode, 'skip'):
+                stats['fallback'] += 1
+    stats['seconds'] = time.perf_counter() - start
+
+    if verbose:
+        for err in stats['errors']:
+            print(f'⚠ 物化失败: {err}', file=sys.stderr)
+        print_summary(stats, mode, desc)
+    return stats
+
+
+def materialize_tree(src_dir, dst_dir, mode='copy', workers=8, desc=None, verbose=True, skip_unchanged=False) -> dict:
+    """递归物化整个目录（替代 `shutil.copytree`，目标目录已存在时按文件合并）。"""
+    pairs = []
+    for dirpath, _, filenames in os.walk(src_dir):
+        rel = os.path.relpath(dirpath, src_dir)
+        target = os.path.normpath(os.path.join(dst_dir, rel))
+        os.makedirs(target, exist_ok=True)
+        for name in filenames:
+            pairs.append((os.path.join(dirpath, name), os.path.join(target, name)))
+    return materialize_files(pairs, mode=mode, workers=workers, desc=desc or f'{src_dir} -> {dst_dir}', verbose=verbose, skip_unchanged=skip_unchanged)
+
+
+def merge_stats(*stats_list) -> dict:
+    """合并多次 materialize_* 的统计结果（用于打印总的吞吐统计）。"""
+    total = {'files': 0, 'bytes': 0, 'seconds': 0.0, 'modes': {}, 'fallback': 0, 'failed': 0, 'errors': []}
+    for st in stats_list:
+        for key in ('files', 'bytes', 'seconds', 'fallback', 'failed'):
+            total[key] += st[key]
+        for m, n in st['modes'].items():
+            total['modes'][m] = total['modes'].get(m, 0) + n
+        total['errors'].extend(st['errors'])
+    return total
+
+
+def print_summary(stats: dict, mode: str, desc: str = 'materialize'):
+    secs = max(stats['seconds'], 1e-9)
+    mb = stats['bytes'] / (1024 * 1024)
+    modes = ' '.join(f'{m}={n}' for m, n in sorted(stats['modes'].items())) or '-'
+    print(f"📦 {desc} [{mode}]: {stats['files']} 个文件, {mb:.1f} MB, 用时 {stats['seconds']:.2f}s "
+          f"({mb / secs:.1f} MB/s, {stats['files'] / secs:.0f} 文件/s) | {modes} 回退={stats['fallback']} 失败={stats['failed']}")
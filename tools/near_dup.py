@@ -0,0 +1,362 @@
+"""近重复图片索引（感知哈希 + 多索引哈希）
+
+数据集以视频帧为主，相邻帧几乎相同；若被随机分到 train 与 val，验证指标会虚高。这里：
+
+- 每张图片计算 64 位感知哈希：
+  - dhash：灰度缩放到 9x8，比较水平相邻像素
+  - phash：灰度缩放到 32x32，二维 DCT 后取左上 8x8 低频，与其中位数比较
+  图片以降采样方式解码（IMREAD_REDUCED_GRAYSCALE_*），缩放在线程池中完成，哈希对所有图片一次向量化计算。
+- 多索引哈希（Norouzi et al., "Fast Search in Hamming Space with Multi-Index Hashing"）：
+  把 64 位哈希切成 m 段，汉明距离不超过 max_distance 的两张图片至少有一段的距离不超过 max_distance // m；
+  每段按取值排序，对每个元素探查该段中距离不超过 max_distance // m 的所有取值（翻转至多这么多位），
+  候选对立即用向量化 popcount 校验，只保留真正的近重复对。段宽取约 log2(N)（段数 m 按估算的
+  探查 + 校验工作量选择），每个桶平均只有 O(1) 个元素，总工作量近似线性；候选对按块（PAIR_BLOCK）
+  展开和校验，内存与真正的近重复对数成正比，而不是 N²。完全相同的哈希先合并。
+- 校验通过的图片对用并查集（向量化的最小标签传播）合并为近重复簇，clusters() 返回每张图片的簇编号。
+
+哈希可缓存到 JSON（按路径记录 size / mtime_ns / 哈希），未变化的图片再次运行时不重新解码。
+
+用法：
+    index = NearDupIndex.build(image_paths, method='dhash', workers=8, cache_path='.phash_cache.json')
+    labels = index.clusters(max_distance=5)     # labels[i] 相同的图片属于同一近重复簇
+    hits = index.query(index.hashes[0], max_distance=5)
+"""
+import os
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+METHODS = {'dhash': (9, 8), 'phash': (32, 32)}
+DEFAULT_MAX_DISTANCE = 5
+_POP8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+# 每次展开并校验的候选对数上限（大桶按块处理，限制峰值内存）
+PAIR_BLOCK = 1 << 22
+_REDUCED = ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8), (4, cv2.IMREAD_REDUCED_GRAYSCALE_4), (2, cv2.IMREAD_REDUCED_GRAYSCALE_2))
+
+
+def popcount64(x) -> np.ndarray:
+    """uint64 数组逐元素的 1 的个数"""
+    x = np.ascontiguousarray(x, dtype=np.uint64)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x).astype(np.int64)
+    return _POP8[x.view(np.uint8).reshape(-1, 8)].sum(axis=1, dtype=np.int64).reshape(x.shape)
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    m = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m.astype(np.float32)
+
+
+def _pack_bits(bits) -> np.ndarray:
+    """(N, 64) 布尔数组 -> (N,) uint64（第一位为最高位）"""
+    packed = np.packbits(bits.astype(np.uint8), axis=1)
+    return packed.view('>u8').ravel().astype(np.uint64)
+
+
+def hash_thumbnails(thumbs, method='dhash') -> np.ndarray:
+    """对一批缩略图（N, H, W，uint8 灰度，尺寸见 METHODS）一次性计算 64 位感知哈希"""
+    a = np.asarray(thumbs, dtype=np.float32)
+    if len(a) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    if method == 'dhash':
+        bits = (a[:, :, 1:] > a[:, :, :-1]).reshape(len(a), 64)
+    elif method == 'phash':
+        d = _dct_matrix(32)
+        low = (d @ a @ d.T)[:, :8, :8].reshape(len(a), 64)
+        bits = low > np.median(low, axis=1, keepdims=True)
+    else:
+        raise ValueError(f'unknown hash method: {method} (expected one of {tuple(METHODS)})')
+    return _pack_bits(bits)
+
+
+def load_thumbnail(path, method='dhash') -> np.ndarray:
+    """降采样解码为灰度图并缩放到哈希所需尺寸（INTER_AREA）"""
+    w, h = METHODS[method]
+    data = np.fromfile(path, dtype=np.uint8)
+    img = None
+    for factor, flag in _REDUCED:
+        img = cv2.imdecode(data, flag)
+        # 降采样后仍需不小于哈希尺寸，否则换较小的降采样倍数
+        if img is None or min(img.shape[:2]) >= max(w, h):
+            break
+    if img is None or min(img.shape[:2]) < max(w, h):
+        img = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise ValueError('解码失败')
+    return cv2.resize(img, (w, h), interpolation=cv2.INTER_AREA)
+
+
+def _flip_masks(width, radius) -> np.ndarray:
+    """width 位内翻转至多 radius 位的全部掩码（含 0）"""
+    masks = [0]
+    frontier = [(0, -1)]
+    for _ in range(radius):
+        frontier = [(m | (1 << b), b) for m, last in frontier for b in range(last + 1, width)]
+        masks.extend(m for m, _ in frontier)
+    return np.array(masks, dtype=np.uint64)
+
+
+def _plan_chunks(n, max_distance):
+    """选择段宽：按 段数 × 探查数 × (N + N² / 2^段宽) 估算工作量取最小，返回 (各段位宽, 每段探查半径)"""
+    best = None
+    for m in range(1, min(max_distance + 1, 64) + 1):
+        widths = [64 // m + (1 if k < 64 % m else 0) for k in range(m)]
+        radius = max_distance // m
+        probes = sum(_n_masks(w, radius) for w in widths)
+        cost = probes * (n + n * n / 2.0 ** min(widths))
+        if best is None or cost < best[0]:
+            best = (cost, widths, radius)
+    return best[1], best[2]
+
+
+def _n_masks(width, radius) -> int:
+    return sum(math.comb(width, k) for k in range(radius + 1))
+
+
+def _chunk_pairs(uniq, keys, masks, max_distance):
+    """一段上的近重复对：对每个掩码 e，把取值为 key ^ e 的元素配对，立即校验完整哈希的距离；返回 (i, j, 距离)，i < j"""
+    order = np.argsort(keys, kind='stable')
+    sk = keys[order]
+    sh = uniq[order]
+    out_i, out_j, out_d = [], [], []
+    for e in masks:
+        q = sk ^ e
+        lo = np.searchsorted(sk, q, 'left')
+        cnt = np.searchsorted(sk, q, 'right') - lo
+        src = np.flatnonzero(cnt)
+        if not len(src):
+            continue
+        csum = np.cumsum(cnt[src])
+        start = 0
+        while start < len(src):
+            # 本块展开的候选对不超过 PAIR_BLOCK（单个元素的桶更大时自成一块）
+            base = csum[start - 1] if start else 0
+            stop = max(start + 1, int(np.searchsorted(csum, base + PAIR_BLOCK, 'right')))
+            s = src[start:stop]
+            c = cnt[s]
+            a = np.repeat(s, c)
+            offs = np.arange(len(a)) - np.repeat(np.cumsum(c) - c, c)
+            b = np.repeat(lo[s], c) + offs
+            # 每个无序对只保留一次：e 为 0 时去掉自身，e 非 0 时两个方向都会被探查到
+            keep = a < b
+            a, b = a[keep], b[keep]
+            d = popcount64(sh[a] ^ sh[b])
+            ok = d <= max_distance
+            out_i.append(order[a[ok]])
+            out_j.append(order[b[ok]])
+            out_d.append(d[ok])
+            start = stop
+    if not out_i:
+        empty = np.zeros(0, np.int64)
+        return empty, empty, empty
+    return np.concatenate(out_i), np.concatenate(out_j), np.concatenate(out_d)
+
+
+def _components(n, a, b) -> np.ndarray:
+    """无向图 (a[k], b[k]) 的连通分量，返回每个节点所在分量的最小节点编号"""
+    parent = np.arange(n, dtype=np.int64)
+    if len(a) == 0:
+        return parent
+    while True:
+        pa, pb = parent[a], parent[b]
+        if np.array_equal(pa, pb):
+            return parent
+        lo = np.minimum(pa, pb)
+        np.minimum.at(parent, pa, lo)
+        np.minimum.at(parent, pb, lo)
+        while True:
+            nxt = parent[parent]
+            if np.array_equal(nxt, parent):
+                break
+            parent = nxt
+
+
+class NearDupIndex:
+    """一组图片的 64 位感知哈希及近重复查询"""
+
+    def __init__(self, hashes, keys=None, method='dhash', valid=None):
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.keys = list(keys) if keys is not None else list(range(len(self.hashes)))
+        self.method = method
+        # 无法计算哈希的图片 valid 为 False，不参与查询与合并
+        self.valid = np.ones(len(self.hashes), dtype=bool) if valid is None else np.asarray(valid, dtype=bool)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @classmethod
+    def build(cls, paths, method='dhash', workers=8, cache_path=None, verbose=True) -> 'NearDupIndex':
+        """计算 paths 中每张图片的哈希；无法解码的图片标记为无效（不会与任何图片合并）"""
+        if method not in METHODS:
+            raise ValueError(f'unknown hash method: {method} (expected one of {tuple(METHODS)})')
+        paths = [os.path.abspath(p) for p in paths]
+        cache = _load_cache(cache_path, method)
+        hashes = np.zeros(len(paths), dtype=np.uint64)
+        todo, stats = [], []
+        for i, p in enumerate(paths):
+            rec = cache.get(p)
+            try:
+                st = os.stat(p)
+            except OSError:
+                st = None
+            if rec and st and rec[0] == st.st_size and rec[1] == st.st_mtime_ns:
+                hashes[i] = np.uint64(int(rec[2], 16))
+            else:
+                todo.append(i)
+            stats.append(st)
+
+        def _one(i):
+            try:
+                return load_thumbnail(paths[i], method)
+            except Exception:
+                return None
+
+        with ThreadPoolExecutor(max_workers=max(1, int(workers or 1))) as ex:
+            thumbs = list(ex.map(_one, todo))
+        ok = [k for k, t in enumerate(thumbs) if t is not None]
+        if ok:
+            hashes[np.array([todo[k] for k in ok])] = hash_thumbnails([thumbs[k] for k in ok], method)
+        failed = [todo[k] for k, t in enumerate(thumbs) if t is None]
+        valid = np.ones(len(paths), dtype=bool)
+        valid[failed] = False
+        for i in failed:
+            print(f'⚠ 无法计算感知哈希：{paths[i]}')
+
+        if cache_path:
+            failed_set = set(failed)
+            entries = {p: [st.st_size, st.st_mtime_ns, f'{int(h):016x}']
+                       for i, (p, st, h) in enumerate(zip(paths, stats, hashes.tolist())) if st and i not in failed_set}
+            tmp = cache_path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'method': method, 'entries': entries}, f, ensure_ascii=False)
+            os.replace(tmp, cache_path)
+        if verbose:
+            print(f'🔍 感知哈希 [{method}]: {len(paths)} 张图片，新计算 {len(todo)}，复用 {len(paths) - len(todo)}，失败 {len(failed)}')
+        return cls(hashes, paths, method, valid)
+
+    def query(self, h, max_distance=DEFAULT_MAX_DISTANCE) -> np.ndarray:
+        """返回与哈希 h 的汉明距离不超过 max_distance 的图片下标（线性向量化扫描）"""
+        dist = popcount64(self.hashes ^ np.uint64(h))
+        return np.flatnonzero((dist <= max_distance) & self.valid)
+
+    def pairs(self, max_distance=DEFAULT_MAX_DISTANCE):
+        """不同哈希值之间的近重复对，返回 (唯一哈希数组, i, j, 距离)，i/j 为唯一哈希中的下标"""
+        uniq = np.unique(self.hashes[self.valid])
+        m = max_distance + 1
+        if max_distance < 0 or len(uniq) < 2 or m > 64:
+            empty = np.zeros(0, np.int64)
+            return uniq, empty, empty, empty
+        widths, radius = _plan_chunks(len(uniq), max_distance)
+        ii, jj, dd = [], [], []
+        shift = 64
+        for w in widths:
+            shift -= w
+            keys = (uniq >> np.uint64(shift)) & np.uint64((1 << w) - 1)
+            a, b, d = _chunk_pairs(uniq, keys, _flip_masks(w, radius), max_distance)
+            if len(a):
+                lo, hi = np.minimum(a, b), np.maximum(a, b)
+                ii.append(lo)
+                jj.append(hi)
+                dd.append(d)
+        if not ii:
+            empty = np.zeros(0, np.int64)
+            return uniq, empty, empty, empty
+        # 同一对可能在多段上都被找到：只保留一次
+        pair, first = np.unique(np.concatenate(ii) * len(uniq) + np.concatenate(jj), return_index=True)
+        return uniq, pair // len(uniq), pair % len(uniq), np.concatenate(dd)[first]
+
+    def clusters(self, max_distance=DEFAULT_MAX_DISTANCE) -> np.ndarray:
+        """近重复簇编号（0..K-1），哈希相同或可经由近重复链连接的图片属于同一簇"""
+        uniq, a, b, _ = self.pairs(max_distance)
+        root = _components(len(uniq), a, b)
+        # 无效图片各自成簇：编号排在所有唯一哈希之后
+        ids = np.empty(len(self), dtype=np.int64)
+        ids[self.valid] = root[np.searchsorted(uniq, self.hashes[self.valid])]
+        ids[~self.valid] = len(uniq) + np.arange(int((~self.valid).sum()))
+        return np.unique(ids, return_inverse=True)[1].reshape(-1)
+
+
+def _load_cache(cache_path, method) -> dict:
+    if not cache_path:
+        return {}
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data.get('entries', {}) if data.get('method') == method else {}
+
+
+def cluster_summary(labels) -> dict:
+    """簇统计：簇数、包含多张图片的簇数、这些簇中的图片数、最大簇大小"""
+    labels = np.asarray(labels)
+    if len(labels) == 0:
+        return {'clusters': 0, 'dup_clusters': 0, 'dup_images': 0, 'largest': 0}
+    sizes = np.bincount(labels)
+    multi = sizes[sizes > 1]
+    return {'clusters': int(len(sizes)), 'dup_clusters': int(len(multi)), 'dup_images': int(multi.sum()),
+            'largest': int(sizes.max())}
+
+
+def check_clusters(sizes=(1, 2, 10, 30, 100, 300), distances=(0, 1, 5, 10), trials=20, seed=0,
+                   large=(100_000, 200_000), large_distances=(5, 10), max_peak_mb=256):
+    """把 clusters() 与两两比较的暴力结果对照（随机哈希 + 人为制造的近重复），不一致时抛出 AssertionError。
+
+    large 中的规模无法暴力比较：随机哈希 + 植入的近重复对，断言植入的对全部被合并、返回的每一对距离都正确、
+    额外的对数与随机哈希偶然相近的期望数相符，且 pairs() 的峰值内存（tracemalloc）不超过 max_peak_mb。
+    """
+    import time
+    import tracemalloc
+    rng = np.random.default_rng(seed)
+    for n in sizes:
+        for max_distance in distances:
+            for _ in range(trials):
+                hashes = rng.integers(0, 1 << 64, n, dtype=np.uint64)
+                # 约一半的图片是另一张图片翻转少量位后的近重复
+                for i in range(1, n):
+                    if rng.random() < 0.5:
+                        flips = rng.choice(64, int(rng.integers(0, max_distance + 2)), replace=False)
+                        hashes[i] = hashes[rng.integers(0, i)] ^ np.uint64(sum(1 << int(b) for b in flips))
+                labels = NearDupIndex(hashes).clusters(max_distance)
+                dist = popcount64(hashes[:, None] ^ hashes[None, :])
+                ii, jj = np.nonzero(dist <= max_distance)
+                expected = _components(n, ii, jj)
+                # 两种编号都表示同一划分：同簇关系逐对相同
+                same = labels[:, None] == labels[None, :]
+                assert np.array_equal(same, expected[:, None] == expected[None, :]), f'clusters mismatch (n={n}, max_distance={max_distance})'
+    print(f'near-duplicate clusters match brute force (sizes={sizes}, distances={distances}, trials={trials})')
+
+    for n in large:
+        for max_distance in large_distances:
+            hashes = rng.integers(0, 1 << 64, n, dtype=np.uint64)
+            # 前 n // 10 张之后每隔一张是前一张翻转 1..max_distance 位的近重复
+            parent = np.arange(n)
+            for i in range(n // 10 + 1, n, 2):
+                flips = rng.choice(64, int(rng.integers(1, max_distance + 1)), replace=False)
+                hashes[i] = hashes[i - 1] ^ np.uint64(sum(1 << int(b) for b in flips))
+                parent[i] = i - 1
+            index = NearDupIndex(hashes)
+            start = time.perf_counter()
+            tracemalloc.start()
+            uniq, a, b, dist = index.pairs(max_distance)
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+            elapsed = time.perf_counter() - start
+            labels = index.clusters(max_distance)
+            assert np.array_equal(dist, popcount64(uniq[a] ^ uniq[b])) and (dist <= max_distance).all(), f'bad pair distance (n={n})'
+            assert (labels[parent] == labels).all(), f'planted pair not merged (n={n}, max_distance={max_distance})'
+            # 随机哈希之间偶然距离 ≤ max_distance 的对极少（max_distance=5 时期望远小于 1）
+            extra = len(a) - len(range(n // 10 + 1, n, 2))
+            assert 0 <= extra <= n * n * sum(math.comb(64, k) for k in range(max_distance + 1)) / 2.0 ** 64 * 10 + 2, \
+                f'unexpected pairs: {extra} (n={n}, max_distance={max_distance})'
+            assert peak <= max_peak_mb, f'peak memory {peak:.0f} MB > {max_peak_mb} MB (n={n}, max_distance={max_distance})'
+            print(f'n={n} max_distance={max_distance}: {elapsed:.2f}s, peak {peak:.0f} MB')
+
+
+if __name__ == '__main__':
+    check_clusters()
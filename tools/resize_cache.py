@@ -0,0 +1,182 @@
+"""训练尺寸图片缓存（数据集划分时预先缩放）
+
+Ultralytics 训练时（cache=True）每次新的训练都要把原始分辨率的照片解码、缩放到 imgsz 后放入内存，
+启动时间与内存占用随原图分辨率增长。这里在划分数据集时把图片按 Ultralytics 相同的规则
+（长边缩放到 imgsz、保持宽高比、只缩小不放大）预先缩放并保存到 `datasets/<name>/images_<imgsz>/`，
+划分出的 images/{train,val,test} 再从缓存物化（硬链接）。训练时图片已是目标尺寸，不再缩放。
+
+- 宽高比不变，YOLO 归一化坐标的标注不需要修改
+- 缓存文件以源图片内容 sha1 命名，索引（.resize_index.json）记录每个源文件的 size / mtime_ns / sha1：
+  未变化的源文件不重新读取；内容变化后重新生成；源文件删除后对应缓存文件在 save() 时清理
+- 源文件只读取一次：同一份字节既用于计算哈希，也用于解码（JPEG 使用降采样解码）
+- 长边不大于 imgsz 的图片不生成缓存，直接使用原图
+
+用法：
+    cache = ResizeCache('datasets/tomato/images_416', 416)
+    mapping = cache.build(image_paths, workers=8)   # {源图片: 用于训练的图片}
+    cache.save()
+"""
+import io
+import os
+import json
+import math
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+INDEX_FILENAME = '.resize_index.json'
+JPEG_QUALITY = 95
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def target_size(w, h, imgsz):
+    """与 Ultralytics load_image 相同的缩放尺寸：长边为 imgsz；不需要缩小时返回 None"""
+    r = imgsz / max(w, h)
+    if r >= 1:
+        return None
+    return min(math.ceil(w * r), imgsz), min(math.ceil(h * r), imgsz)
+
+
+def resize_bytes(data, ext, imgsz, quality=JPEG_QUALITY):
+    """把编码后的图片字节缩放到长边 imgsz，返回编码后的字节；不需要缩小时返回 None"""
+    with Image.open(io.BytesIO(data)) as im:
+        (w, h), fmt = im.size, im.format
+    size = target_size(w, h, imgsz)
+    if size is None:
+        return None
+    flag = cv2.IMREAD_COLOR
+    if fmt == 'JPEG':
+        for factor, reduced in _REDUCED_FLAGS:
+            if min(w, h) // factor >= min(size):
+                flag = reduced
+                break
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+    if img is None:
+        raise ValueError('解码失败')
+    if w != h and (img.shape[1] > img.shape[0]) != (w > h):
+        # 解码时按 EXIF 方向旋转后宽高互换（与 Ultralytics 使用 cv2.imread 读取的结果一致）
+        size = size[::-1]
+    img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality] if ext in ('.jpg', '.jpeg') else []
+    ok, buf = cv2.imencode(ext, img, params)
+    if not ok:
+        raise ValueError('编码失败')
+    return buf.tobytes()
+
+
+class ResizeCache:
+    def __init__(self, cache_dir, imgsz, quality=JPEG_QUALITY):
+        self.cache_dir = cache_dir
+        self.imgsz = int(imgsz)
+        self.quality = quality
+        self.index_path = os.path.join(cache_dir, INDEX_FILENAME)
+        self.entries = {}
+        self.used = set()
+        self.stats = {'hit': 0, 'built': 0, 'original': 0, 'failed': 0, 'removed': 0, 'seconds': 0.0}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        # 尺寸或质量变化后旧缓存全部失效
+        if data.get('imgsz') == self.imgsz and data.get('quality') == self.quality:
+            self.entries = data.get('entries', {})
+
+    def _cache_path(self, sha1, ext):
+        return os.path.join(self.cache_dir, sha1 + ext)
+
+    def _resolve(self, src, rec):
+        return src if rec['file'] is None else os.path.join(self.cache_dir, rec['file'])
+
+    def _lookup(self, src, st):
+        """源文件 size / mtime 未变化且缓存文件存在时返回记录"""
+        rec = self.entries.get(src)
+        if rec and rec['size'] == st.st_size and rec['mtime_ns'] == st.st_mtime_ns:
+            if rec['file'] is None or os.path.exists(os.path.join(self.cache_dir, rec['file'])):
+                return rec
+        return None
+
+    def _build_one(self, src):
+        """返回 (记录, 状态)，状态为 'hit' / 'built' / 'original'"""
+        st = os.stat(src)
+        rec = self._lookup(src, st)
+        if rec is not None:
+            return rec, 'hit'
+        with open(src, 'rb') as f:
+            data = f.read()
+        sha1 = hashlib.sha1(data).hexdigest()
+        ext = os.path.splitext(src)[1].lower()
+        rec = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha1': sha1, 'file': sha1 + ext}
+        dst = self._cache_path(sha1, ext)
+        if os.path.exists(dst):
+            # 内容相同（只是 mtime 变化，或与其他图片重复）
+            return rec, 'hit'
+        out = resize_bytes(data, ext, self.imgsz, self.quality)
+        if out is None:
+            rec['file'] = None
+            return rec, 'original'
+        tmp = f'{dst}.tmp{os.getpid()}_{id(data)}'
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(out)
+            os.replace(tmp, dst)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        return rec, 'built'
+
+    def build(self, paths, workers=8, verbose=True):
+        """为所有源图片准备缓存，返回 {源图片路径: 训练使用的图片路径}；失败的图片回退为原图"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        paths = [os.path.abspath(p) for p in paths]
+        mapping = {}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, int(workers or 1))) as ex:
+            for src, fut in [(p, ex.submit(self._build_one, p)) for p in paths]:
+                try:
+                    rec, status = fut.result()
+                except Exception as e:
+                    self.stats['failed'] += 1
+                    print(f'⚠ 缩放缓存失败，使用原图：{src}（{e}）')
+                    mapping[src] = src
+                    continue
+                self.entries[src] = rec
+                self.used.add(src)
+                self.stats[status] += 1
+                mapping[src] = self._resolve(src, rec)
+        self.stats['seconds'] += time.perf_counter() - start
+        if verbose:
+            print(self.summary())
+        return mapping
+
+    def prune(self):
+        """删除本次未使用的索引条目，以及不再被任何条目引用的缓存文件，返回删除的文件数"""
+        self.entries = {k: v for k, v in self.entries.items() if k in self.used}
+        referenced = {rec['file'] for rec in self.entries.values() if rec['file']}
+        for name in os.listdir(self.cache_dir):
+            if name != INDEX_FILENAME and name not in referenced and '.tmp' not in name:
+                os.unlink(os.path.join(self.cache_dir, name))
+                self.stats['removed'] += 1
+        return self.stats['removed']
+
+    def save(self, prune=True):
+        """（可选清理后）先写临时文件再原子替换索引"""
+        if prune:
+            self.prune()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'imgsz': self.imgsz, 'quality': self.quality, 'entries': self.entries}, f, ensure_ascii=False)
+        os.replace(tmp, self.index_path)
+
+    def summary(self):
+        s = self.stats
+        return (f"🗜 缩放缓存 [imgsz={self.imgsz}]: 复用 {s['hit']}，新生成 {s['built']}，原图 {s['original']}，"
+                f"失败 {s['failed']}，用时 {s['seconds']:.2f}s -> {self.cache_dir}")
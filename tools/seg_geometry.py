@@ -0,0 +1,146 @@
+"""YOLO-seg 多边形几何变换（向量化，作用于 tools/label_io.py 的 SegLabels）
+
+所有多边形的点保存在一个 (P, 2) 数组中，变换与裁剪对整个文件一次完成，不逐个多边形循环：
+
+- affine_normalized: 归一化坐标的缩放 + 平移（裁剪、缩放、翻转都可以写成这种形式）
+- transform_normalized: 一般的 2x2 线性变换 + 平移（90° 旋转会交换 x / y）
+- clip_to_rect:      同 clip_to_unit，裁剪窗口为任意矩形（拼接 mosaic 时裁剪到各自的象限）
+- concat_labels:     把多个 SegLabels 拼接为一个
+- clip_to_unit:      用 Sutherland–Hodgman 算法把多边形裁剪到 [0, 1] × [0, 1] 窗口内，
+                     四条边界各做一次，每次对所有顶点向量化计算
+- drop_degenerate:   删除点数少于 3 或面积过小的多边形
+
+用法（居中裁剪，坐标按裁剪窗口重新归一化）：
+    labels = read_yolo_seg('labels/a.txt')
+    labels = crop_labels(labels, (w, h), (left, top, side, side))
+"""
+import numpy as np
+
+from .label_io import SegLabels
+
+# 变换后坐标至少保留的小数位数
+MIN_DECIMALS = 6
+
+
+def _next_index(offsets):
+    """每个点在所属多边形中的下一个点（最后一个点回到第一个点）"""
+    n_points = int(offsets[-1])
+    nxt = np.arange(1, n_points + 1, dtype=np.int64)
+    starts, ends = offsets[:-1], offsets[1:]
+    nonempty = ends > starts
+    nxt[ends[nonempty] - 1] = starts[nonempty]
+    return nxt
+
+
+def _with_coords(labels, coords, offsets, keep=None):
+    decimals, fixed, class_ids = labels.decimals, labels.fixed, labels.class_ids
+    if keep is not None:
+        decimals, fixed, class_ids = decimals[keep], fixed[keep], class_ids[keep]
+    return SegLabels(class_ids, coords, offsets, np.maximum(decimals, MIN_DECIMALS), fixed, list(labels.errors))
+
+
+def affine_normalized(labels, scale, offset):
+    """x' = x * scale[0] + offset[0]，y' = y * scale[1] + offset[1]（scale 为负即翻转）"""
+    coords = labels.coords.astype(np.float64) * np.asarray(scale, dtype=np.float64) + np.asarray(offset, dtype=np.float64)
+    return _with_coords(labels, coords, labels.offsets)
+
+
+def transform_normalized(labels, matrix, offset):
+    """p' = matrix @ p + offset（对所有点一次矩阵乘法）"""
+    m = np.asarray(matrix, dtype=np.float64).reshape(2, 2)
+    coords = labels.coords.astype(np.float64) @ m.T + np.asarray(offset, dtype=np.float64)
+    return _with_coords(labels, coords, labels.offsets)
+
+
+def concat_labels(parts) -> SegLabels:
+    """按顺序拼接多个 SegLabels（保留各自的写出格式）"""
+    parts = [p for p in parts if p is not None]
+    if not parts:
+        return SegLabels.empty()
+    offsets = [np.zeros(1, dtype=np.int64)]
+    base = 0
+    for p in parts:
+        offsets.append(p.offsets[1:] + base)
+        base += int(p.offsets[-1])
+    dtype = np.result_type(*[p.coords.dtype for p in parts])
+    return SegLabels(np.concatenate([p.class_ids for p in parts]),
+                     np.concatenate([p.coords.astype(dtype) for p in parts]),
+                     np.concatenate(offsets),
+                     np.concatenate([p.decimals for p in parts]),
+                     np.concatenate([p.fixed for p in parts]),
+                     [e for p in parts for e in p.errors])
+
+
+def _clip_plane(coords, offsets, axis, bound, keep_greater):
+    """用一条边界 coords[:, axis] = bound 裁剪所有多边形（Sutherland–Hodgman 的一步）"""
+    if len(coords) == 0:
+        return coords, offsets
+    nxt = _next_index(offsets)
+    v = coords[:, axis]
+    inside = v >= bound if keep_greater else v <= bound
+    in_next = inside[nxt]
+    emit_cur = inside
+    emit_cross = inside != in_next
+    counts = emit_cur.astype(np.int64) + emit_cross
+
+    # 交点：P + t (Q - P)，只在两端点分居边界两侧时计算
+    p, q = coords[emit_cross], coords[nxt[emit_cross]]
+    t = (bound - p[:, axis]) / (q[:, axis] - p[:, axis])
+    cross = p + t[:, None] * (q - p)
+    cross[:, axis] = bound
+
+    # 每个点依次输出：自身（在内侧时）、与下一个点连线的交点（跨越边界时）
+    cs = np.zeros(len(coords) + 1, dtype=np.int64)
+    np.cumsum(counts, out=cs[1:])
+    out = np.empty((int(cs[-1]), 2), dtype=coords.dtype)
+    out[cs[:-1][emit_cur]] = coords[emit_cur]
+    out[cs[:-1][emit_cross] + emit_cur[emit_cross]] = cross
+    return out, cs[offsets]
+
+
+def polygon_areas(coords, offsets):
+    """每个多边形的面积（鞋带公式，向量化）"""
+    n = len(offsets) - 1
+    if len(coords) == 0:
+        return np.zeros(n)
+    nxt = _next_index(offsets)
+    cross = coords[:, 0] * coords[nxt, 1] - coords[nxt, 0] * coords[:, 1]
+    cs = np.zeros(len(coords) + 1)
+    np.cumsum(cross, out=cs[1:])
+    return np.abs(cs[offsets[1:]] - cs[offsets[:-1]]) / 2
+
+
+def drop_degenerate(labels, min_area=1e-6, min_points=3):
+    """删除点数不足或面积（归一化坐标下）过小的多边形，返回 (labels, 删除数量)"""
+    areas = polygon_areas(labels.coords.astype(np.float64), labels.offsets)
+    keep = (labels.lengths >= min_points) & (areas > min_area)
+    if keep.all():
+        return labels, 0
+    return labels.select(keep), int((~keep).sum())
+
+
+def clip_to_rect(labels, rect, min_area=1e-6):
+    """把多边形裁剪到 rect=(x0, y0, x1, y1)（归一化坐标）并删除退化多边形，返回 (labels, 删除数量)"""
+    x0, y0, x1, y1 = rect
+    coords = labels.coords.astype(np.float64)
+    offsets = labels.offsets
+    for axis, lo, hi in ((0, x0, x1), (1, y0, y1)):
+        coords, offsets = _clip_plane(coords, offsets, axis, float(lo), True)
+        coords, offsets = _clip_plane(coords, offsets, axis, float(hi), False)
+    return drop_degenerate(_with_coords(labels, coords, offsets), min_area)
+
+
+def clip_to_unit(labels, min_area=1e-6):
+    """把多边形裁剪到 [0, 1] × [0, 1] 窗口并删除退化多边形，返回 (labels, 删除数量)"""
+    return clip_to_rect(labels, (0.0, 0.0, 1.0, 1.0), min_area)
+
+
+def crop_labels(labels, image_size, window, min_area=1e-6):
+    """图片裁剪 window=(left, top, width, height)（像素）后对应的标注，返回 (labels, 删除数量)。
+
+    image_size 为原图 (w, h)；裁剪后的坐标按裁剪窗口重新归一化，之后再缩放图片不影响归一化坐标。
+    """
+    w, h = image_size
+    left, top, cw, ch = window
+    scaled = affine_normalized(labels, (w / cw, h / ch), (-left / cw, -top / ch))
+    return clip_to_unit(scaled, min_area)
@@ -0,0 +1,202 @@
+"""YOLO-seg 数据集分片（打包为少量大文件）
+
+每个划分（train / val / test）的图片与 .txt 标注打包进若干个大小约 SHARD_SIZE_MB 的 tar 分片
+（WebDataset 风格：同一样本的 `<stem>.jpg` 与 `<stem>.txt` 相邻存放，可以直接用 tar 查看或解包），
+并写出一个偏移索引 `<split>.index.json`，记录每个样本的图片/标注在分片中的字节偏移与长度。
+
+在 NFS、对象存储挂载等单文件打开延迟较高的环境中，打开一个划分只需读取索引与少量分片：
+- ShardReader 用 mmap 打开分片，按索引随机读取任意样本（不解析 tar 头）
+- 顺序迭代按分片内顺序读取，相当于对几个大文件做顺序读
+- extract() 可把划分解包到本地磁盘（例如训练前解包到本机 SSD），得到 Ultralytics 可直接使用的 images/labels 目录
+
+索引格式：
+    {"version": 1, "split": "train", "shards": ["train-00000.tar", ...],
+     "samples": [[stem, 分片序号, 图片文件名, 图片偏移, 图片长度, 标注偏移, 标注长度], ...]}
+没有标注的样本标注偏移与长度为 -1 / 0。
+
+用法：
+    write_shards(samples, 'datasets/tomato/shards', 'train')   # samples: [(stem, 图片路径, 标注路径), ...]
+    reader = ShardReader('datasets/tomato/shards', 'train')
+    img, labels = reader[0]
+"""
+import io
+import os
+import json
+import mmap
+import time
+import tarfile
+
+import cv2
+import numpy as np
+
+from .label_io import parse_yolo_seg
+
+SHARD_SIZE_MB = 256
+INDEX_VERSION = 1
+_BLOCK = tarfile.BLOCKSIZE
+
+
+def index_path(shard_dir, split):
+    return os.path.join(shard_dir, f'{split}.index.json')
+
+
+def _add_bytes(tar, name, data, mtime):
+    """向 tar 追加一个文件，返回数据在 tar 文件中的偏移"""
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = mtime
+    tar.addfile(info, io.BytesIO(data))
+    # addfile 写完头、数据与填充后 tar.offset 指向下一个成员，数据位于填充之前
+    padded = (len(data) + _BLOCK - 1) // _BLOCK * _BLOCK
+    return tar.offset - padded
+
+
+def write_shards(samples, shard_dir, split, shard_size_mb=SHARD_SIZE_MB, verbose=True):
+    """把 samples [(stem, 图片路径, 标注路径或 None), ...] 打包为分片并写出索引，返回统计 dict。
+
+    先写临时文件再替换（分片与索引），中断后旧的分片仍然可用。
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    limit = max(1, int(shard_size_mb * 1024 * 1024))
+    shards, index = [], []
+    tar = None
+    tmp_paths = []
+    total_bytes = 0
+    start = time.perf_counter()
+
+    def _open_next():
+        name = f'{split}-{len(shards):05d}.tar'
+        tmp = os.path.join(shard_dir, name + '.tmp')
+        shards.append(name)
+        tmp_paths.append(tmp)
+        return tarfile.open(tmp, 'w', format=tarfile.PAX_FORMAT)
+
+    try:
+        for stem, img_path, txt_path in samples:
+            if tar is None or tar.offset >= limit:
+                if tar is not None:
+                    tar.close()
+                tar = _open_next()
+            with open(img_path, 'rb') as f:
+                img_bytes = f.read()
+            mtime = int(os.path.getmtime(img_path))
+            img_name = stem + os.path.splitext(img_path)[1].lower()
+            img_off = _add_bytes(tar, img_name, img_bytes, mtime)
+            txt_off, txt_len = -1, 0
+            if txt_path and os.path.exists(txt_path):
+                with open(txt_path, 'rb') as f:
+                    txt_bytes = f.read()
+                txt_off, txt_len = _add_bytes(tar, stem + '.txt', txt_bytes, mtime), len(txt_bytes)
+            total_bytes += len(img_bytes) + txt_len
+            index.append([stem, len(shards) - 1, img_name, img_off, len(img_bytes), txt_off, txt_len])
+        if tar is not None:
+            tar.close()
+            tar = None
+        for name, tmp in zip(shards, tmp_paths):
+            os.replace(tmp, os.path.join(shard_dir, name))
+    finally:
+        if tar is not None:
+            tar.close()
+        for tmp in tmp_paths:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    # 删除上一次导出留下、本次不再使用的分片
+    prefix = f'{split}-'
+    for name in os.listdir(shard_dir):
+        if name.startswith(prefix) and name.endswith('.tar') and name not in shards:
+            os.unlink(os.path.join(shard_dir, name))
+
+    path = index_path(shard_dir, split)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'version': INDEX_VERSION, 'split': split, 'shards': shards, 'samples': index}, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+    stats = {'samples': len(index), 'shards': len(shards), 'bytes': total_bytes, 'seconds': time.perf_counter() - start}
+    if verbose:
+        mb = total_bytes / (1024 * 1024)
+        print(f"🗃 {split} 分片: {stats['samples']} 个样本 -> {stats['shards']} 个分片, {mb:.1f} MB, "
+              f"用时 {stats['seconds']:.2f}s -> {shard_dir}")
+    return stats
+
+
+class ShardReader:
+    """按索引随机读取分片中的样本：reader[i] -> (图片 BGR ndarray, SegLabels)"""
+
+    def __init__(self, shard_dir, split):
+        self.shard_dir = shard_dir
+        with open(index_path(shard_dir, split), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != INDEX_VERSION:
+            raise ValueError(f"不支持的分片索引版本: {data.get('version')}")
+        self.split = split
+        self.shards = data['shards']
+        self.samples = data['samples']
+        self._maps = [None] * len(self.shards)
+        self._files = [None] * len(self.shards)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def _map(self, shard):
+        m = self._maps[shard]
+        if m is None:
+            f = open(os.path.join(self.shard_dir, self.shards[shard]), 'rb')
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._files[shard], self._maps[shard] = f, m
+        return m
+
+    @property
+    def stems(self):
+        return [s[0] for s in self.samples]
+
+    def read_raw(self, i):
+        """返回 (stem, 图片文件名, 图片字节, 标注字节或 None)"""
+        stem, shard, img_name, img_off, img_len, txt_off, txt_len = self.samples[i]
+        m = self._map(shard)
+        img = m[img_off:img_off + img_len]
+        txt = m[txt_off:txt_off + txt_len] if txt_off >= 0 else None
+        return stem, img_name, img, txt
+
+    def __getitem__(self, i):
+        stem, _, img_bytes, txt = self.read_raw(i)
+        img = cv2.imdecode(np.frombuffer(img_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        labels = parse_yolo_seg(txt.decode('utf-8') if txt is not None else '')
+        return img, labels
+
+    def __iter__(self):
+        # 索引按写入顺序排列，顺序迭代即按分片顺序读取
+        for i in range(len(self)):
+            yield self[i]
+
+    def extract(self, dst_root, verbose=True):
+        """解包为 dst_root/images/<split>/ 与 dst_root/labels/<split>/（Ultralytics 目录结构），返回样本数"""
+        img_dir = os.path.join(dst_root, 'images', self.split)
+        txt_dir = os.path.join(dst_root, 'labels', self.split)
+        os.makedirs(img_dir, exist_ok=True)
+        os.makedirs(txt_dir, exist_ok=True)
+        start = time.perf_counter()
+        for i in range(len(self)):
+            stem, img_name, img, txt = self.read_raw(i)
+            with open(os.path.join(img_dir, img_name), 'wb') as f:
+                f.write(img)
+            if txt is not None:
+                with open(os.path.join(txt_dir, stem + '.txt'), 'wb') as f:
+                    f.write(txt)
+        if verbose:
+            print(f"📂 {self.split} 已解包 {len(self)} 个样本，用时 {time.perf_counter() - start:.2f}s -> {dst_root}")
+        return len(self)
+
+    def close(self):
+        for i, m in enumerate(self._maps):
+            if m is not None:
+                m.close()
+                self._files[i].close()
+        self._maps = [None] * len(self.shards)
+        self._files = [None] * len(self.shards)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,137 @@
+"""标签快照备份（内容寻址）
+
+替代“每次运行前完整复制整个 labels 目录”的备份方式：只在文件即将被改写时保存其原始内容，
+备份耗时与磁盘占用只与实际改动的文件数量有关，并且可以保留多次运行的历史。
+
+目录结构（`store_dir`）：
+- blobs/<sha1[:2]>/<sha1>   文件原始内容，按 sha1 去重（相同内容只保存一份）
+- runs/<run_id>.jsonl       每次运行一个清单（JSON-lines）：
+    {"type": "run", "run_id": ..., "created": ..., "root": ..., "note": ...}
+    {"type": "file", "path": <相对 root 的路径>, "sha1": ...}
+
+清单的每条 file 记录在文件被改写之前追加写入（多进程同时追加也安全），
+运行中途中断时已改写的文件同样可以恢复。`restore(run_id)` 把清单中的文件全部写回原始内容。
+"""
+import os
+import json
+import hashlib
+import datetime
+from pathlib import Path
+
+
+class SnapshotStore:
+    def __init__(self, store_dir):
+        self.store_dir = Path(store_dir)
+        self.blobs_dir = self.store_dir / 'blobs'
+        self.runs_dir = self.store_dir / 'runs'
+
+    def _manifest(self, run_id: str) -> Path:
+        return self.runs_dir / f'{run_id}.jsonl'
+
+    def _blob(self, sha1: str) -> Path:
+        return self.blobs_dir / sha1[:2] / sha1
+
+    @staticmethod
+    def _append(path: Path, rec: dict):
+        # 单次 write 追加一整行，多个进程同时写同一清单时行不会交错
+        line = (json.dumps(rec, ensure_ascii=False) + '\n').encode('utf-8')
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def begin(self, root, note: str = '') -> str:
+        """开始一次新的快照运行，返回 run_id（时间戳，便于排序）"""
+        self.runs_dir.mkdir(parents=True, exist_ok=True)
+        base = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        run_id, n = base, 1
+        while self._manifest(run_id).exists():
+            n += 1
+            run_id = f'{base}-{n}'
+        self._append(self._manifest(run_id), {
+            'type': 'run', 'run_id': run_id, 'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'root': os.path.abspath(root), 'note': note,
+        })
+        return run_id
+
+    def put_bytes(self, data: bytes) -> str:
+        """保存内容为 blob（已存在则跳过），返回 sha1"""
+        sha1 = hashlib.sha1(data).hexdigest()
+        blob = self._blob(sha1)
+        if not blob.exists():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            tmp = blob.with_name(f'{sha1}.tmp{os.getpid()}')
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, blob)
+        return sha1
+
+    def save_bytes(self, run_id: str, rel_path: str, data: bytes) -> str:
+        """记录文件 `rel_path` 改写前的内容 `data`（调用方需在改写文件之前调用）"""
+        sha1 = self.put_bytes(data)
+        self._append(self._manifest(run_id), {'type': 'file', 'path': rel_path.replace(os.sep, '/'), 'sha1': sha1})
+        return sha1
+
+    def save_file(self, run_id: str, path, root) -> str:
+        with open(path, 'rb') as f:
+            data = f.read()
+        return self.save_bytes(run_id, os.path.relpath(path, root), data)
+
+    def load_run(self, run_id: str):
+        """读取清单，返回 (header, {相对路径: sha1})；同一文件记录多次时保留最早的内容"""
+        path = self._manifest(run_id)
+        if not path.exists():
+            raise FileNotFoundError(f'快照不存在: {run_id} ({path})')
+        header, files = None, {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                if rec.get('type') == 'run':
+                    header = rec
+                elif rec.get('type') == 'file':
+                    files.setdefault(rec['path'], rec['sha1'])
+        if header is None:
+            raise ValueError(f'快照清单缺少 run 记录: {path}')
+        return header, files
+
+    def list_runs(self):
+        """返回所有快照的 (run_id, created, 文件数, note)，按时间排序"""
+        runs = []
+        if not self.runs_dir.exists():
+            return runs
+        for p in sorted(self.runs_dir.glob('*.jsonl')):
+            try:
+                header, files = self.load_run(p.stem)
+            except (OSError, ValueError):
+                continue
+            runs.append((header['run_id'], header.get('created', ''), len(files), header.get('note', '')))
+        return runs
+
+    def restore(self, run_id: str, root=None) -> int:
+        """把快照 `run_id` 中记录的文件恢复为改写前的内容，返回恢复的文件数。
+
+        root 默认使用快照记录的原始目录；每个 blob 写回前校验 sha1，写入使用临时文件 + `os.replace`。
+        """
+        header, files = self.load_run(run_id)
+        root = Path(root or header['root'])
+        restored = 0
+        for rel, sha1 in files.items():
+            with open(self._blob(sha1), 'rb') as f:
+                data = f.read()
+            if hashlib.sha1(data).hexdigest() != sha1:
+                raise ValueError(f'blob 校验失败: {sha1} ({rel})')
+            dst = root / rel
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            tmp = dst.with_name(f'{dst.name}.tmp{os.getpid()}')
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, dst)
+            restored += 1
+        return restored
@@ -0,0 +1,280 @@
+"""分层（按类别与实例数）数据集划分
+
+按图片数量随机切分 7:2:1 / 8:2 时，样本少的类别经常整类落不进 val / test。这里：
+
+1. 流式读取每个标注文件一次（线程池分块读取，只用正则提取每行第一列的类别），
+   得到每张图片的类别直方图：出现的类别与该类别的实例（多边形）数，以 CSR 形式保存；
+2. 用迭代分层（Sechidis et al., 2011, "On the Stratification of Multi-Label Data"）分配图片：
+   每轮取剩余图片最少的类别，把含该类别的图片逐张分给“该类别还缺图片最多”的子集，
+   相同时依次比较该类别还缺的实例数、子集还缺的图片数；不含任何标注的背景图片最后按比例补齐；
+3. 输出每个子集相对全局分布的偏离：类别实例分布与类别图片分布的 Jensen-Shannon 散度（bits），
+   以及全局存在但该子集缺失的类别。
+
+另提供按文件名哈希的确定性划分（hash_split）：每张图片的子集只由 `salt + stem` 的哈希决定，
+与 glob 顺序、随机种子以及数据集中其他图片无关。新增或删除图片不会改变其余图片的归属，
+配合增量物化只需处理变化的部分，不同版本数据集的 val 指标也可以直接比较。
+
+三种划分都可以按组进行（groups[i] 为第 i 张图片的组编号，例如 tools/near_dup.py 得到的近重复簇）：
+同一组的图片总是分到同一个子集，避免相邻视频帧同时出现在 train 与 val 中。
+
+分配循环只对每张图片做几次小数组运算，50 万张图片约数秒；读取标注是主要开销。
+
+用法：
+    hist = read_class_histograms(label_paths, workers=8)
+    assign = stratified_split(hist, [0.7, 0.2, 0.1], seed=42)   # assign[i] 为第 i 张图片的子集序号
+    print_split_report(split_report(hist, assign, ['train', 'test', 'val']), class_list)
+    assign = hash_split(stems, [0.7, 0.2, 0.1], salt='tomato-v1')
+"""
+import re
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# 每行第一列（类别 ID）；与 label_io 一致允许行首空白
+_CLASS_RE = re.compile(rb'^[ \t]*(\d+)(?![\d.])', re.M)
+_CHUNK = 2048
+
+
+class ClassHistogram:
+    """每张图片的类别直方图（CSR）：第 i 张图片的类别为 classes[indptr[i]:indptr[i + 1]]，对应实例数为 counts[...]"""
+
+    def __init__(self, indptr, classes, counts, num_classes=None):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.classes = np.asarray(classes, dtype=np.int32)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        max_class = int(self.classes.max()) + 1 if len(self.classes) else 0
+        self.num_classes = max(num_classes or 0, max_class)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    @property
+    def image_ids(self) -> np.ndarray:
+        """classes/counts 中每一项所属的图片序号"""
+        return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.indptr))
+
+    def presence(self, mask=None) -> np.ndarray:
+        """每个类别出现在多少张图片中（mask 为图片的布尔掩码时只统计这些图片）"""
+        sel = slice(None) if mask is None else mask[self.image_ids]
+        return np.bincount(self.classes[sel], minlength=self.num_classes).astype(np.int64)
+
+    def instances(self, mask=None) -> np.ndarray:
+        """每个类别的实例（多边形）总数"""
+        sel = slice(None) if mask is None else mask[self.image_ids]
+        return np.bincount(self.classes[sel], weights=self.counts[sel], minlength=self.num_classes).astype(np.int64)
+
+
+def _read_chunk(paths):
+    classes, counts, sizes = [], [], []
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                ids = _CLASS_RE.findall(f.read())
+        except FileNotFoundError:
+            ids = []
+        if ids:
+            u, c = np.unique(np.array(ids, dtype=np.int64), return_counts=True)
+            classes.append(u)
+            counts.append(c)
+            sizes.append(len(u))
+        else:
+            sizes.append(0)
+    cat = (lambda a: np.concatenate(a) if a else np.zeros(0, np.int64))
+    return np.array(sizes, dtype=np.int64), cat(classes), cat(counts)
+
+
+def read_class_histograms(label_paths, num_classes=None, workers=8) -> ClassHistogram:
+    """读取 label_paths（顺序与图片一致）中每个 YOLO-seg 标注文件的类别直方图；缺失的文件视为背景图片"""
+    paths = list(label_paths)
+    chunks = [paths[i:i + _CHUNK] for i in range(0, len(paths), _CHUNK)]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        parts = list(ex.map(_read_chunk, chunks))
+    indptr = np.zeros(len(paths) + 1, dtype=np.int64)
+    if parts:
+        np.cumsum(np.concatenate([p[0] for p in parts]), out=indptr[1:])
+        classes = np.concatenate([p[1] for p in parts])
+        counts = np.concatenate([p[2] for p in parts])
+    else:
+        classes = counts = np.zeros(0, np.int64)
+    return ClassHistogram(indptr, classes, counts, num_classes)
+
+
+def group_histogram(hist: ClassHistogram, groups) -> ClassHistogram:
+    """把图片直方图按组（0..K-1）合并：每组的类别为组内出现过的类别，实例数为组内之和"""
+    groups = np.asarray(groups, dtype=np.int64)
+    k = int(groups.max()) + 1 if len(groups) else 0
+    c = hist.num_classes
+    key = groups[hist.image_ids] * max(c, 1) + hist.classes
+    uniq, inverse = np.unique(key, return_inverse=True)
+    counts = np.bincount(inverse.reshape(-1), weights=hist.counts, minlength=len(uniq)).astype(np.int64)
+    indptr = np.zeros(k + 1, dtype=np.int64)
+    np.cumsum(np.bincount(uniq // max(c, 1), minlength=k), out=indptr[1:])
+    return ClassHistogram(indptr, uniq % max(c, 1), counts, c)
+
+
+def group_sizes(groups) -> np.ndarray:
+    groups = np.asarray(groups, dtype=np.int64)
+    return np.bincount(groups, minlength=int(groups.max()) + 1 if len(groups) else 0)
+
+
+def _apportion(n, weights) -> np.ndarray:
+    """最大余数法：把 n 个名额按 weights 分配为整数"""
+    weights = np.maximum(np.asarray(weights, dtype=np.float64), 0)
+    if n <= 0:
+        return np.zeros(len(weights), dtype=np.int64)
+    if weights.sum() <= 0:
+        weights = np.ones(len(weights))
+    exact = weights / weights.sum() * n
+    quota = np.floor(exact).astype(np.int64)
+    rest = n - int(quota.sum())
+    quota[np.argsort(-(exact - quota), kind='stable')[:rest]] += 1
+    return quota
+
+
+def stratified_split(hist: ClassHistogram, ratios, seed=42, sizes=None) -> np.ndarray:
+    """迭代分层划分，返回每个单元（图片或组）的子集序号（对应 ratios 的顺序）。
+
+    sizes 为每个单元包含的图片数（按组划分时使用），用于按图片数而不是单元数满足比例。
+    """
+    ratios = np.asarray(ratios, dtype=np.float64)
+    ratios = ratios / ratios.sum()
+    n, k = len(hist), len(ratios)
+    rng = np.random.default_rng(seed)
+    assign = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return assign
+    sizes = np.ones(n, dtype=np.int64) if sizes is None else np.asarray(sizes, dtype=np.int64)
+
+    presence = hist.presence()
+    want_img = ratios * sizes.sum()
+    want_pres = np.outer(ratios, presence)
+    want_inst = np.outer(ratios, hist.instances()).astype(np.float64)
+    remaining = presence.copy()
+
+    # 每个类别包含的图片，组内按随机顺序排列（代替原算法中的随机打乱）
+    rank = np.empty(n, dtype=np.int64)
+    rank[rng.permutation(n)] = np.arange(n)
+    img_ids = hist.image_ids
+    order = np.lexsort((rank[img_ids], hist.classes))
+    class_imgs = img_ids[order]
+    class_ptr = np.zeros(hist.num_classes + 1, dtype=np.int64)
+    np.cumsum(presence, out=class_ptr[1:])
+
+    indptr, classes, counts = hist.indptr, hist.classes, hist.counts
+    while True:
+        active = remaining > 0
+        if not active.any():
+            break
+        c = int(np.argmin(np.where(active, remaining, np.iinfo(np.int64).max)))
+        imgs = class_imgs[class_ptr[c]:class_ptr[c + 1]]
+        for i in imgs[assign[imgs] < 0].tolist():
+            s0, s1 = indptr[i], indptr[i + 1]
+            cls, cnt = classes[s0:s1], counts[s0:s1]
+            col = want_pres[:, c]
+            cand = np.flatnonzero(col == col.max())
+            if len(cand) > 1:
+                inst = want_inst[cand, c]
+                cand = cand[inst == inst.max()]
+                if len(cand) > 1:
+                    img = want_img[cand]
+                    cand = cand[img == img.max()]
+            s = int(cand[0]) if len(cand) == 1 else int(rng.choice(cand))
+            assign[i] = s
+            want_pres[s, cls] -= 1
+            want_inst[s, cls] -= cnt
+            want_img[s] -= sizes[i]
+            remaining[cls] -= 1
+
+    # 背景图片（组）：按随机顺序逐个分给还缺图片最多的子集
+    bg = np.flatnonzero(assign < 0)
+    if len(bg):
+        bg = bg[np.argsort(rank[bg])]
+        if (sizes[bg] == 1).all():
+            assign[bg] = np.repeat(np.arange(k), _apportion(len(bg), want_img))
+        else:
+            for i in bg.tolist():
+                s = int(np.argmax(want_img))
+                assign[i] = s
+                want_img[s] -= sizes[i]
+    return assign
+
+
+def sequential_split(n_units, ratios, sizes=None) -> np.ndarray:
+    """按给定顺序把单元依次切分到各子集：子集 k 的名额为 int(总图片数 * ratios[k])（最后一个子集取余下全部），
+    单元起始位置落在哪个子集的名额内就分到哪个子集。
+
+    所有单元大小为 1 时与按图片数切片（bases[:int(n * 0.7)] ...）完全相同。
+    """
+    sizes = np.ones(n_units, dtype=np.int64) if sizes is None else np.asarray(sizes, dtype=np.int64)
+    total = int(sizes.sum())
+    bounds = np.cumsum([int(total * r) for r in ratios[:-1]], dtype=np.int64)
+    start = np.cumsum(sizes) - sizes
+    return np.searchsorted(bounds, start, side='right')
+
+
+def stem_hash_unit(stem: str, salt: str = '') -> float:
+    """把 stem 映射到 [0, 1) 上的确定性位置（blake2b 前 8 字节）"""
+    digest = hashlib.blake2b(f'{salt}\0{stem}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2.0 ** 64
+
+
+def hash_split(stems, ratios, salt='') -> np.ndarray:
+    """按 stem 的加盐哈希分桶，返回每个 stem 的子集序号（对应 ratios 的顺序）。
+
+    归属只取决于 (salt, stem, ratios)；更换 salt 会得到另一组完全不同但同样稳定的划分。
+    按组划分时传入每组的代表 stem（例如组内最小的 stem）。
+    """
+    ratios = np.asarray(ratios, dtype=np.float64)
+    bounds = np.cumsum(ratios / ratios.sum())
+    units = np.fromiter((stem_hash_unit(s, salt) for s in stems), dtype=np.float64)
+    # 浮点累加误差可能让最后一个边界略小于 1，这里截断到最后一个子集
+    return np.minimum(np.searchsorted(bounds, units, side='right'), len(ratios) - 1)
+
+
+def _js_divergence(p, q) -> float:
+    """两个计数向量归一化后的 Jensen-Shannon 散度（以 2 为底，范围 [0, 1]）"""
+    p = np.asarray(p, dtype=np.float64)
+    q = np.asarray(q, dtype=np.float64)
+    if p.sum() <= 0 or q.sum() <= 0:
+        return float('nan')
+    p, q = p / p.sum(), q / q.sum()
+    m = (p + q) / 2
+
+    def _kl(a, b):
+        nz = a > 0
+        return float(np.sum(a[nz] * np.log2(a[nz] / b[nz])))
+    return (_kl(p, m) + _kl(q, m)) / 2
+
+
+def split_report(hist: ClassHistogram, assign, split_names) -> dict:
+    """统计每个子集的图片数、各类别实例/图片数及与全局分布的偏离"""
+    assign = np.asarray(assign)
+    g_inst, g_pres = hist.instances(), hist.presence()
+    report = {'images': len(hist), 'instances': g_inst.tolist(), 'presence': g_pres.tolist(), 'splits': {}}
+    for s, name in enumerate(split_names):
+        mask = assign == s
+        inst, pres = hist.instances(mask), hist.presence(mask)
+        report['splits'][name] = {
+            'images': int(mask.sum()),
+            'instances': inst.tolist(),
+            'presence': pres.tolist(),
+            'js_instances': _js_divergence(inst, g_inst),
+            'js_presence': _js_divergence(pres, g_pres),
+            'missing_classes': np.flatnonzero((g_pres > 0) & (pres == 0)).tolist(),
+        }
+    return report
+
+
+def print_split_report(report: dict, class_names=None):
+    def _name(c):
+        return class_names[c] if class_names and c < len(class_names) else str(c)
+
+    total = max(report['images'], 1)
+    print("📊 划分分布（JS 散度越接近 0 越接近全局分布）：")
+    for name, r in report['splits'].items():
+        line = (f"  {name:<5} 图片 {r['images']:>7} ({r['images'] / total:6.1%})  实例 {sum(r['instances']):>8}  "
+                f"JS(实例) {r['js_instances']:.4f}  JS(图片) {r['js_presence']:.4f}")
+        if r['missing_classes']:
+            line += f"  ⚠ 缺少类别: {', '.join(_name(c) for c in r['missing_classes'])}"
+        print(line)
@@ -0,0 +1,148 @@
+"""分块（滑动窗口）推理
+
+高分辨率田间照片直接缩放到 imgsz 时，边缘处的小目标会因分辨率不足而漏检；裁剪中心 ROI 又会丢掉其余区域。
+这里把整张图切成互相重叠的 imgsz × imgsz 小块，按批次推理，把每块的框与掩码平移回整图坐标，
+再用掩码 NMS 合并接缝处被重复检测的目标：至少一方贴着小块内部边缘（被接缝切开）的两个检测用
+交集 / 较小面积（IoS）比较，其余的同类检测对仍用掩码 IoU，不会压掉模型在小块内已经保留的、互相遮挡的不同果实。
+
+内存占用与图片大小无关：
+- 每次只有一个批次的小块（BATCH_SIZE 个 tile）在推理，小块是原图的视图，不复制整图
+- 掩码以 BoxMasks（只保存框内像素，见 tools/seg_masks.py）保存，不会为每个实例分配整图大小的数组
+
+支持 YoloSegOnnx（tools/yolo_seg_onnx.py）与 ultralytics YOLO 两种模型。
+
+用法：
+    from tools.tiled_predict import predict_tiled
+    result = predict_tiled(model, img, imgsz=416, overlap=0.2)
+    annotated = result.plot()
+"""
+import numpy as np
+
+from .seg_masks import BoxMasks
+from .yolo_seg_onnx import SegResult, box_iou, _pt_result_arrays
+
+# 框与小块内部边缘的距离不超过该像素数时视为被接缝切开
+SEAM_MARGIN = 2
+
+
+def tile_starts(length, tile, stride):
+    """一维上的小块起点：步长 stride，最后一块与边缘对齐，保证完整覆盖"""
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile + 1, stride))
+    if starts[-1] != length - tile:
+        starts.append(length - tile)
+    return starts
+
+
+def tile_grid(h, w, tile, overlap=0.2):
+    """整图的小块左上角坐标列表 [(x0, y0), ...]，相邻小块重叠 overlap（比例）"""
+    stride = max(1, int(round(tile * (1 - overlap))))
+    return [(x0, y0) for y0 in tile_starts(h, tile, stride) for x0 in tile_starts(w, tile, stride)]
+
+
+def result_arrays(r):
+    """模型单张结果 -> (boxes, scores, classes, BoxMasks)，支持 SegResult 与 ultralytics Results"""
+    if isinstance(r, SegResult):
+        masks = r.masks if isinstance(r.masks, BoxMasks) else BoxMasks.from_dense(r.masks, r.boxes)
+        return r.boxes, r.scores, r.classes, masks
+    boxes, scores, classes, dense = _pt_result_arrays(r)
+    return boxes, scores, classes, BoxMasks.from_dense(dense, boxes)
+
+
+def mask_overlap(masks, i, j):
+    """两个实例掩码的交集像素数（只比较两个框的重叠区域）"""
+    ax1, ay1, ax2, ay2 = masks.boxes[i]
+    bx1, by1, bx2, by2 = masks.boxes[j]
+    x1, y1, x2, y2 = max(ax1, bx1), max(ay1, by1), min(ax2, bx2), min(ay2, by2)
+    if x2 <= x1 or y2 <= y1:
+        return 0
+    a = masks.crop(i)[y1 - ay1:y2 - ay1, x1 - ax1:x2 - ax1]
+    b = masks.crop(j)[y1 - by1:y2 - by1, x1 - bx1:x2 - bx1]
+    return int(np.count_nonzero(a & b))
+
+
+def mask_nms(boxes, scores, classes, masks, iou_thres=0.5, metric='iou', seam=None):
+    """按类别的掩码 NMS，返回按分数降序保留的下标。
+
+    metric='iou' 使用交并比；metric='ios' 使用交集 / 较小实例面积，接缝处被切掉一部分的目标
+    （与完整目标的 IoU 较低）也能被合并。seam 为每个检测是否贴着小块内部边缘的布尔数组：
+    给出时 IoS 只用于至少一方在接缝上的检测对，其余检测对使用 IoU；为 None 时 metric 作用于所有检测对。
+    """
+    n = len(boxes)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    areas = masks.areas()
+    # 分数相同时优先保留面积大的（接缝处被切掉一部分的目标面积更小）
+    order = np.lexsort((-areas, -scores))
+    suppressed = np.zeros(n, dtype=bool)
+    keep = []
+    for i in order.tolist():
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        # 只对同类且框有重叠的候选计算掩码重叠
+        cand = np.flatnonzero(~suppressed & (classes == classes[i]))
+        cand = cand[cand != i]
+        if not len(cand):
+            continue
+        cand = cand[box_iou(boxes[i:i + 1], boxes[cand])[0] > 0]
+        for j in cand.tolist():
+            inter = mask_overlap(masks, i, j)
+            if metric == 'ios' and (seam is None or seam[i] or seam[j]):
+                denom = min(areas[i], areas[j])
+            else:
+                denom = areas[i] + areas[j] - inter
+            if denom > 0 and inter / denom > iou_thres:
+                suppressed[j] = True
+        suppressed[i] = True
+    return np.asarray(keep, dtype=np.int64)
+
+
+def seam_flags(boxes, x0, y0, tile_w, tile_h, w, h, margin=SEAM_MARGIN):
+    """小块坐标下的框是否贴着小块的内部边缘（与相邻小块的接缝；整图的外边缘不算）"""
+    b = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    return (((b[:, 0] <= margin) & (x0 > 0)) | ((b[:, 2] >= tile_w - margin) & (x0 + tile_w < w)) |
+            ((b[:, 1] <= margin) & (y0 > 0)) | ((b[:, 3] >= tile_h - margin) & (y0 + tile_h < h)))
+
+
+def predict_tiled(model, img, imgsz=416, overlap=0.2, batch_size=8, conf=0.25, iou_merge=0.5,
+                  merge_metric='ios', names=None, **predict_kwargs):
+    """对整张图片做分块推理并合并结果，返回 SegResult（整图坐标，掩码为 BoxMasks）。
+
+    Args:
+        model: YoloSegOnnx 或 ultralytics YOLO，需支持 model.predict(图片列表, imgsz=, conf=)
+        imgsz: 小块边长（与模型输入尺寸相同，小块不再缩放）
+        overlap: 相邻小块的重叠比例，应大于最大目标尺寸 / imgsz 才能保证每个目标至少完整出现在一个小块中
+        batch_size: 每次推理的小块数
+        iou_merge / merge_metric: 合并重复检测的掩码 NMS 阈值与度量（见 mask_nms）；'ios' 只用于
+            至少一方贴着小块内部边缘的检测对，其余检测对使用掩码 IoU
+    """
+    h, w = img.shape[:2]
+    grid = tile_grid(h, w, imgsz, overlap)
+    parts = []
+    for s in range(0, len(grid), batch_size):
+        coords = grid[s:s + batch_size]
+        tiles = [img[y0:y0 + imgsz, x0:x0 + imgsz] for x0, y0 in coords]
+        results = model.predict(tiles, imgsz=imgsz, conf=conf, **predict_kwargs)
+        for (x0, y0), tile, r in zip(coords, tiles, results):
+            boxes, scores, classes, masks = result_arrays(r)
+            if not len(boxes):
+                continue
+            seam = seam_flags(boxes, x0, y0, tile.shape[1], tile.shape[0], w, h)
+            boxes = np.asarray(boxes, dtype=np.float32) + np.array([x0, y0, x0, y0], dtype=np.float32)
+            parts.append((boxes, np.asarray(scores), np.asarray(classes, dtype=np.int64), masks.shift(x0, y0, (h, w)), seam))
+
+    if names is None:
+        names = getattr(model, 'names', {}) or {}
+    if not parts:
+        empty = BoxMasks.concatenate([], (h, w))
+        return SegResult(img, np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64), empty, names)
+
+    boxes = np.concatenate([p[0] for p in parts])
+    scores = np.concatenate([p[1] for p in parts])
+    classes = np.concatenate([p[2] for p in parts])
+    masks = BoxMasks.concatenate([p[3] for p in parts], (h, w))
+    seam = np.concatenate([p[4] for p in parts])
+    keep = mask_nms(boxes, scores, classes, masks, iou_merge, merge_metric, seam)
+    return SegResult(img, boxes[keep], scores[keep], classes[keep], masks.select(keep), names)
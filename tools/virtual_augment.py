@@ -0,0 +1,219 @@
+"""虚拟增强数据集：只保存增强配方（manifest），读取时再生成增强样本
+
+01_dataset_augment.py 默认把每个增强结果写成新的图片 + JSON + TXT，存储随 抽样比例 × 工具数 增长，
+每次写出都要重新编码 JPEG（损失画质并消耗 CPU）。这里改为：
+
+- `build_manifest` 在原始数据集上按 (sample_seed, 工具名, 文件名) 的哈希稳定抽样并抽取参数
+  （与 INCREMENTAL 模式相同的规则），得到确定性的配方列表：每条为 (源文件名, 工具, 参数, 输出名)；
+  manifest 中同时保存工具配置，可存为 JSON 后在训练端重新加载
+- `VirtualAugmentDataset` 按下标（`__getitem__`）或迭代返回样本：读取源图片与标注，
+  在内存中应用 BlurAugment / ColorJitterAugment（只改图片）或几何增强（图片与标注一起变换）；
+  同一源文件的连续样本只解码一次
+- `export` 把配方写成与原来完全相同的文件（复用各增强器的 `augment_loaded`，可多进程），写盘成为可选步骤
+
+返回的样本为 dict：
+    name:   配方名 `<输出前缀>_<源文件名>`（manifest 中的 name，样本的唯一标识）；不一定是 export 写出的文件名：
+            图片名取自实际图片文件的 stem（JSON 的 imagePath 可指向不同名的图片），模糊增强的 TXT 为 `<源文件名><suffix>.txt`
+    files:  export 写出的文件名 {'image': ..., 'json': ..., 'txt': ...}（没有 TXT 时 txt 为 None）；原始样本为源文件名
+    source: 源文件名（stem）
+    tool:   增强工具名（include_sources=True 时原始样本为 None）
+    image:  PIL.Image（RGB）
+    json:   标注 JSON（imagePath 已更新，imageData 已删除，避免返回过期的 base64）
+    labels: YOLO-seg 标注（tools.label_io.SegLabels），没有 TXT 时为 None
+
+用法：
+    manifest = build_manifest('raw_datasets', 'tomato', TOOLS)
+    save_manifest(manifest, 'raw_datasets/tomato.augment_manifest.json')
+    ds = VirtualAugmentDataset.load('raw_datasets/tomato.augment_manifest.json')
+    sample = ds[0]
+    ds.export('raw_datasets', 'tomato_augment', workers=8)
+"""
+import json
+from pathlib import Path
+
+from PIL import Image
+
+from .dataset_augment import (BlurAugment, ColorJitterAugment, FusedAugmentPipeline, SUPPORTED_EXTS, tqdm, log_message, iter_sample_results,
+                              select_samples_stable, locate_image)
+from .geo_augment import GEOMETRIC_TOOLS, with_shapes
+from .image_index import find_image_file
+from .label_io import read_yolo_seg
+
+MANIFEST_VERSION = 1
+AUGMENTERS = {'blur': BlurAugment, 'color_jitter': ColorJitterAugment, **GEOMETRIC_TOOLS}
+
+
+def make_augmenters(tools: dict) -> dict:
+    """按 TOOLS 字典（与 01_dataset_augment.py 相同格式）创建启用的增强器，返回 {工具名: 增强器}"""
+    augs = {}
+    for name, cfg in tools.items():
+        if not cfg.get('enabled', True):
+            continue
+        cls = AUGMENTERS.get(name)
+        if cls is None:
+            raise ValueError(f'unknown augmenter: {name} (expected one of {tuple(AUGMENTERS)})')
+        augs[name] = cls(cfg)
+    return augs
+
+
+def build_manifest(dataset_root='.', dataset_name='tomato', tools: dict | None = None) -> dict:
+    """在原始数据集上生成确定性的增强配方：相同的数据集与配置总是得到相同的 manifest，
+    新增图片不会改变已有图片的抽样与参数。"""
+    tools = {name: dict(cfg) for name, cfg in (tools or {}).items() if cfg.get('enabled', True)}
+    augs = make_augmenters(tools)
+    labels_dir = Path(dataset_root).resolve() / dataset_name / 'labels'
+    all_json_files = sorted(labels_dir.glob('*.json'))
+    recipes = []
+    for name, aug in augs.items():
+        json_files = select_samples_stable(all_json_files, aug.name, sample_ratio=aug.sample_ratio, sample_count=aug.sample_count, seed=aug.sample_seed)
+        for jpath, param in zip(json_files, aug.plan_params(json_files, stable=True)):
+            if param is None and name == 'color_jitter':
+                continue
+            recipes.append({'source': jpath.stem, 'tool': name, 'param': param, 'name': f'{aug.output_prefix(param)}_{jpath.stem}'})
+    # 按源文件排序：迭代时同一源文件的配方相邻，只解码一次
+    recipes.sort(key=lambda r: (r['source'], r['tool'], r['name']))
+    return {'version': MANIFEST_VERSION, 'dataset_root': str(dataset_root), 'dataset_name': dataset_name,
+            'tools': {name: {k: v for k, v in cfg.items() if k != 'enabled'} for name, cfg in tools.items()}, 'recipes': recipes}
+
+
+def save_manifest(manifest: dict, path):
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    tmp.replace(path)
+
+
+def load_manifest(path) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f'unsupported manifest version: {manifest.get("version")} (expected {MANIFEST_VERSION})')
+    return manifest
+
+
+class VirtualAugmentDataset:
+    """按 manifest 在读取时生成增强样本；include_sources=True 时前 N 个下标为原始样本（对应 export 时复制的原图）"""
+
+    def __init__(self, manifest: dict, dataset_root=None, include_sources: bool = False):
+        self.manifest = manifest
+        root = Path(dataset_root if dataset_root is not None else manifest['dataset_root']).resolve()
+        ds = root / manifest['dataset_name']
+        self.labels_dir = ds / 'labels'
+        self.img_dir = ds / 'images'
+        self.augs = make_augmenters(manifest['tools'])
+        self.recipes = list(manifest['recipes'])
+        self.sources = sorted(p.stem for p in self.labels_dir.glob('*.json')) if include_sources else []
+        self._last = None
+
+    @classmethod
+    def load(cls, path, dataset_root=None, include_sources: bool = False) -> 'VirtualAugmentDataset':
+        return cls(load_manifest(path), dataset_root, include_sources)
+
+    def __len__(self):
+        return len(self.sources) + len(self.recipes)
+
+    def __getitem__(self, i: int) -> dict:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        if i < len(self.sources):
+            stem = self.sources[i]
+            j, img_path, img = self._load_source(stem)
+            labels = self._read_txt(stem)
+            files = {'image': img_path.name, 'json': f'{stem}.json', 'txt': f'{stem}.txt' if labels is not None else None}
+            return {'name': stem, 'source': stem, 'tool': None, 'files': files, 'image': img.copy(),
+                    'json': _strip_imagedata(j, img_path.name), 'labels': labels}
+        return self.render(self.recipes[i - len(self.sources)])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _load_source(self, stem: str):
+        """读取源 JSON 与图片；保留最近一个源文件，相邻的同源配方不重复解码"""
+        if self._last is not None and self._last[0] == stem:
+            return self._last[1]
+        with open(self.labels_dir / f'{stem}.json', 'r', encoding='utf-8') as f:
+            j = json.load(f)
+        img_path = locate_image(j, stem, self.img_dir, lambda d, b: find_image_file(d, b, SUPPORTED_EXTS))
+        if img_path is None:
+            raise FileNotFoundError(f'image for {stem} not found in {self.img_dir}')
+        img = Image.open(img_path).convert('RGB')
+        self._last = (stem, (j, img_path, img))
+        return j, img_path, img
+
+    def _read_txt(self, stem: str):
+        txt = self.labels_dir / f'{stem}.txt'
+        return read_yolo_seg(txt, on_error='skip') if txt.exists() else None
+
+    def render(self, recipe: dict) -> dict:
+        """在内存中生成一条配方对应的样本（不写文件）"""
+        stem = recipe['source']
+        aug = self.augs[recipe['tool']]
+        param = recipe['param']
+        j, img_path, img = self._load_source(stem)
+        if hasattr(aug, 'render'):
+            # 几何增强：图片与标注一起变换
+            out, shapes, labels = aug.render(j, stem, img, self.labels_dir, param)
+            j = with_shapes(j, shapes, out.size)
+        else:
+            out = aug.apply_image(img, param)
+            labels = self._read_txt(stem)
+        files = export_names(aug, param, stem, img_path, labels is not None)
+        return {'name': recipe['name'], 'source': stem, 'tool': recipe['tool'], 'files': files, 'image': out,
+                'json': _strip_imagedata(j, files['image']), 'labels': labels}
+
+    def export(self, dataset_root='.', out_dir='augment', workers: int = 1):
+        """把全部配方写到 `<dataset_root>/<out_dir>/images|labels`，文件内容与 01_dataset_augment.py 的融合流水线相同。
+
+        只写增强结果；原始样本的复制仍由 tools/materialize.py 完成。
+        """
+        names = list(self.augs)
+        pipeline = FusedAugmentPipeline([self.augs[n] for n in names], workers=workers)
+        out_base = Path(dataset_root).resolve() / out_dir
+        out_img_dir = out_base / 'images'
+        out_labels_dir = out_base / 'labels'
+        out_img_dir.mkdir(parents=True, exist_ok=True)
+        out_labels_dir.mkdir(parents=True, exist_ok=True)
+
+        jobs = {}
+        for r in self.recipes:
+            jobs.setdefault(r['source'], []).append((names.index(r['tool']), r['param']))
+        tasks = [(self.labels_dir / f'{stem}.json', jobs[stem], self.img_dir, self.labels_dir, out_img_dir, out_labels_dir) for stem in sorted(jobs)]
+        written = 0
+        skipped = 0
+        results = iter_sample_results(pipeline, tasks, pipeline.workers)
+        iterator = tqdm(results, total=len(tasks), desc=f'Export (sources={len(tasks)}, workers={pipeline.workers})') if tqdm else results
+        for res in iterator:
+            for msg in res['messages']:
+                log_message(msg)
+            for _, status, _ in res.get('per_tool', []):
+                if status == 'skipped':
+                    skipped += 1
+                else:
+                    written += 1
+        log_message(f'Summary export: recipes={len(self.recipes)} written={written} skipped={skipped} saved_to={out_base}')
+
+
+def export_names(aug, param, stem: str, img_path: Path, has_txt: bool) -> dict:
+    """增强器 aug 的 augment_loaded 为源样本 stem（图片 img_path）写出的文件名，与其命名规则保持一致"""
+    prefix = aug.output_prefix(param)
+    if isinstance(aug, BlurAugment):
+        # 模糊增强的 TXT 沿用旧命名：<源文件名><suffix>.txt
+        txt = f'{stem}{aug.suffix}.txt'
+    else:
+        txt = f'{prefix}_{stem}.txt'
+    return {'image': f'{prefix}_{img_path.stem}{img_path.suffix or ".jpg"}', 'json': f'{prefix}_{stem}.json',
+            'txt': txt if has_txt else None}
+
+
+def _strip_imagedata(j: dict, image_name: str) -> dict:
+    j_new = dict(j)
+    j_new.pop('imageData', None)
+    if 'imagePath' in j_new:
+        j_new['imagePath'] = image_name
+    if 'imageFilename' in j_new:
+        j_new['imageFilename'] = image_name
+    return j_new
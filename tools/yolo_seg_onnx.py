@@ -0,0 +1,306 @@
+"""YOLOv8-seg ONNX Runtime 推理（纯 NumPy 前后处理，不依赖 torch / ultralytics）
+
+用于 `05_Export_ONNX.py` 导出的模型，适合只有 CPU 的边缘设备：启动时只加载 onnxruntime，
+单张图片的推理延迟也低于完整的 PyTorch 推理栈。
+
+流程与 ultralytics 的预测流程一致：
+1. 预处理：letterbox 缩放到 imgsz（灰边填充 114）、BGR -> RGB、HWC -> NCHW、/255
+2. 后处理：输出 output0 形状为 (B, 4 + nc + nm, N)，依次为 xywh、各类别分数、掩码系数；
+   置信度过滤 + 按类别 NMS，框映射回原图坐标
+3. 掩码：掩码系数 × 原型 (nm, mh, mw) -> sigmoid -> 去掉 letterbox 填充 -> 缩放到原图 -> 裁剪到框内 -> 阈值 0.5，
+   所有实例批量计算（见 tools/seg_masks.py），默认只在框内放大（mask_mode='box'）
+
+用法：
+    from tools.yolo_seg_onnx import YoloSegOnnx
+    model = YoloSegOnnx('best.onnx')
+    results = model.predict([img_bgr], conf=0.25)
+    annotated = results[0].plot()
+
+`compare_with_pt` 用同一批图片对比 ONNX 与 `.pt` 模型的检测结果（框 IoU、掩码 IoU），用于导出后的一致性检查，
+按 PARITY_CRITERIA 判定是否通过。
+"""
+import ast
+import numpy as np
+import cv2
+
+from .seg_masks import BoxMasks, assemble_masks
+
+# ultralytics 默认调色板，绘制结果与 ultralytics 的 results.plot() 颜色一致
+_PALETTE_HEX = ('FF3838', 'FF9D97', 'FF701F', 'FFB21D', 'CFD231', '48F90A', '92CC17', '3DDB86', '1A9334', '00D4BB',
+                '2C99A8', '00C2FF', '344593', '6473FF', '0018EC', '8438FF', '520085', 'CB38FF', 'FF95C8', 'FF37C7')
+PALETTE_BGR = [tuple(int(h[i:i + 2], 16) for i in (4, 2, 0)) for h in _PALETTE_HEX]
+
+MAX_WH = 7680  # 按类别 NMS 时的框偏移量（与 ultralytics 一致）
+
+# compare_with_pt 的通过条件：匹配率下限、匹配对中最差的框 IoU / 掩码 IoU 下限、最大分数差上限
+PARITY_CRITERIA = {'min_match_rate': 0.95, 'min_box_iou': 0.9, 'min_mask_iou': 0.8, 'max_score_diff': 0.05}
+
+
+def letterbox(img, imgsz=640, color=(114, 114, 114)):
+    """等比缩放并居中填充到 imgsz × imgsz，返回 (图片, 缩放比例, (左填充, 上填充))"""
+    h, w = img.shape[:2]
+    th, tw = (imgsz, imgsz) if isinstance(imgsz, int) else imgsz
+    r = min(th / h, tw / w)
+    new_w, new_h = int(round(w * r)), int(round(h * r))
+    dw, dh = (tw - new_w) / 2, (th - new_h) / 2
+    if (new_w, new_h) != (w, h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return img, r, (left, top)
+
+
+def preprocess(imgs, imgsz):
+    """BGR 图片列表 -> (NCHW float32 张量, [(缩放比例, 填充), ...])"""
+    batch, metas = [], []
+    for img in imgs:
+        lb, r, pad = letterbox(img, imgsz)
+        batch.append(lb[..., ::-1].transpose(2, 0, 1))
+        metas.append((r, pad))
+    x = np.ascontiguousarray(np.stack(batch)).astype(np.float32) / 255.0
+    return x, metas
+
+
+def xywh2xyxy(x):
+    y = np.empty_like(x)
+    xy, half = x[:, :2], x[:, 2:4] / 2
+    y[:, :2] = xy - half
+    y[:, 2:4] = xy + half
+    return y
+
+
+def nms(boxes, scores, iou_thres=0.45):
+    """贪心 NMS（xyxy），返回按分数降序保留的下标"""
+    order = scores.argsort()[::-1]
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-7)
+        order = rest[iou <= iou_thres]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def box_iou(a, b):
+    """两组 xyxy 框的 IoU 矩阵 (len(a), len(b))"""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:4], b[None, :, 2:4])
+    inter = np.clip(rb - lt, 0, None).prod(-1)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-7)
+
+
+def decode_predictions(pred, nm, conf=0.25, iou=0.45, max_det=300, max_nms=30000):
+    """单张图片的 output0 (4 + nc + nm, N) -> (xyxy, scores, classes, mask_coeffs)，坐标为 letterbox 输入坐标"""
+    pred = pred.T
+    nc = pred.shape[1] - 4 - nm
+    cls_scores = pred[:, 4:4 + nc]
+    classes = cls_scores.argmax(1)
+    scores = cls_scores[np.arange(len(pred)), classes]
+    keep = scores > conf
+    pred, scores, classes = pred[keep], scores[keep], classes[keep]
+    if len(pred) > max_nms:
+        top = scores.argsort()[::-1][:max_nms]
+        pred, scores, classes = pred[top], scores[top], classes[top]
+    boxes = xywh2xyxy(pred[:, :4])
+    # 按类别 NMS：不同类别的框加上不同偏移，互不抑制
+    idx = nms(boxes + classes[:, None] * MAX_WH, scores, iou)[:max_det]
+    return boxes[idx], scores[idx], classes[idx].astype(np.int64), pred[idx, 4 + nc:]
+
+
+def scale_boxes(boxes, ratio, pad, shape):
+    """letterbox 坐标 -> 原图坐标，并裁剪到图片范围"""
+    boxes = boxes.copy()
+    boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad[0]) / ratio
+    boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad[1]) / ratio
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, shape[1])
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, shape[0])
+    return boxes
+
+
+class SegResult:
+    """单张图片的推理结果（原图坐标）"""
+
+    def __init__(self, orig_img, boxes, scores, classes, masks, names):
+        self.orig_img = orig_img
+        self.boxes = boxes        # (n, 4) xyxy float32
+        self.scores = scores      # (n,)
+        self.classes = classes    # (n,) int64
+        self.masks = masks        # BoxMasks，或 mask_mode='full' 时为 (n, H, W) bool
+        self.names = names
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def plot(self, alpha=0.5, line_width=None):
+        """绘制掩码、框与标签（样式与 ultralytics 的 results.plot() 相同）"""
+        img = self.orig_img.copy()
+        h, w = img.shape[:2]
+        lw = line_width or max(round((h + w) / 2 * 0.003), 2)
+        if len(self):
+            colors = np.array([PALETTE_BGR[int(c) % len(PALETTE_BGR)] for c in self.classes], dtype=np.float32)
+            # 后绘制的实例覆盖先绘制的：按分数从低到高叠加
+            overlay = img.astype(np.float32)
+            for i in range(len(self) - 1, -1, -1):
+                if isinstance(self.masks, BoxMasks):
+                    # 只处理框内区域
+                    x1, y1, x2, y2 = self.masks.boxes[i]
+                    region, m = overlay[y1:y2, x1:x2], self.masks.crop(i)
+                else:
+                    region, m = overlay, self.masks[i]
+                region[m] = region[m] * (1 - alpha) + colors[i] * alpha
+            img = overlay.astype(np.uint8)
+        tf = max(lw - 1, 1)
+        for box, score, cls in zip(self.boxes, self.scores, self.classes):
+            color = PALETTE_BGR[int(cls) % len(PALETTE_BGR)]
+            p1, p2 = (int(box[0]), int(box[1])), (int(box[2]), int(box[3]))
+            cv2.rectangle(img, p1, p2, color, thickness=lw, lineType=cv2.LINE_AA)
+            label = f"{self.names.get(int(cls), int(cls))} {score:.2f}"
+            tw, th = cv2.getTextSize(label, 0, fontScale=lw / 3, thickness=tf)[0]
+            outside = p1[1] - th >= 3
+            p2t = (p1[0] + tw, p1[1] - th - 3 if outside else p1[1] + th + 3)
+            cv2.rectangle(img, p1, p2t, color, -1, cv2.LINE_AA)
+            cv2.putText(img, label, (p1[0], p1[1] - 2 if outside else p1[1] + th + 2), 0, lw / 3,
+                        (255, 255, 255), thickness=tf, lineType=cv2.LINE_AA)
+        return img
+
+
+class YoloSegOnnx:
+    def __init__(self, model_path, imgsz=None, providers=None, intra_op_threads=0, mask_mode='box'):
+        """
+        Args:
+            model_path: ultralytics 导出的 .onnx 模型
+            imgsz: 输入尺寸；None 时使用模型元数据中的 imgsz
+            providers: onnxruntime 执行提供者，默认 CPUExecutionProvider
+            intra_op_threads: onnxruntime 线程数，0 为默认
+            mask_mode: 'box' 只在框内放大掩码（BoxMasks，省内存）；'full' 为 (n, H, W) 整图掩码
+        """
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        if intra_op_threads:
+            opts.intra_op_num_threads = intra_op_threads
+        self.mask_mode = mask_mode
+        self.session = ort.InferenceSession(str(model_path), sess_options=opts,
+                                            providers=providers or ['CPUExecutionProvider'])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(meta['names']) if 'names' in meta else {}
+        if imgsz is None:
+            imgsz = ast.literal_eval(meta['imgsz']) if 'imgsz' in meta else inp.shape[2]
+        self.imgsz = tuple(imgsz) if isinstance(imgsz, (list, tuple)) else (int(imgsz), int(imgsz))
+        # 静态 batch（默认导出为 1）时逐张推理，动态 batch 时整批推理
+        self.static_batch = inp.shape[0] if isinstance(inp.shape[0], int) else None
+
+    def _run(self, x):
+        if self.static_batch is None or self.static_batch == len(x):
+            return self.session.run(None, {self.input_name: x})
+        outs = [self.session.run(None, {self.input_name: x[i:i + 1]}) for i in range(len(x))]
+        return [np.concatenate(o) for o in zip(*outs)]
+
+    def predict(self, imgs, imgsz=None, conf=0.25, iou=0.7, max_det=300, **kwargs):
+        """与 ultralytics 的 model.predict 用法一致（imgs 为 BGR 图片或图片列表），返回 SegResult 列表。
+
+        imgsz 需与导出尺寸一致（ONNX 输入尺寸固定），其余 ultralytics 参数（verbose、device 等）被忽略。
+        """
+        if isinstance(imgs, np.ndarray):
+            imgs = [imgs]
+        size = None if imgsz is None else (tuple(imgsz) if isinstance(imgsz, (list, tuple)) else (int(imgsz), int(imgsz)))
+        if size is not None and size != self.imgsz:
+            raise ValueError(f"imgsz={imgsz} 与 ONNX 模型输入尺寸 {self.imgsz} 不一致，请按该尺寸重新导出")
+        x, metas = preprocess(imgs, self.imgsz)
+        output0, protos = self._run(x)[:2]
+        results = []
+        for img, pred, proto, (ratio, pad) in zip(imgs, output0, protos, metas):
+            boxes, scores, classes, coeffs = decode_predictions(pred, proto.shape[0], conf, iou, max_det)
+            boxes = scale_boxes(boxes, ratio, pad, img.shape[:2])
+            masks = assemble_masks(proto, coeffs, boxes, ratio, pad, img.shape[:2], self.imgsz, self.mask_mode)
+            results.append(SegResult(img, boxes, scores, classes, masks, self.names))
+        return results
+
+
+def _pt_result_arrays(r):
+    """ultralytics Results -> (boxes, scores, classes, 原图尺寸掩码)"""
+    from ultralytics.utils import ops
+
+    boxes = r.boxes.xyxy.cpu().numpy()
+    scores = r.boxes.conf.cpu().numpy()
+    classes = r.boxes.cls.cpu().numpy().astype(np.int64)
+    h, w = r.orig_shape
+    if r.masks is None or len(boxes) == 0:
+        return boxes, scores, classes, np.zeros((0, h, w), dtype=bool)
+    m = r.masks.data.cpu().numpy().transpose(1, 2, 0)
+    m = ops.scale_image(m, (h, w)).reshape(h, w, -1)
+    return boxes, scores, classes, m.transpose(2, 0, 1) > 0.5
+
+
+def compare_with_pt(pt_path, onnx_path, images, imgsz=416, conf=0.25, iou=0.7, match_iou=0.5, criteria=None):
+    """ONNX 与 `.pt` 模型的一致性检查。
+
+    对每张图片按分数从高到低、同类别内贪心匹配两边的检测结果：每个 `.pt` 检测取框 IoU 最高且尚未被占用的
+    ONNX 检测（最佳候选已被占用时退到次优，直到 IoU 低于 match_iou）。统计匹配率、框 IoU、掩码 IoU 与
+    最大分数差，按 criteria（默认 PARITY_CRITERIA，可只覆盖部分键）判定；返回汇总 dict 并打印，
+    `passed` 为是否通过，`failures` 列出未满足的条件。images 为 BGR 图片列表。
+    """
+    from ultralytics import YOLO
+
+    criteria = {**PARITY_CRITERIA, **(criteria or {})}
+    pt_model = YOLO(pt_path)
+    onnx_model = YoloSegOnnx(onnx_path, imgsz=imgsz)
+    n_pt = n_onnx = matched = 0
+    box_ious, mask_ious, score_diffs = [], [], []
+    for img in images:
+        pb, ps, pc, pm = _pt_result_arrays(pt_model.predict(img, imgsz=imgsz, conf=conf, iou=iou, verbose=False)[0])
+        o = onnx_model.predict(img, conf=conf, iou=iou)[0]
+        n_pt += len(pb)
+        n_onnx += len(o)
+        if not len(pb) or not len(o):
+            continue
+        ious = box_iou(pb, o.boxes)
+        ious[pc[:, None] != o.classes[None, :]] = 0
+        for i in np.argsort(-ps):
+            j = int(ious[i].argmax())
+            if ious[i, j] < match_iou:
+                continue
+            matched += 1
+            box_ious.append(float(ious[i, j]))
+            # 已匹配的 ONNX 检测不再参与后续匹配
+            ious[:, j] = -1
+            inter = np.logical_and(pm[i], o.masks[j]).sum()
+            union = np.logical_or(pm[i], o.masks[j]).sum()
+            mask_ious.append(float(inter / union) if union else 1.0)
+            score_diffs.append(abs(float(ps[i]) - float(o.scores[j])))
+    report = {
+        'images': len(images),
+        'pt_detections': n_pt,
+        'onnx_detections': n_onnx,
+        'matched': matched,
+        'match_rate': matched / max(n_pt, n_onnx) if max(n_pt, n_onnx) else 1.0,
+        'mean_box_iou': float(np.mean(box_ious)) if box_ious else 0.0,
+        'min_box_iou': float(np.min(box_ious)) if box_ious else 1.0,
+        'mean_mask_iou': float(np.mean(mask_ious)) if mask_ious else 0.0,
+        'min_mask_iou': float(np.min(mask_ious)) if mask_ious else 1.0,
+        'max_score_diff': float(np.max(score_diffs)) if score_diffs else 0.0,
+    }
+    limits = (('match_rate', criteria['min_match_rate'], '<'), ('min_box_iou', criteria['min_box_iou'], '<'),
+              ('min_mask_iou', criteria['min_mask_iou'], '<'), ('max_score_diff', criteria['max_score_diff'], '>'))
+    failures = [f'{key}={report[key]:.4f} {op} {limit}' for key, limit, op in limits
+                if (report[key] < limit if op == '<' else report[key] > limit)]
+    report['criteria'] = criteria
+    report['failures'] = failures
+    report['passed'] = not failures
+    print(f"一致性检查: {report['images']} 张图片, pt={n_pt} onnx={n_onnx} 匹配={matched} "
+          f"({report['match_rate']:.1%}), 框 IoU 平均/最小={report['mean_box_iou']:.4f}/{report['min_box_iou']:.4f}, "
+          f"掩码 IoU 平均/最小={report['mean_mask_iou']:.4f}/{report['min_mask_iou']:.4f}, "
+          f"最大分数差={report['max_score_diff']:.4f}")
+    print('一致性检查通过' if report['passed'] else f"一致性检查未通过: {'; '.join(failures)}")
+    return report